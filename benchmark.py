@@ -0,0 +1,418 @@
+"""
+Time the cleaning, reply tree and sentiment analysis stages.
+
+Each benchmark runs over the bundled data files and over synthetic comment
+forests of increasing size, and the results are written as JSON so runs can
+be compared to find regressions. For example:
+
+    $ python benchmark.py --sizes 1000,10000,100000,1000000 \\
+        --output results.json --compare baseline.json
+"""
+import argparse
+from contextlib import contextmanager
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import data_cleaning
+import sentiment_analysis
+from comment_forest import CommentForest
+import storage
+import synthetic_data
+import token_store
+
+BUNDLED_SUBREDDITS = ['AmItheAsshole', 'politics', 'MadeMeSmile', 'AskReddit',
+                      'TalesFromRetail']
+
+# Benchmarks that clean or score comment text one comment at a time. They are
+# skipped for synthetic forests larger than max_text_comments. The subreddit
+# analyses read a cleaned data file without a sentiment column, so they score
+# every comment as well.
+TEXT_BENCHMARKS = ['clean_comment', 'store_tokenized_data',
+                   'analyze_sentiment', 'analyze_sentiments',
+                   'score_token_ids', 'analyze_subreddit_by_depth',
+                   'analyze_subreddit_distribution']
+# Benchmarks that only build and walk reply trees. The _stored analyses read
+# a cleaned data file with a sentiment column, as written by
+# data_cleaning.store_tokenized_data, so no comment is scored.
+TREE_BENCHMARKS = ['create_reply_dict', 'analyze_subreddit_by_depth_stored',
+                   'analyze_subreddit_distribution_stored']
+BENCHMARKS = TEXT_BENCHMARKS + TREE_BENCHMARKS
+
+
+@contextmanager
+def data_directories(directory):
+    """
+    Point the rawdata and cleaneddata directories at a scratch directory.
+
+    Args:
+        directory: String representing the scratch directory.
+    """
+    saved = storage.RAW_DIRECTORY, storage.CLEANED_DIRECTORY
+    storage.RAW_DIRECTORY = os.path.join(directory, 'raw_')
+    storage.CLEANED_DIRECTORY = os.path.join(directory, 'cleaned_')
+    try:
+        yield
+    finally:
+        storage.RAW_DIRECTORY, storage.CLEANED_DIRECTORY = saved
+
+
+def time_call(function, repeat, setup=None):
+    """
+    Time a function, keeping the fastest and median of several runs.
+
+    Args:
+        function: Function taking no arguments to time.
+        repeat: Integer representing the number of runs.
+        setup: Optional function called before each run, outside the timing.
+
+    Returns:
+        A tuple of floats with the fastest and median run time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def _clear_caches():
+    """
+    Forget loaded threads and scored sentences, so analysis is timed from
+    the data file with a cold polarity cache.
+    """
+    sentiment_analysis.clear_thread_cache()
+    sentiment_analysis.get_polarity_cache().clear()
+
+
+def reply_dicts(comment_df):
+    """
+    Build a thread's reply tree and organize every top level comment's
+    replies by depth.
+
+    Args:
+        comment_df: DataFrame containing comment_id and comment_parent_id
+            data.
+
+    Returns:
+        A list of dictionaries returned by create_reply_dict.
+    """
+    forest = CommentForest.from_dataframe(comment_df)
+    return [sentiment_analysis.create_reply_dict(forest, comment)
+            for comment in forest.top_level_comments()]
+
+
+def benchmark_dataset(name, comment_df, benchmarks, repeat, fmt=None):
+    """
+    Run benchmarks over one dataset.
+
+    The dataset is written to a scratch directory as a subreddit called
+    name, so the file-based entry points read and write their usual files.
+    Its cleaned data file has no sentiment column; the file read by the
+    _stored benchmarks, saved as name + '_stored', has one.
+
+    Args:
+        name: String representing the name of the dataset.
+        comment_df: DataFrame with the columns of a cleaned data file. Its
+            sentiment column, if any, is only used by the _stored
+            benchmarks, and is scored outside the timing if missing.
+        benchmarks: List of strings representing the benchmarks to run.
+        repeat: Integer representing the number of runs of each benchmark.
+        fmt: Optional string representing the storage format of the files.
+
+    Returns:
+        A dictionary mapping each benchmark run to a tuple of its fastest
+        and median time in seconds.
+    """
+    bodies = comment_df['comment_body'].fillna('').tolist()
+    tokenized = comment_df['tokenized_comment'].fillna('').tolist()
+    corpus = token_store.TokenizedCorpus.from_comments(tokenized) \
+        if 'score_token_ids' in benchmarks else None
+    raw_columns = ['comment_id', 'comment_parent_id', 'comment_body',
+                   'comment_link_id']
+    cases = {
+        'clean_comment': lambda: [data_cleaning.clean_comment(body)
+                                  for body in bodies],
+        'store_tokenized_data': lambda: data_cleaning.store_tokenized_data(
+            [name], incremental=False, fmt=fmt),
+        'analyze_sentiment': lambda: [sentiment_analysis.analyze_sentiment(
+            sentiment_analysis.split_tokenized_comment(comment))
+            for comment in tokenized],
+        'analyze_sentiments': lambda: sentiment_analysis.analyze_sentiments(
+            tokenized),
+        'score_token_ids': lambda: sentiment_analysis.analyze_sentiments(
+            corpus),
+        'create_reply_dict': lambda: reply_dicts(comment_df),
+        'analyze_subreddit_by_depth': lambda:
+            sentiment_analysis.analyze_subreddit_by_depth(name),
+        'analyze_subreddit_distribution': lambda:
+            sentiment_analysis.analyze_subreddit_distribution(name),
+        'analyze_subreddit_by_depth_stored': lambda:
+            sentiment_analysis.analyze_subreddit_by_depth(name + '_stored'),
+        'analyze_subreddit_distribution_stored': lambda:
+            sentiment_analysis.analyze_subreddit_distribution(
+                name + '_stored')
+    }
+    # Load the models once, so that loading them is not timed.
+    data_cleaning.clean_comment('Loading models.')
+    sentiment_analysis.get_analyzer()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, \
+            data_directories(directory):
+        storage.save_raw(comment_df[raw_columns], name, fmt)
+        storage.save_cleaned(comment_df.drop(columns='sentiment',
+                                             errors='ignore'), name, fmt)
+        if any(benchmark.endswith('_stored') for benchmark in benchmarks):
+            if 'sentiment' not in comment_df.columns:
+                comment_df = comment_df.assign(
+                    sentiment=sentiment_analysis.analyze_sentiments(
+                        tokenized))
+            storage.save_cleaned(comment_df, name + '_stored', fmt)
+        for benchmark in benchmarks:
+            if benchmark == 'store_tokenized_data':
+                # Put the analysis file back once cleaning has replaced it.
+                cleaned = storage.load_cleaned(name)
+                results[benchmark] = time_call(cases[benchmark], repeat)
+                storage.save_cleaned(cleaned, name, fmt)
+            else:
+                results[benchmark] = time_call(cases[benchmark], repeat,
+                                               _clear_caches)
+    _clear_caches()
+    return results
+
+
+def scaling_exponent(sizes, seconds):
+    """
+    Estimate how run time grows with size from a log-log least squares fit.
+
+    Args:
+        sizes: List of integers representing dataset sizes.
+        seconds: List of floats representing the run time at each size.
+
+    Returns:
+        A float k such that run time grows roughly as size ** k, or None if
+        there are fewer than two sizes.
+    """
+    if len(sizes) < 2:
+        return None
+    slope, _ = np.polyfit(np.log(sizes), np.log(np.maximum(seconds, 1e-9)),
+                          1)
+    return float(slope)
+
+
+def _git_commit():
+    """
+    Find the commit the benchmarks were run at.
+
+    Returns:
+        A string representing the commit hash, or None outside a git
+        checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, subreddits=None, benchmarks=None, repeat=3,
+                   max_text_comments=100000, seed=0, fmt=None,
+                   **forest_options):
+    """
+    Run the benchmark suite.
+
+    Args:
+        sizes: List of integers representing the sizes of synthetic forests
+            to benchmark.
+        subreddits: Optional list of strings representing bundled
+            subreddits to benchmark. Defaults to BUNDLED_SUBREDDITS.
+        benchmarks: Optional list of strings representing the benchmarks to
+            run. Defaults to BENCHMARKS.
+        repeat: Integer representing the number of runs of each benchmark.
+        max_text_comments: Integer representing the largest synthetic
+            forest to run TEXT_BENCHMARKS on.
+        seed: Integer seeding the synthetic forests.
+        fmt: Optional string representing the storage format to benchmark.
+        **forest_options: Keyword arguments of
+            synthetic_data.iter_synthetic_comments shaping the synthetic
+            forests, such as max_depth, branching, fanout_skew and words.
+
+    Returns:
+        A JSON serializable dictionary with the metadata of the run, a list
+        of results, and the scaling exponent of each benchmark over the
+        synthetic sizes.
+    """
+    subreddits = BUNDLED_SUBREDDITS if subreddits is None else subreddits
+    benchmarks = BENCHMARKS if benchmarks is None else benchmarks
+    results = []
+
+    def record(dataset, size, timings):
+        for benchmark, (fastest, median) in timings.items():
+            results.append({'benchmark': benchmark, 'dataset': dataset,
+                            'comments': size, 'seconds': fastest,
+                            'median_seconds': median, 'repeat': repeat,
+                            'comments_per_second': size / fastest
+                            if fastest else None})
+
+    for subreddit in subreddits:
+        bundled = pd.concat([storage.load_raw(subreddit),
+                             storage.load_cleaned(subreddit)[
+                                 ['tokenized_comment']]], axis=1)
+        record(subreddit, len(bundled),
+               benchmark_dataset(subreddit, bundled, benchmarks, repeat, fmt))
+
+    for size in sizes:
+        synthetic = synthetic_data.synthetic_comments(
+            size, cleaned=True, seed=seed, **forest_options)
+        record('synthetic', size, benchmark_dataset(
+            'synthetic', synthetic,
+            [benchmark for benchmark in benchmarks
+             if benchmark in TREE_BENCHMARKS or size <= max_text_comments],
+            repeat, fmt))
+
+    scaling = {}
+    for benchmark in benchmarks:
+        runs = [result for result in results if result['dataset'] ==
+                'synthetic' and result['benchmark'] == benchmark]
+        scaling[benchmark] = scaling_exponent(
+            [run['comments'] for run in runs],
+            [run['seconds'] for run in runs])
+
+    return {
+        'metadata': {
+            'commit': _git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'format': fmt or storage.DEFAULT_FORMAT,
+            'synthetic': dict(forest_options, seed=seed)},
+        'results': results,
+        'scaling': scaling}
+
+
+def compare(report, baseline, threshold=1.25):
+    """
+    Find benchmarks that got slower than in an earlier report.
+
+    Args:
+        report: Dictionary returned by run_benchmarks.
+        baseline: Dictionary returned by an earlier run_benchmarks.
+        threshold: Float representing the slowdown, as a ratio of run
+            times, that counts as a regression.
+
+    Returns:
+        A list of (benchmark, dataset, comments, ratio) tuples for every
+        result present in both reports, slowest first, and a list of those
+        whose ratio is above threshold.
+    """
+    earlier = {(result['benchmark'], result['dataset'], result['comments']):
+               result['seconds'] for result in baseline['results']}
+    ratios = []
+    for result in report['results']:
+        key = (result['benchmark'], result['dataset'], result['comments'])
+        if earlier.get(key):
+            ratios.append(key + (result['seconds'] / earlier[key],))
+    ratios.sort(key=lambda ratio: ratio[-1], reverse=True)
+    return ratios, [ratio for ratio in ratios if ratio[-1] > threshold]
+
+
+def format_report(report):
+    """
+    Lay out a report as a table of run times by dataset size.
+
+    Args:
+        report: Dictionary returned by run_benchmarks.
+
+    Returns:
+        A string with one row per benchmark and dataset and one column per
+        size, followed by the scaling exponent of each benchmark.
+    """
+    table = pd.DataFrame(report['results']).pivot_table(
+        index=['benchmark', 'dataset'], columns='comments', values='seconds')
+    lines = ['Fastest run time (seconds) by number of comments',
+             table.to_string(float_format=lambda seconds: f'{seconds:.4f}'),
+             '', 'Scaling exponent (run time ~ comments ** k)']
+    for benchmark, exponent in report['scaling'].items():
+        if exponent is not None and not math.isnan(exponent):
+            lines.append(f'  {benchmark}: {exponent:.2f}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line.
+
+    Args:
+        argv: Optional list of strings representing command line arguments.
+
+    Returns:
+        An integer exit status, 1 if a regression was found when comparing.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                        help='comma separated synthetic forest sizes')
+    parser.add_argument('--subreddits', default=','.join(BUNDLED_SUBREDDITS),
+                        help='comma separated bundled subreddits, or none')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help='comma separated benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-text-comments', type=int, default=100000,
+                        help='largest synthetic forest to clean and score')
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--branching', type=float, default=2.0)
+    parser.add_argument('--depth-decay', type=float, default=1.0)
+    parser.add_argument('--fanout-skew', type=float, default=0.0)
+    parser.add_argument('--words', type=float, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=sorted(storage.FORMATS))
+    parser.add_argument('--output', help='path to write the JSON report to')
+    parser.add_argument('--compare', help='path of a JSON report to compare '
+                        'against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    def split(value):
+        return [] if value in ('', 'none') else value.split(',')
+
+    report = run_benchmarks(
+        [int(size) for size in split(args.sizes)], split(args.subreddits),
+        split(args.benchmarks), args.repeat, args.max_text_comments,
+        args.seed, args.format, max_depth=args.depth,
+        branching=args.branching, depth_decay=args.depth_decay,
+        fanout_skew=args.fanout_skew, words=args.words)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            ratios, regressions = compare(report, json.load(baseline_file),
+                                          args.threshold)
+        print('\nRun time relative to ' + args.compare)
+        for benchmark, dataset, comments, ratio in ratios:
+            print(f'  {benchmark} {dataset} {comments}: {ratio:.2f}x')
+        if regressions:
+            print(f'{len(regressions)} benchmarks slower than '
+                  f'{args.threshold}x')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
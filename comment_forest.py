@@ -0,0 +1,238 @@
+"""
+Index the reply structure of a comment thread.
+"""
+from collections import defaultdict, deque
+import numpy as np
+import pandas as pd
+
+# Reddit fullname prefixes for comments (t1_) and submissions (t3_).
+FULLNAME_PREFIXES = ('t1_', 't3_')
+
+
+def strip_fullname(reddit_id):
+    """
+    Remove the type prefix from a Reddit fullname.
+
+    Args:
+        reddit_id: String representing a Reddit id, with or without a
+            t1_/t3_ prefix.
+
+    Returns:
+        A string containing the bare id.
+    """
+    reddit_id = str(reddit_id)
+    if reddit_id[:3] in FULLNAME_PREFIXES:
+        return reddit_id[3:]
+    return reddit_id
+
+
+class CommentForest:
+    """
+    Parent to child adjacency and depth of every comment in a thread.
+
+    The forest is built once, in a single pass over the comment_id and
+    comment_parent_id columns, so that looking up the replies to a comment
+    is a dictionary access rather than a scan of the whole DataFrame.
+
+    Attributes:
+        comment_ids: List of strings containing the comment_id of every
+            comment, in DataFrame order.
+        parent_ids: List of strings containing the bare parent id of every
+            comment, in DataFrame order.
+        children: Dictionary mapping a bare parent id (a comment or the
+            submission) to the list of comment_ids replying to it, in
+            DataFrame order.
+        depths: Dictionary mapping each comment_id to its depth, with
+            comments that reply directly to the submission at depth 0.
+        roots: Dictionary mapping each comment_id to the comment_id of the
+            top level comment whose thread it belongs to.
+        index: pandas Index hashing each comment_id to the row position of
+            its first occurrence.
+    """
+
+    def __init__(self, comment_ids, parent_ids):
+        """
+        Build the forest from parallel sequences of ids.
+
+        Args:
+            comment_ids: Iterable of strings representing comment ids.
+            parent_ids: Iterable of strings representing the parent of each
+                comment, with or without t1_/t3_ prefixes.
+        """
+        self.comment_ids = [str(comment_id) for comment_id in comment_ids]
+        parent_ids = [str(parent_id) for parent_id in parent_ids]
+        self.parent_ids = [strip_fullname(parent_id) for parent_id in
+                           parent_ids]
+        # Replies to any submission, which may be several posts when a file
+        # holds the comments of more than one.
+        self._post_replies = [comment_id for comment_id, parent_id in
+                              zip(self.comment_ids, parent_ids)
+                              if parent_id.startswith('t3_')]
+
+        children = defaultdict(list)
+        for comment_id, parent_id in zip(self.comment_ids, self.parent_ids):
+            children[parent_id].append(comment_id)
+        self.children = dict(children)
+
+        self.depths, self.roots = self._compute_depths()
+
+        index = pd.Index(self.comment_ids)
+        first = ~index.duplicated()
+        self.index = index[first]
+        self._index_positions = np.flatnonzero(first)
+
+    @classmethod
+    def from_dataframe(cls, comment_df):
+        """
+        Build a forest from a DataFrame of comments.
+
+        Args:
+            comment_df: DataFrame containing, at minimum, comment_id and
+                comment_parent_id data.
+
+        Returns:
+            A CommentForest for the comments in comment_df.
+        """
+        return cls(comment_df['comment_id'], comment_df['comment_parent_id'])
+
+    def _compute_depths(self):
+        """
+        Assign a depth and root to every comment with a breadth-first sweep.
+
+        Comments whose parent is not itself a comment in the forest (top
+        level comments, or replies to comments that were not scraped) are
+        treated as roots at depth 0.
+
+        Returns:
+            A tuple of two dictionaries mapping each comment_id to its
+            integer depth and to the comment_id of its root.
+        """
+        known = set(self.comment_ids)
+        depths = {}
+        roots = {}
+        queue = deque()
+        for comment_id, parent_id in zip(self.comment_ids, self.parent_ids):
+            if parent_id not in known:
+                depths[comment_id] = 0
+                roots[comment_id] = comment_id
+                queue.append(comment_id)
+        while queue:
+            comment_id = queue.popleft()
+            for reply_id in self.children.get(comment_id, []):
+                if reply_id not in depths:
+                    depths[reply_id] = depths[comment_id] + 1
+                    roots[reply_id] = roots[comment_id]
+                    queue.append(reply_id)
+        return depths, roots
+
+    def __len__(self):
+        return len(self.comment_ids)
+
+    def __contains__(self, comment_id):
+        return comment_id in self.depths
+
+    def positions(self, comment_ids):
+        """
+        Look up the row positions of many comments at once.
+
+        Args:
+            comment_ids: Iterable of strings representing comment ids.
+
+        Returns:
+            A NumPy array of integers with the row position of each comment,
+            or -1 for ids that are not in the forest.
+        """
+        found = self.index.get_indexer(pd.Index(comment_ids, dtype=object))
+        positions = np.full(len(found), -1)
+        positions[found >= 0] = self._index_positions[found[found >= 0]]
+        return positions
+
+    def thread_labels(self):
+        """
+        Label every comment with its thread and depth.
+
+        Returns:
+            A DataFrame with one row per comment, in DataFrame order, with
+            columns comment_id, root (the comment_id of its top level
+            ancestor) and depth. Comments that could not be reached from a
+            root are left out.
+        """
+        labelled = [comment_id in self.depths for comment_id in
+                    self.comment_ids]
+        comment_ids = [comment_id for comment_id, is_labelled in
+                       zip(self.comment_ids, labelled) if is_labelled]
+        return pd.DataFrame({
+            'comment_id': comment_ids,
+            'root': [self.roots[comment_id] for comment_id in comment_ids],
+            'depth': np.array([self.depths[comment_id] for comment_id in
+                               comment_ids], dtype=int)})
+
+    def replies(self, comment_id):
+        """
+        Find the direct replies to a comment or submission.
+
+        Args:
+            comment_id: String representing the id of the parent, with or
+                without a t1_/t3_ prefix.
+
+        Returns:
+            List of strings containing comment_id values for child replies.
+        """
+        return list(self.children.get(strip_fullname(comment_id), []))
+
+    def levels(self, comment_id):
+        """
+        Sweep the replies below a comment one depth at a time.
+
+        Each level is built from the one before it, without recursion, so
+        reply chains of any length can be walked and only the current level
+        is held in memory.
+
+        Args:
+            comment_id: String representing the id of the comment (or
+                submission) to start from, with or without a t1_/t3_ prefix.
+
+        Yields:
+            Lists of strings containing the comment_id of every reply at
+            each successive depth below comment_id, in DataFrame order
+            within each parent. Stops at the first empty level.
+        """
+        frontier = self.replies(comment_id)
+        while frontier:
+            yield frontier
+            frontier = [reply_id for parent_id in frontier
+                        for reply_id in self.children.get(parent_id, [])]
+
+    def root_comments(self):
+        """
+        Find the comment at the root of every thread in the forest.
+
+        These are the top level comments and replies to comments that were
+        not scraped, the same roots that thread_labels assigns.
+
+        Returns:
+            List of strings containing the comment_id of each root, in
+            DataFrame order.
+        """
+        return list(dict.fromkeys(
+            comment_id for comment_id in self.comment_ids
+            if self.roots.get(comment_id) == comment_id))
+
+    def top_level_comments(self):
+        """
+        Find the comments that reply directly to a submission.
+
+        Comments whose parent is a t3_ fullname reply to a submission, so
+        the top level comments of every post in the forest are found. If no
+        parent has a prefix, comments are assumed to be in order by depth,
+        so the parent of the first comment is the original post.
+
+        Returns:
+            List of strings containing the comment_id of each top level
+            comment, in DataFrame order.
+        """
+        if self._post_replies:
+            return list(self._post_replies)
+        if not self.parent_ids:
+            return []
+        return self.replies(self.parent_ids[0])
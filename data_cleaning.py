@@ -1,13 +1,109 @@
 """
 Pre-process data for sentiment analysis.
 """
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+import hashlib
+import os.path
+import time
 import emoji
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import RegexpTokenizer, sent_tokenize
+import numpy as np
 import pandas as pd
-import nltk
-nltk.download('wordnet')
-nltk.download('punkt')
+import nltk_resources
+from sentiment_analysis import analyze_sentiments
+import storage
+import token_store
+
+
+class CommentCleaner:
+    """
+    Prepares (cleans, tokenizes, lemmatizes) comments for sentiment analysis.
+
+    The emoji pattern, word tokenizer and lemmatizer are created once and
+    reused for every comment. Lemmas are memoized in a bounded LRU cache
+    keyed by lowercase word, since most words in a thread repeat.
+
+    Attributes:
+        emoji_pattern: Compiled regular expression matching emojis.
+        tokenizer: RegexpTokenizer splitting a sentence into words, numbers
+            with dollar signs, and links.
+        lemmatizer: WordNetLemmatizer used for uncached words.
+        lemmatize_word: Function returning the lemma of a lowercase word,
+            memoized with functools.lru_cache.
+    """
+
+    def __init__(self, cache_size=65536):
+        """
+        Create the patterns and models used to clean comments.
+
+        Args:
+            cache_size: Integer representing the maximum number of lemmas to
+                keep in the LRU cache.
+        """
+        nltk_resources.ensure('wordnet')
+        nltk_resources.ensure(nltk_resources.SENTENCE_TOKENIZER)
+        self.emoji_pattern = emoji.get_emoji_regexp()
+        self.tokenizer = RegexpTokenizer(r'\w+|\$[\d\.]+|http\S+')
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemmatize_word = lru_cache(maxsize=cache_size)(
+            self.lemmatizer.lemmatize)
+
+    def clean_comment(self, comment):
+        """
+        Prepares (cleans, tokenizes, lemmatizes) a comment for sentiment
+        analysis.
+
+        Args:
+            comment: String containing text of comment.
+
+        Returns:
+            lemmatized_tokens: A string containing the prepared text of
+            comment with sentences separated by backslashes.
+        """
+        # Remove emojis from comment
+        comment = self.emoji_pattern.sub(u'', comment)
+        # Tokenize comment (split into list of words) and remove links
+        tokenized_comment = sent_tokenize(comment)
+
+        lemmatized_comment = [self.lemmatize_sentence(sentence) for sentence
+                              in tokenized_comment]
+
+        return '\\'.join(lemmatized_comment)
+
+    def lemmatize_sentence(self, sentence):
+        """
+        Lemmatizes a sentence.
+
+        Args:
+            sentence: A string representing a tokenized sentence.
+
+        Returns:
+            A lemmatized sentence.
+        """
+        words = self.tokenizer.tokenize(sentence)
+        # Make all words lowercase and lemmatize them to change them to the
+        # stem words
+        return ' '.join(self.lemmatize_word(word.lower()) for word in words)
+
+
+# Shared CommentCleaner, created on first use by get_cleaner()
+_CLEANER = None
+
+
+def get_cleaner():
+    """
+    Return the shared CommentCleaner, creating it on first use.
+
+    Returns:
+        A CommentCleaner.
+    """
+    global _CLEANER
+    if _CLEANER is None:
+        _CLEANER = CommentCleaner()
+    return _CLEANER
 
 
 def clean_comment(comment):
@@ -21,15 +117,7 @@ def clean_comment(comment):
         lemmatized_tokens: A string containing the prepared text of comment
         with sentences separated by backslashes.
     """
-    # Remove emojis from comment
-    comment = emoji.get_emoji_regexp().sub(u'', comment)
-    # Tokenize comment (split into list of words) and remove links
-    tokenized_comment = sent_tokenize(comment)
-
-    lemmatized_comment = [lemmatize_sentence(comment) for comment in
-                          tokenized_comment]
-
-    return '\\'.join(lemmatized_comment)
+    return get_cleaner().clean_comment(comment)
 
 
 def lemmatize_sentence(sentence):
@@ -42,32 +130,367 @@ def lemmatize_sentence(sentence):
     Returns:
         A lemmatized sentence.
     """
-    tokenizer = RegexpTokenizer(r'\w+|\$[\d\.]+|http\S+')
-    words = tokenizer.tokenize(sentence)
-    # Make all words lowercase
-    words = [word.lower() for word in words]
-    # Lemmatize word to change them to the stem words
-    lemmatizer = WordNetLemmatizer()
-    lemmatized_tokens = [lemmatizer.lemmatize(word)
-                         for word in words]
-    return ' '.join(lemmatized_tokens)
+    return get_cleaner().lemmatize_sentence(sentence)
+
+
+def add_sentiment_column(subreddit_df):
+    """
+    Score every cleaned comment once and store the result with the comments.
+
+    Args:
+        subreddit_df: DataFrame containing a tokenized_comment column.
+
+    Returns:
+        The same DataFrame with a 'sentiment' column holding the average
+        compound polarity score of each comment.
+    """
+    subreddit_df['sentiment'] = \
+        analyze_sentiments(subreddit_df['tokenized_comment'])
+    return subreddit_df
+
+
+def store_sentiment_scores(subreddit_list):
+    """
+    Add a sentiment column to existing cleaned data files.
+
+    Use this to score files that were cleaned before sentiment scores were
+    stored alongside the cleaned comments.
+
+    Args:
+        subreddit_list: List of strings representing subreddits to score
+        data for
+    """
+    for subreddit in subreddit_list:
+        path = storage.cleaned_path(subreddit)
+        subreddit_df = storage.read_comments(path)
+        storage.write_comments(add_sentiment_column(subreddit_df), path)
+
+
+def _init_cleaning_worker():
+    """
+    Load the sentence tokenizer and lemmatizer models in a worker process.
+
+    Runs once when each worker of the cleaning pool starts, so that the
+    models are not loaded again for every chunk.
+    """
+    clean_comment('Loading models. Loaded models.')
+
+
+def _clean_chunk(comments):
+    """
+    Clean a chunk of comments in a worker process.
+
+    Args:
+        comments: List of strings containing the text of comments.
+
+    Returns:
+        A list of strings containing the prepared text of each comment.
+    """
+    cleaner = get_cleaner()
+    return [cleaner.clean_comment(comment) for comment in comments]
+
+
+def _submit_chunks(pool, comments, chunksize):
+    """
+    Split comments into chunks and submit each one to a process pool.
+
+    Args:
+        pool: A ProcessPoolExecutor to clean the chunks in.
+        comments: List of strings containing the text of comments.
+        chunksize: Integer representing the number of comments per chunk.
+
+    Returns:
+        A list of futures, one per chunk, in the order of comments.
+    """
+    return [pool.submit(_clean_chunk, comments[start:start + chunksize])
+            for start in range(0, len(comments), chunksize)]
+
+
+def _collect_chunks(futures):
+    """
+    Gather cleaned chunks back into a single list.
+
+    Args:
+        futures: List of futures returned by _submit_chunks.
+
+    Returns:
+        A list of strings containing the prepared text of each comment, in
+        the original order.
+    """
+    return [comment for future in futures for comment in future.result()]
+
+
+def clean_comments(comments, workers=1, chunksize=1000):
+    """
+    Prepare many comments for sentiment analysis, optionally in parallel.
+
+    Args:
+        comments: Iterable of strings containing the text of comments.
+        workers: Integer representing the number of worker processes to
+            clean with. 1 cleans in the current process.
+        chunksize: Integer representing the number of comments sent to a
+            worker at a time.
+
+    Returns:
+        A list of strings containing the prepared text of each comment, in
+        the same order as comments.
+    """
+    comments = list(comments)
+    if workers <= 1:
+        return _clean_chunk(comments)
+    with ProcessPoolExecutor(workers,
+                             initializer=_init_cleaning_worker) as pool:
+        return _collect_chunks(_submit_chunks(pool, comments, chunksize))
+
+
+def hash_comment_bodies(comment_bodies):
+    """
+    Fingerprint the text of comments to detect edits between scrapes.
+
+    Args:
+        comment_bodies: Iterable of strings containing the text of comments.
+
+    Returns:
+        A list of strings containing a hexadecimal content hash for each
+        comment.
+    """
+    return [hashlib.blake2b(str(body).encode('utf-8'),
+                            digest_size=16).hexdigest()
+            for body in comment_bodies]
+
+
+def reuse_cleaned_comments(subreddit_df, cleaned_path):
+    """
+    Fill in the cleaned text and score of comments that were already cleaned.
+
+    A comment is reused when the existing cleaned file has a row with the
+    same comment_id and the same hash of the comment body. The cleaned text
+    of files written without it is read from their token ids.
+
+    Args:
+        subreddit_df: DataFrame containing the raw comment data. Its
+            body_hash, tokenized_comment and sentiment columns are set in
+            place, with NaN for comments that still need cleaning.
+        cleaned_path: String representing the path of the existing cleaned
+            comments file, which may not exist, or None to clean every
+            comment.
+
+    Returns:
+        A boolean NumPy array that is True for each comment that is new or
+        has changed and needs cleaning.
+    """
+    subreddit_df['body_hash'] = hash_comment_bodies(
+        subreddit_df['comment_body'])
+    tokenized_comments = np.full(len(subreddit_df), np.nan, dtype=object)
+    sentiments = np.full(len(subreddit_df), np.nan)
+    found = np.zeros(len(subreddit_df), dtype=bool)
+
+    if cleaned_path is not None and os.path.isfile(cleaned_path):
+        previous = storage.read_comments(cleaned_path, [
+            'comment_id', 'body_hash', 'tokenized_comment', 'sentiment'])
+        if 'tokenized_comment' not in previous.columns:
+            # The text may have been moved to token ids by token_store.
+            tokenized = token_store.read_tokenized_comments(cleaned_path)
+            if tokenized is not None:
+                previous['tokenized_comment'] = tokenized
+        if {'body_hash', 'tokenized_comment'} <= set(previous.columns):
+            previous = previous.drop_duplicates(['comment_id', 'body_hash'])
+            keys = pd.MultiIndex.from_arrays(
+                [previous['comment_id'], previous['body_hash']])
+            positions = keys.get_indexer(pd.MultiIndex.from_arrays(
+                [subreddit_df['comment_id'].astype(str),
+                 subreddit_df['body_hash']]))
+            found = positions >= 0
+            tokenized_comments[found] = \
+                previous['tokenized_comment'].to_numpy()[positions[found]]
+            if 'sentiment' in previous.columns:
+                sentiments[found] = \
+                    previous['sentiment'].to_numpy()[positions[found]]
+
+    subreddit_df['tokenized_comment'] = tokenized_comments
+    subreddit_df['sentiment'] = sentiments
+    return ~found
 
 
-def store_tokenized_data(subreddit_list):
+def _load_raw(subreddit, incremental):
+    """
+    Read a subreddit's raw comments and find the ones that need cleaning.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        incremental: Boolean representing whether to reuse comments from an
+            existing cleaned file.
+
+    Returns:
+        A tuple of the raw comment DataFrame and a boolean NumPy array that
+        is True for each comment that needs cleaning.
+    """
+    # Read the raw data for the subreddit
+    subreddit_df = storage.load_raw(subreddit)
+    cleaned_path = storage.cleaned_path(subreddit) if incremental else None
+    return subreddit_df, reuse_cleaned_comments(subreddit_df, cleaned_path)
+
+
+def _store_cleaned(subreddit, subreddit_df, stale, tokenized_comments,
+                   fmt=None):
+    """
+    Save a subreddit's cleaned and scored comments.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        subreddit_df: DataFrame containing the raw comment data, with the
+            cleaned text and score of reused comments already filled in.
+        stale: Boolean NumPy array that is True for each comment that was
+            cleaned in this run.
+        tokenized_comments: List of strings containing the prepared text of
+            each stale comment.
+        fmt: Optional string representing the storage format to write.
+    """
+    # Add cleaned comment to column 'tokenized_comment'.
+    subreddit_df.loc[stale, 'tokenized_comment'] = tokenized_comments
+    # Score each newly cleaned comment once so analysis doesn't have to
+    unscored = subreddit_df['sentiment'].isna().to_numpy()
+    subreddit_df.loc[unscored, 'sentiment'] = analyze_sentiments(
+        subreddit_df.loc[unscored, 'tokenized_comment'])
+    # Save the new dataframe with tokenized comments to a new file
+    storage.save_cleaned(subreddit_df, subreddit, fmt)
+
+
+def clean_in_chunks(raw_path, cleaned_path, rows_per_chunk=10000, workers=1,
+                    chunksize=1000, progress=None):
+    """
+    Clean and score a raw comments file a fixed number of rows at a time.
+
+    Only one chunk of rows is held in memory at once; each chunk is cleaned,
+    scored and appended to the output file before the next is read. Chunks
+    are written to a temporary file that replaces cleaned_path once every
+    chunk is done, so a failure leaves any existing file untouched.
+
+    Args:
+        raw_path: String representing the path of the raw comments file.
+        cleaned_path: String representing the path to write the cleaned
+            comments file to. Any existing file is replaced. The storage
+            format of each file is taken from its extension.
+        rows_per_chunk: Integer representing the number of rows to read,
+            clean and write at a time.
+        workers: Integer representing the number of worker processes to
+            clean with. 1 cleans in the current process.
+        chunksize: Integer representing the number of comments sent to a
+            worker at a time.
+        progress: Optional function called after each chunk is written with
+            the number of rows written so far and the average number of rows
+            cleaned per second.
+    """
+    start_time = time.perf_counter()
+    rows_done = 0
+    pool = ProcessPoolExecutor(workers, initializer=_init_cleaning_worker) \
+        if workers > 1 else nullcontext()
+    temporary_path = storage.temporary_path(cleaned_path)
+    try:
+        with pool, storage.CommentWriter(temporary_path) as writer:
+            for subreddit_df in storage.iter_comments(raw_path,
+                                                      rows_per_chunk):
+                comments = subreddit_df['comment_body'].tolist()
+                if workers > 1:
+                    tokenized_comments = _collect_chunks(
+                        _submit_chunks(pool, comments, chunksize))
+                else:
+                    tokenized_comments = _clean_chunk(comments)
+                subreddit_df['body_hash'] = hash_comment_bodies(comments)
+                subreddit_df['tokenized_comment'] = tokenized_comments
+                add_sentiment_column(subreddit_df)
+                writer.write(subreddit_df)
+
+                rows_done += len(subreddit_df)
+                if progress is not None:
+                    elapsed = time.perf_counter() - start_time
+                    progress(rows_done,
+                             rows_done / elapsed if elapsed else 0.0)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    if os.path.exists(temporary_path):
+        os.replace(temporary_path, cleaned_path)
+        storage.remove_other_formats(cleaned_path)
+
+
+def store_tokenized_data(subreddit_list, workers=1, chunksize=1000,
+                         concurrent_subreddits=True, rows_per_chunk=None,
+                         progress=None, incremental=True, fmt=None):
     """
     Creates new data files for each subreddit with the comment body texts
-    stored in tokenized and lemmatized form.
+    stored in tokenized and lemmatized form, along with the sentiment score
+    of each comment.
+
+    A hash of each comment body is stored with the cleaned data. When a
+    subreddit is cleaned again, comments whose id and body hash are already
+    in its cleaned file are copied over instead of being cleaned again.
 
     Args:
         subreddit_list: List of strings representing subreddits to store data
         for
+        workers: Integer representing the number of worker processes to
+            clean with. 1 cleans in the current process.
+        chunksize: Integer representing the number of comments sent to a
+            worker at a time.
+        concurrent_subreddits: Boolean representing whether to submit the
+            comments of every subreddit to the pool at once (True), or to
+            finish each subreddit before starting the next (False). Only
+            used when workers is greater than 1.
+        rows_per_chunk: Optional integer. If given, each raw file is
+            streamed through clean_in_chunks this many rows at a time
+            instead of being loaded whole, and subreddits are processed one
+            after another.
+        progress: Optional function passed to clean_in_chunks when
+            streaming, called with the rows written so far and the rows
+            cleaned per second.
+        incremental: Boolean representing whether to reuse unchanged
+            comments from existing cleaned files. Streaming always cleans
+            every comment.
+        fmt: Optional string representing the storage format to write the
+            cleaned files in, 'csv' or 'parquet'. Defaults to
+            storage.DEFAULT_FORMAT.
     """
-    for subreddit in subreddit_list:
-        # Read the raw data for the subreddit from a CSV
-        subreddit_df = pd.read_csv('./rawdata/' + subreddit + '_comments.csv')
-        # Add cleaned comment to column 'tokenized_comment'.
-        subreddit_df['tokenized_comment'] = \
-            subreddit_df['comment_body'].apply(clean_comment)
-        # Save the new dataframe with tokenized comments to a new CSV file
-        subreddit_df.to_csv('./cleaneddata/' + subreddit +
-                            '_comments_cleaned.csv')
+    if rows_per_chunk is not None:
+        for subreddit in subreddit_list:
+            clean_in_chunks(storage.raw_path(subreddit),
+                            storage.cleaned_path(
+                                subreddit, fmt or storage.DEFAULT_FORMAT),
+                            rows_per_chunk, workers, chunksize, progress)
+        return
+
+    if workers <= 1:
+        for subreddit in subreddit_list:
+            subreddit_df, stale = _load_raw(subreddit, incremental)
+            _store_cleaned(subreddit, subreddit_df, stale, clean_comments(
+                subreddit_df.loc[stale, 'comment_body']), fmt)
+        return
+
+    with ProcessPoolExecutor(workers,
+                             initializer=_init_cleaning_worker) as pool:
+        pending = []
+        for subreddit in subreddit_list:
+            subreddit_df, stale = _load_raw(subreddit, incremental)
+            futures = _submit_chunks(
+                pool, subreddit_df.loc[stale, 'comment_body'].tolist(),
+                chunksize)
+            pending.append((subreddit, subreddit_df, stale, futures))
+            if not concurrent_subreddits:
+                _store_pending(pending, fmt)
+        _store_pending(pending, fmt)
+
+
+def _store_pending(pending, fmt=None):
+    """
+    Wait for submitted subreddits to finish cleaning and save them.
+
+    Args:
+        pending: List of (subreddit, subreddit_df, stale, futures) tuples.
+            It is emptied as each subreddit is saved.
+        fmt: Optional string representing the storage format to write.
+    """
+    while pending:
+        subreddit, subreddit_df, stale, futures = pending.pop(0)
+        _store_cleaned(subreddit, subreddit_df, stale,
+                       _collect_chunks(futures), fmt)
@@ -4,6 +4,7 @@ and secret after obtaining data!
 """
 import reddit_scraper
 import data_cleaning
+import pipeline
 
 # Enter the names of the subreddits to analyze as strings. We have provided
 # a sample selection here.
@@ -14,9 +15,16 @@ subreddit_list = ['AmItheAsshole', 'politics', 'MadeMeSmile', 'AskReddit',
 ACCOUNT_ID = ''  # Account ID for reddit app access
 ACCOUNT_SECRET = ''  # Account secret for reddit app access
 
-# Scrape comments from the top post of each subreddit
-reddit_scraper.scrape_reddit_comments(ACCOUNT_ID, ACCOUNT_SECRET,
-                                      subreddit_list)
+# Set to True to clean and score comments while they are scraped, writing
+# only the cleaned data files.
+USE_PIPELINE = False
 
-# Create and store new files with cleaned and tokenized comments
-data_cleaning.store_tokenized_data(subreddit_list)
+if USE_PIPELINE:
+    pipeline.run_pipeline(ACCOUNT_ID, ACCOUNT_SECRET, subreddit_list)
+else:
+    # Scrape comments from the top post of each subreddit
+    reddit_scraper.scrape_reddit_comments(ACCOUNT_ID, ACCOUNT_SECRET,
+                                          subreddit_list)
+
+    # Create and store new files with cleaned and tokenized comments
+    data_cleaning.store_tokenized_data(subreddit_list)
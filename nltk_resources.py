@@ -0,0 +1,108 @@
+"""
+Find the NLTK data used for cleaning and sentiment analysis on first use.
+"""
+import os
+import threading
+import nltk
+
+# Directory searched first for NLTK data and used for downloads. Set it
+# through the REDDIT_SENTIMENT_NLTK_DATA environment variable or configure().
+# When it is None, NLTK's own search path and download directory are used.
+DATA_DIRECTORY = os.environ.get('REDDIT_SENTIMENT_NLTK_DATA')
+
+# NLTK data vendored with this repository, searched after everything else.
+VENDORED_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'punkt')
+
+# Sentence tokenizer data. NLTK 3.8.2 replaced the pickled punkt models with
+# punkt_tab.
+SENTENCE_TOKENIZER = 'punkt_tab' if hasattr(nltk.tokenize, 'PunktTokenizer') \
+    else 'punkt'
+
+# File that must exist for each downloadable resource to be usable.
+RESOURCES = {
+    'wordnet': 'corpora/wordnet/index.noun',
+    'punkt_tab': 'tokenizers/punkt_tab/english/',
+    'punkt': 'tokenizers/punkt/english.pickle',
+    'vader_lexicon': 'sentiment/vader_lexicon.zip'
+}
+
+# Resources needed by data_cleaning and sentiment_analysis.
+REQUIRED = ['wordnet', SENTENCE_TOKENIZER, 'vader_lexicon']
+
+_FOUND = set()
+_LOCK = threading.Lock()
+
+
+def configure(data_directory=None):
+    """
+    Add the data directories to NLTK's search path.
+
+    Args:
+        data_directory: Optional string representing a directory to search
+            first and download into. Replaces DATA_DIRECTORY when given.
+    """
+    global DATA_DIRECTORY
+    if data_directory is not None:
+        DATA_DIRECTORY = data_directory
+    if DATA_DIRECTORY is not None and DATA_DIRECTORY not in nltk.data.path:
+        nltk.data.path.insert(0, DATA_DIRECTORY)
+    if VENDORED_DIRECTORY not in nltk.data.path:
+        nltk.data.path.append(VENDORED_DIRECTORY)
+
+
+def is_available(name):
+    """
+    Check whether an NLTK resource can be loaded without downloading it.
+
+    Args:
+        name: String representing a resource name in RESOURCES.
+
+    Returns:
+        A Boolean value that is True if the resource was found.
+    """
+    configure()
+    try:
+        nltk.data.find(RESOURCES[name])
+    except LookupError:
+        return False
+    return True
+
+
+def ensure(name):
+    """
+    Make an NLTK resource available, downloading it only if it is missing.
+
+    Each resource is looked up at most once per process, so calling this
+    before every use costs a set lookup.
+
+    Args:
+        name: String representing a resource name in RESOURCES.
+    """
+    if name in _FOUND:
+        return
+    with _LOCK:
+        if name in _FOUND:
+            return
+        if not is_available(name):
+            nltk.download(name, download_dir=DATA_DIRECTORY, quiet=True)
+            if not is_available(name):
+                raise LookupError(f'NLTK resource {name!r} is not available '
+                                  'and could not be downloaded.')
+        _FOUND.add(name)
+
+
+def prefetch(names=None):
+    """
+    Download any missing NLTK resources ahead of time, such as at deploy.
+
+    Args:
+        names: Optional list of strings representing resource names in
+            RESOURCES. Defaults to REQUIRED.
+    """
+    for name in REQUIRED if names is None else names:
+        ensure(name)
+
+
+if __name__ == '__main__':
+    prefetch()
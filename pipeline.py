@@ -0,0 +1,218 @@
+"""
+Scrape, clean and score comments in one streaming pass.
+"""
+import asyncio
+from collections import deque
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+import data_cleaning
+from reddit_scraper import (
+    COMMENT_COLUMNS,
+    REQUESTS_PER_MINUTE,
+    RateLimiter,
+    RedditAPI,
+    fetch_top_submissions,
+    iter_submission_comments
+)
+from sentiment_analysis import get_analyzer
+import storage
+
+# Columns of the cleaned data files written by the pipeline.
+CLEANED_COLUMNS = COMMENT_COLUMNS + ['body_hash', 'tokenized_comment',
+                                     'sentiment']
+
+
+def _init_pipeline_worker():
+    """
+    Load the cleaning and sentiment models in a worker process.
+    """
+    data_cleaning._init_cleaning_worker()
+    get_analyzer()
+
+
+def enrich_comments(rows):
+    """
+    Clean and score a batch of scraped comments.
+
+    Args:
+        rows: List of COMMENT_COLUMNS tuples.
+
+    Returns:
+        A DataFrame with CLEANED_COLUMNS, as written by
+        data_cleaning.store_tokenized_data.
+    """
+    comment_df = pd.DataFrame(rows, columns=COMMENT_COLUMNS)
+    comments = comment_df['comment_body'].tolist()
+    comment_df['body_hash'] = data_cleaning.hash_comment_bodies(comments)
+    comment_df['tokenized_comment'] = data_cleaning.clean_comments(comments)
+    return data_cleaning.add_sentiment_column(comment_df)
+
+
+async def _scrape_into(queue, client, subreddit_list, posts_per_subreddit,
+                       max_submissions):
+    """
+    Scrape every subreddit, putting each round of comments on a queue.
+
+    Args:
+        queue: asyncio.Queue of (subreddit, rows) tuples. Scraping waits
+            whenever the queue is full.
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        subreddit_list: List of strings representing subreddits to scrape.
+        posts_per_subreddit: Integer representing the number of top posts
+            of all time to scrape from each subreddit.
+        max_submissions: Integer representing the most posts that can be
+            loading at once.
+    """
+    submissions = asyncio.Semaphore(max_submissions)
+
+    async def scrape_submission(subreddit, submission_id):
+        async with submissions:
+            async for rows, _ in iter_submission_comments(client,
+                                                          submission_id):
+                if rows:
+                    await queue.put((subreddit, rows))
+
+    async def scrape_subreddit(subreddit):
+        submission_ids = await fetch_top_submissions(client, subreddit,
+                                                     posts_per_subreddit)
+        await asyncio.gather(*[scrape_submission(subreddit, submission_id)
+                               for submission_id in submission_ids])
+
+    await asyncio.gather(*[scrape_subreddit(subreddit)
+                           for subreddit in subreddit_list])
+
+
+async def scrape_clean_score(client, subreddit_list, posts_per_subreddit=1,
+                             max_submissions=8, workers=1, buffer_size=8,
+                             fmt=None):
+    """
+    Scrape comments and clean and score them while the scrape continues.
+
+    Each round of comments returned by the API is passed on a bounded queue
+    to be cleaned and scored, so the CPU work overlaps the network requests
+    instead of waiting for the whole scrape to finish. Only the cleaned data
+    files are written; no raw data files are created. Comments are written
+    to temporary files that replace the cleaned data files once every
+    subreddit is done, so a failed scrape leaves existing files untouched.
+
+    Args:
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        subreddit_list: List of strings representing subreddits to scrape.
+        posts_per_subreddit: Integer representing the number of top posts
+            of all time to scrape from each subreddit.
+        max_submissions: Integer representing the most posts that can be
+            loading at once.
+        workers: Integer representing the number of worker processes to
+            clean and score with. 1 uses a single background thread.
+        buffer_size: Integer representing the most scraped batches that can
+            wait to be cleaned before scraping pauses.
+        fmt: Optional string representing the storage format to write,
+            'csv' or 'parquet'. Defaults to storage.DEFAULT_FORMAT.
+
+    Returns:
+        A dictionary mapping each subreddit to the number of comments
+        written to its cleaned data file in the cleaneddata directory.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(buffer_size)
+    paths = {subreddit: storage.cleaned_path(subreddit,
+                                             fmt or storage.DEFAULT_FORMAT)
+             for subreddit in subreddit_list}
+    writers = {subreddit: storage.CommentWriter(storage.temporary_path(path))
+               for subreddit, path in paths.items()}
+    pool = ProcessPoolExecutor(workers, initializer=_init_pipeline_worker) \
+        if workers > 1 else ThreadPoolExecutor(1)
+
+    async def write_oldest(in_flight):
+        subreddit, future = in_flight.popleft()
+        comment_df = await future
+        await asyncio.to_thread(writers[subreddit].write, comment_df)
+
+    async def clean_and_write():
+        # Batches are cleaned workers at a time and written in the order
+        # they were scraped.
+        in_flight = deque()
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            subreddit, rows = batch
+            in_flight.append((subreddit, loop.run_in_executor(
+                pool, enrich_comments, rows)))
+            if len(in_flight) >= workers:
+                await write_oldest(in_flight)
+        while in_flight:
+            await write_oldest(in_flight)
+
+    async def scrape():
+        try:
+            await _scrape_into(queue, client, subreddit_list,
+                               posts_per_subreddit, max_submissions)
+        finally:
+            await queue.put(None)
+
+    try:
+        with pool:
+            await asyncio.gather(scrape(), clean_and_write())
+        for writer in writers.values():
+            if writer.rows_written == 0:
+                writer.write(pd.DataFrame(columns=CLEANED_COLUMNS))
+            writer.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.close(succeeded=False)
+            if os.path.exists(writer.path):
+                os.remove(writer.path)
+        raise
+    for subreddit, writer in writers.items():
+        os.replace(writer.path, paths[subreddit])
+        storage.remove_other_formats(paths[subreddit])
+    return {subreddit: writer.rows_written for subreddit, writer in
+            writers.items()}
+
+
+def run_pipeline(account_id, account_secret, subreddit_list,
+                 posts_per_subreddit=1, max_submissions=8, workers=1,
+                 buffer_size=8, requests_per_minute=REQUESTS_PER_MINUTE,
+                 fmt=None):
+    """
+    Scrape, clean and score comments from the top posts of many subreddits.
+
+    Writes the same cleaned data files as running scrape_reddit_comments
+    followed by data_cleaning.store_tokenized_data, but cleans and scores
+    comments while they are being scraped. Requires aiohttp.
+
+    Args:
+        account_id: String representing the client ID used to access the
+            Reddit app.
+        account_secret: String representing the client secret to access the
+            Reddit app.
+        subreddit_list: List of strings representing subreddits to scrape.
+        posts_per_subreddit: Integer representing the number of top posts
+            of all time to scrape from each subreddit.
+        max_submissions: Integer representing the most posts that can be
+            loading at once.
+        workers: Integer representing the number of worker processes to
+            clean and score with.
+        buffer_size: Integer representing the most scraped batches that can
+            wait to be cleaned.
+        requests_per_minute: Number representing the most requests to make
+            per minute.
+        fmt: Optional string representing the storage format to write.
+
+    Returns:
+        A dictionary mapping each subreddit to the number of comments
+        written.
+    """
+    async def run():
+        async with RedditAPI(account_id, account_secret,
+                             rate_limiter=RateLimiter(requests_per_minute)) \
+                as client:
+            return await scrape_clean_score(client, subreddit_list,
+                                            posts_per_subreddit,
+                                            max_submissions, workers,
+                                            buffer_size, fmt)
+    return asyncio.run(run())
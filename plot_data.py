@@ -0,0 +1,286 @@
+"""
+Summarize a subreddit's sentiment analysis into compact plot data.
+
+Plotting every comment of a large forest is slow: seaborn builds an artist
+per thread and estimates a density per depth from every score. PlotData
+holds everything the plots need, reduced once to a size that depends on the
+number of depths rather than the number of comments: a sample of thread
+traces, bubbles binned by sentiment, per-depth statistics and fixed-bin
+histograms. It is cached in a .npz file next to the cleaned data.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from sentiment_analysis import load_thread, score_reply_dicts, \
+    summarize_scores
+import storage
+
+# Version of the files written by PlotData.save.
+PLOT_DATA_VERSION = 1
+
+# Number of fixed-width histogram bins covering compound scores from -1 to 1.
+HISTOGRAM_BINS = 40
+
+# Most threads kept from each starting polarity for line plots.
+MAX_TRACES = 50
+
+# Starting polarity of a thread, from the sign of its top level comment's
+# score, as in plotting_functions.get_sentiment_categorized.
+CATEGORIES = {-1: 'Negative', 0: 'Neutral', 1: 'Positive'}
+
+
+def get_trace_frame(sentiment_dicts):
+    """
+    List the average sentiment at each depth of each thread as rows.
+
+    Args:
+        sentiment_dicts: A list of dictionaries where the keys are the
+            nesting depths for the comment replies and the values are a
+            tuple of the average compound sentiment scores for that depth
+            and the number of comments in that depth.
+
+    Returns:
+        A DataFrame with one row per thread and depth, with columns trace
+        (the index of the dictionary), category (the sign of the top level
+        comment's score), depth, sentiment, change (the sentiment minus the
+        top level comment's) and count.
+    """
+    rows = []
+    for trace, comment_dict in enumerate(sentiment_dicts):
+        if not comment_dict:
+            continue
+        first = comment_dict[0][0]
+        category = int(np.sign(first))
+        rows.extend((trace, category, depth, sentiment, sentiment - first,
+                     count) for depth, (sentiment, count) in
+                    comment_dict.items())
+    return pd.DataFrame(rows, columns=['trace', 'category', 'depth',
+                                       'sentiment', 'change', 'count'])
+
+
+def downsample_traces(trace_df, max_traces=MAX_TRACES):
+    """
+    Keep an evenly spaced sample of the threads of each starting polarity.
+
+    Args:
+        trace_df: DataFrame returned by get_trace_frame.
+        max_traces: Integer representing the most threads kept from each
+            category.
+
+    Returns:
+        A DataFrame of the rows of the kept threads.
+    """
+    kept = []
+    for traces in trace_df.groupby('category')['trace'].unique():
+        if len(traces) > max_traces:
+            traces = traces[np.linspace(0, len(traces) - 1,
+                                        max_traces).round().astype(int)]
+        kept.extend(traces.tolist())
+    return trace_df[trace_df['trace'].isin(kept)].reset_index(drop=True)
+
+
+def get_bubble_frame(trace_df, bins=HISTOGRAM_BINS):
+    """
+    Merge the bubbles of every thread that fall in the same place.
+
+    Scores are rounded to the histogram bin width, and the comments of
+    threads at the same depth, rounded score and starting polarity are
+    added together into one bubble.
+
+    Args:
+        trace_df: DataFrame returned by get_trace_frame.
+        bins: Integer representing the number of bins between -1 and 1.
+
+    Returns:
+        A DataFrame with columns kind ('sentiment' or 'change'), category,
+        depth, value (the rounded score) and count.
+    """
+    width = 2 / bins
+    frames = [trace_df[['category', 'depth', 'count']].assign(
+        kind=kind, value=(trace_df[kind] / width).round() * width)
+        for kind in ['sentiment', 'change']]
+    return pd.concat(frames, ignore_index=True).groupby(
+        ['kind', 'category', 'depth', 'value'],
+        as_index=False)['count'].sum()
+
+
+def get_histograms(depths, scores, depth_values, bins=HISTOGRAM_BINS):
+    """
+    Count the scores at each depth in fixed-width bins.
+
+    Args:
+        depths: NumPy array of integers representing the depth of each
+            comment.
+        scores: NumPy array of floats representing the score of each comment.
+        depth_values: Sorted NumPy array of the distinct depths.
+        bins: Integer representing the number of bins between -1 and 1.
+
+    Returns:
+        A tuple of a NumPy array of the bins + 1 bin edges and a NumPy array
+        of integers with one row of bin counts per depth in depth_values.
+        Like numpy.histogram, the last bin includes 1.
+    """
+    edges = np.linspace(-1, 1, bins + 1)
+    positions = np.searchsorted(edges[1:-1], scores, side='right')
+    rows = np.searchsorted(depth_values, depths)
+    counts = np.bincount(rows * bins + positions,
+                         minlength=len(depth_values) * bins)
+    return edges, counts.reshape(len(depth_values), bins)
+
+
+class PlotData:
+    """
+    Compact summaries of a subreddit's analysis to plot from.
+
+    Attributes:
+        traces: DataFrame returned by downsample_traces, used for line plots.
+        bubbles: DataFrame returned by get_bubble_frame, from every thread.
+        distribution: DataFrame with one row per depth and the statistics
+            columns of sentiment_analysis.summarize_scores, pooling the
+            comments of every thread.
+        edges: NumPy array of floats representing the histogram bin edges.
+        histograms: NumPy array of integers with a row of bin counts for
+            each depth in distribution.
+        settings: Dictionary of the arguments the data was built with.
+    """
+
+    FRAMES = ['traces', 'bubbles', 'distribution']
+
+    def __init__(self, traces, bubbles, distribution, edges, histograms,
+                 settings=None):
+        """
+        Create plot data from its summaries.
+
+        Args:
+            traces: DataFrame of sampled thread traces.
+            bubbles: DataFrame of merged bubbles.
+            distribution: DataFrame of statistics by depth.
+            edges: NumPy array of histogram bin edges.
+            histograms: NumPy array of bin counts by depth.
+            settings: Optional dictionary of the arguments the data was
+                built with.
+        """
+        self.traces = traces
+        self.bubbles = bubbles
+        self.distribution = distribution
+        self.edges = edges
+        self.histograms = histograms
+        self.settings = settings or {}
+
+    @classmethod
+    def from_thread(cls, thread, all_threads=False, bins=HISTOGRAM_BINS,
+                    max_traces=MAX_TRACES):
+        """
+        Summarize an analyzed subreddit.
+
+        Args:
+            thread: sentiment_analysis.AnalyzedThread of the subreddit.
+            all_threads: Boolean representing whether to summarize every
+                top level comment's thread instead of only the most deeply
+                nested ones.
+            bins: Integer representing the number of histogram bins.
+            max_traces: Integer representing the most threads of each
+                starting polarity kept for line plots.
+
+        Returns:
+            A PlotData of the subreddit.
+        """
+        trace_df = get_trace_frame(thread.by_depth(all_threads))
+        _, depths, scores = score_reply_dicts(
+            thread.comment_df, thread.reply_dicts(all_threads), thread.forest)
+        distribution = summarize_scores(
+            pd.DataFrame({'depth': depths, 'sentiment': scores}), ['depth'])
+        edges, histograms = get_histograms(
+            depths, scores, distribution['depth'].to_numpy(), bins)
+        return cls(downsample_traces(trace_df, max_traces),
+                   get_bubble_frame(trace_df, bins), distribution, edges,
+                   histograms, {'all_threads': all_threads, 'bins': bins,
+                                'max_traces': max_traces})
+
+    def save(self, path, source=None):
+        """
+        Write the plot data to a NumPy .npz file, replacing it in one step.
+
+        Args:
+            path: String representing the path of the file.
+            source: Optional list identifying the version of the cleaned data
+                file the plot data was built from, from storage.file_version.
+        """
+        arrays = {}
+        for name in self.FRAMES:
+            frame = getattr(self, name)
+            for column in frame.columns:
+                array = frame[column].to_numpy()
+                # Text columns are saved as fixed-width strings, which load
+                # without pickle.
+                arrays[f'{name}/{column}'] = array.astype(str) if \
+                    array.dtype == object else array
+        temporary_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temporary_path, edges=self.edges, histograms=self.histograms,
+                 metadata=np.array(json.dumps({
+                     'version': PLOT_DATA_VERSION, 'source': source,
+                     'settings': self.settings})), **arrays)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read plot data written by save.
+
+        Args:
+            path: String representing the path of the file.
+
+        Returns:
+            A tuple of the PlotData and the source it was saved with, or
+            (None, None) if it was saved by another version.
+        """
+        with np.load(path, allow_pickle=False) as saved:
+            metadata = json.loads(str(saved['metadata']))
+            if metadata['version'] != PLOT_DATA_VERSION:
+                return None, None
+            frames = {name: pd.DataFrame({
+                key.split('/', 1)[1]: saved[key] for key in saved.files
+                if key.startswith(name + '/')}) for name in cls.FRAMES}
+            return cls(edges=saved['edges'], histograms=saved['histograms'],
+                       settings=metadata['settings'],
+                       **frames), metadata['source']
+
+
+def load_plot_data(subreddit, all_threads=False, bins=HISTOGRAM_BINS,
+                   max_traces=MAX_TRACES, cache=True):
+    """
+    Return the plot data of a subreddit, from its cache file when current.
+
+    The cache file is rebuilt when the cleaned data file has changed or the
+    plot data was built with other arguments. A current cache is read
+    without loading the subreddit's comments.
+
+    Args:
+        subreddit: A string representing the subreddit name.
+        all_threads: Boolean representing whether to summarize every top
+            level comment's thread instead of only the most deeply nested
+            ones.
+        bins: Integer representing the number of histogram bins.
+        max_traces: Integer representing the most threads of each starting
+            polarity kept for line plots.
+        cache: Boolean representing whether to read and write the cache
+            file at storage.plot_data_path.
+
+    Returns:
+        A PlotData of the subreddit.
+    """
+    source = storage.file_version(storage.cleaned_path(subreddit))
+    settings = {'all_threads': all_threads, 'bins': bins,
+                'max_traces': max_traces}
+    path = storage.plot_data_path(subreddit, all_threads)
+    if cache and os.path.isfile(path):
+        plot_data, saved_source = PlotData.load(path)
+        if plot_data is not None and saved_source == source and \
+                plot_data.settings == settings:
+            return plot_data
+    plot_data = PlotData.from_thread(load_thread(subreddit), all_threads,
+                                     bins, max_traces)
+    if cache:
+        plot_data.save(path, source)
+    return plot_data
@@ -1,13 +1,25 @@
 """
 Contains all of the plotting helper functions used in the
-reddit-sentiment-analysis notebook.
+reddit-sentiment-analysis notebook, and render_subreddits to save every plot
+of many subreddits to image files without a display.
 """
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
 import matplotlib.pyplot as plt
 import seaborn as sns
+import numpy as np
 import pandas as pd
+from plot_data import CATEGORIES, load_plot_data
+from sentiment_analysis import (
+    analyze_subreddit_by_depth,
+    analyze_subreddit_distribution,
+    get_analyzer
+)
 
 
-def sentiment_line(subreddit, sentiment_dicts):
+def sentiment_line(subreddit, sentiment_dicts, show=True):
     """
     Plot a line plot with depth on the x axis and sentiment on the y axis.
 
@@ -17,6 +29,11 @@ def sentiment_line(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     for comment_dict in sentiment_dicts:
         sns.lineplot(x=comment_dict.keys(), y=[value[0] for value in
@@ -24,10 +41,12 @@ def sentiment_line(subreddit, sentiment_dicts):
     plt.xlabel('Comment depth')
     plt.ylabel('Average compound sentiment score')
     plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Analysis')
-    plt.show()
+    if show:
+        plt.show()
+    return plt.gcf()
 
 
-def sentiment_bubble(subreddit, sentiment_dicts):
+def sentiment_bubble(subreddit, sentiment_dicts, show=True):
     """
     Plots a bubble plot with depth on the x axis and sentiment on the y axis,
     with bubble size as a function as number of comments.
@@ -38,6 +57,11 @@ def sentiment_bubble(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     for comment_dict in sentiment_dicts:
         sns.scatterplot(x=comment_dict.keys(), y=[value[0] for value in
@@ -47,7 +71,9 @@ def sentiment_bubble(subreddit, sentiment_dicts):
     plt.xlabel('Comment depth')
     plt.ylabel('Average compound sentiment score')
     plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Analysis')
-    plt.show()
+    if show:
+        plt.show()
+    return plt.gcf()
 
 
 def get_sentiment_difference(sentiment_dicts):
@@ -74,7 +100,7 @@ def get_sentiment_difference(sentiment_dicts):
     return difference_dicts
 
 
-def sentiment_difference_line(subreddit, sentiment_dicts):
+def sentiment_difference_line(subreddit, sentiment_dicts, show=True):
     """
     Plot a line plot with depth on the x axis and sentiment, normalized so the
     first comment's sentiment is 0, on the y axis.
@@ -85,6 +111,11 @@ def sentiment_difference_line(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     difference_dicts = get_sentiment_difference(sentiment_dicts)
     for difference_dict in difference_dicts:
@@ -94,10 +125,12 @@ def sentiment_difference_line(subreddit, sentiment_dicts):
     plt.ylabel('Average compound sentiment score change')
     plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Change ' +
               'Over Depth')
-    plt.show()
+    if show:
+        plt.show()
+    return plt.gcf()
 
 
-def sentiment_difference_bubble(subreddit, sentiment_dicts):
+def sentiment_difference_bubble(subreddit, sentiment_dicts, show=True):
     """
     Plot a bubble plot with depth on the x axis and sentiment, normalized so
     the first comment's sentiment is 0, on the y axis.
@@ -108,6 +141,11 @@ def sentiment_difference_bubble(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     difference_dicts = get_sentiment_difference(sentiment_dicts)
     for difference_dict in difference_dicts:
@@ -119,7 +157,9 @@ def sentiment_difference_bubble(subreddit, sentiment_dicts):
     plt.ylabel('Average compound sentiment score change')
     plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Change ' +
               'Over Depth')
-    plt.show()
+    if show:
+        plt.show()
+    return plt.gcf()
 
 
 def get_sentiment_categorized(sentiment_dicts):
@@ -153,7 +193,7 @@ def get_sentiment_categorized(sentiment_dicts):
     return categorized_dicts
 
 
-def sentiment_categorized_line(subreddit, sentiment_dicts):
+def sentiment_categorized_line(subreddit, sentiment_dicts, show=True):
     """
     Plot line plots with depth on the x-axis and sentiment on the y-axis, with
     one plot each for comments that start with negative, neutral, and positive
@@ -165,6 +205,11 @@ def sentiment_categorized_line(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     categorized_dicts = get_sentiment_categorized(sentiment_dicts)
     fig, axs = plt.subplots(1, 3, figsize=(12, 4), sharey=True)
@@ -191,10 +236,12 @@ def sentiment_categorized_line(subreddit, sentiment_dicts):
                  ' Top Level Comment Polarity')
     plt.xlabel('Comment depth')
     plt.ylabel('Average sentiment score change')
-    plt.show()
+    if show:
+        plt.show()
+    return fig
 
 
-def sentiment_categorized_bubble(subreddit, sentiment_dicts):
+def sentiment_categorized_bubble(subreddit, sentiment_dicts, show=True):
     """
     Plot bubble plots with depth on the x-axis and sentiment on the y-axis,
     with one plot each for comments that start with negative, neutral, and
@@ -208,6 +255,11 @@ def sentiment_categorized_bubble(subreddit, sentiment_dicts):
         nesting depths for the comment replies and the values are a tuple of
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
     categorized_dicts = get_sentiment_categorized(sentiment_dicts)
     fig, axs = plt.subplots(1, 3, figsize=(12, 4), sharey=True)
@@ -240,10 +292,35 @@ def sentiment_categorized_bubble(subreddit, sentiment_dicts):
                  'Top Level Comment Polarity')
     plt.xlabel('Comment depth')
     plt.ylabel('Average sentiment score change')
-    plt.show()
+    if show:
+        plt.show()
+    return fig
+
 
+def get_sentiment_distribution(sentiment_dict):
+    """
+    Convert the sentiment lists of a thread into one row per comment.
+
+    Args:
+        sentiment_dict: A dictionary where the keys are the nesting depths for
+        the comment replies and the values are lists of the compound sentiment
+        scores of the comments at that depth.
 
-def sentiment_distribution_violin(subreddit, sentiment_dict):
+    Returns:
+        comment_df: A DataFrame with a depth and a sentiment column, in depth
+        order and then in the order of each list.
+    """
+    counts = [len(sentiments) for sentiments in sentiment_dict.values()]
+    sentiments = [np.asarray(sentiments, dtype=float) for sentiments in
+                  sentiment_dict.values()]
+    return pd.DataFrame({
+        'depth': np.repeat(np.array(list(sentiment_dict.keys()), dtype=int),
+                           counts),
+        'sentiment': np.concatenate(sentiments) if sentiments else
+        np.empty(0)})
+
+
+def sentiment_distribution_violin(subreddit, sentiment_dict, show=True):
     """
     Create violin plots where the x-axis is depth and the y-axis is the
     compound average sentiment score for that depth.
@@ -251,17 +328,353 @@ def sentiment_distribution_violin(subreddit, sentiment_dict):
     Args:
         subreddit: A string representing the name of the subreddit.
         sentiment_dict: A dictionary where the keys are the nesting depths for
-        the comment replies and the values are a tuple of the average compound
-        sentiment scores for that depth and the number of comments in that
-        depth.
+        the comment replies and the values are lists of the compound sentiment
+        scores of the comments at that depth.
+        show: A Boolean representing whether to display the plot. Pass False
+        to save or close the figure instead.
+
+    Returns:
+        The matplotlib Figure of the plot.
     """
-    comment_df = pd.DataFrame(columns=['depth', 'sentiment'])
-    for depth in sentiment_dict.keys():
-        for sentiment in sentiment_dict[depth]:
-            comment_df = comment_df.append(pd.DataFrame({'depth': depth,
-                                        'sentiment': sentiment}, index=[0]))
+    comment_df = get_sentiment_distribution(sentiment_dict)
 
     sns.violinplot(x=comment_df['depth'], y=comment_df['sentiment'])
     plt.xlabel('Comment depth')
     plt.ylabel('Compound Sentiment Score')
     plt.title(f'r/{subreddit} Comment Thread Sentiment Distribution by Depth')
+    if show:
+        plt.show()
+    return plt.gcf()
+
+
+def _bubble_sizes(counts, sizes=(20, 2000)):
+    """
+    Scale comment counts to marker areas, as seaborn's sizes argument does.
+
+    Args:
+        counts: A Series or array of comment counts.
+        sizes: A tuple of the smallest and largest marker areas.
+
+    Returns:
+        A NumPy array of floats representing the area of each marker.
+    """
+    counts = np.asarray(counts, dtype=float)
+    if len(counts) == 0 or counts.max() == counts.min():
+        return np.full(len(counts), sum(sizes) / 2)
+    return sizes[0] + (counts - counts.min()) / \
+        (counts.max() - counts.min()) * (sizes[1] - sizes[0])
+
+
+def summary_line(subreddit, plot_data, change=False, show=True):
+    """
+    Plot sampled threads' sentiment by depth from precomputed plot data,
+    like sentiment_line or, with change, sentiment_difference_line.
+
+    Args:
+        subreddit: A string representing the name of the subreddit.
+        plot_data: A plot_data.PlotData of the subreddit.
+        change: A Boolean representing whether to plot the change from the
+        top level comment's sentiment instead of the sentiment.
+        show: A Boolean representing whether to display the plot.
+
+    Returns:
+        The matplotlib Figure of the plot.
+    """
+    column = 'change' if change else 'sentiment'
+    for _, trace_df in plot_data.traces.groupby('trace'):
+        plt.plot(trace_df['depth'], trace_df[column])
+    plt.xlabel('Comment depth')
+    if change:
+        plt.ylabel('Average compound sentiment score change')
+        plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Change ' +
+                  'Over Depth')
+    else:
+        plt.ylabel('Average compound sentiment score')
+        plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Analysis')
+    if show:
+        plt.show()
+    return plt.gcf()
+
+
+def summary_bubble(subreddit, plot_data, change=False, show=True):
+    """
+    Plot merged bubbles of every thread's sentiment by depth from
+    precomputed plot data, like sentiment_bubble or, with change,
+    sentiment_difference_bubble.
+
+    Args:
+        subreddit: A string representing the name of the subreddit.
+        plot_data: A plot_data.PlotData of the subreddit.
+        change: A Boolean representing whether to plot the change from the
+        top level comment's sentiment instead of the sentiment.
+        show: A Boolean representing whether to display the plot.
+
+    Returns:
+        The matplotlib Figure of the plot.
+    """
+    bubbles = plot_data.bubbles[plot_data.bubbles['kind'] ==
+                                ('change' if change else 'sentiment')]
+    plt.scatter(bubbles['depth'], bubbles['value'],
+                s=_bubble_sizes(bubbles['count']), alpha=0.75)
+    plt.xlabel('Comment depth')
+    if change:
+        plt.ylabel('Average compound sentiment score change')
+        plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Change ' +
+                  'Over Depth')
+    else:
+        plt.ylabel('Average compound sentiment score')
+        plt.title(f'r/{subreddit} Most Replied Comments\' Sentiment Analysis')
+    if show:
+        plt.show()
+    return plt.gcf()
+
+
+def summary_categorized(subreddit, plot_data, bubble=False, show=True):
+    """
+    Plot the sentiment change of threads starting with negative, neutral
+    and positive comments from precomputed plot data, like
+    sentiment_categorized_line or, with bubble,
+    sentiment_categorized_bubble.
+
+    Args:
+        subreddit: A string representing the name of the subreddit.
+        plot_data: A plot_data.PlotData of the subreddit.
+        bubble: A Boolean representing whether to plot merged bubbles of
+        every thread instead of lines of sampled threads.
+        show: A Boolean representing whether to display the plot.
+
+    Returns:
+        The matplotlib Figure of the plot.
+    """
+    fig, axs = plt.subplots(1, 3, figsize=(12, 4), sharey=True)
+    changes = plot_data.bubbles[plot_data.bubbles['kind'] == 'change']
+    for ax, (category, name) in zip(axs, CATEGORIES.items()):
+        if bubble:
+            bubbles = changes[changes['category'] == category]
+            ax.scatter(bubbles['depth'], bubbles['value'],
+                       s=_bubble_sizes(bubbles['count']), alpha=0.75)
+        else:
+            traces = plot_data.traces[plot_data.traces['category'] ==
+                                      category]
+            for _, trace_df in traces.groupby('trace'):
+                ax.plot(trace_df['depth'], trace_df['change'])
+        ax.set_title(f'{name} Top Level Comment')
+
+    fig.add_subplot(111, frameon=False)
+    plt.tick_params(labelcolor='none', top=False, bottom=False, left=False,
+                    right=False)
+    plt.grid(False)
+    fig.suptitle(f'r/{subreddit} Reply Chain Sentiment Change Categorized by ' +
+                 'Top Level Comment Polarity')
+    plt.xlabel('Comment depth')
+    plt.ylabel('Average sentiment score change')
+    if show:
+        plt.show()
+    return fig
+
+
+def summary_violin(subreddit, plot_data, show=True):
+    """
+    Plot violins of the sentiment distribution at each depth from
+    precomputed histograms, like sentiment_distribution_violin but pooling
+    the comments of every thread in the plot data.
+
+    Args:
+        subreddit: A string representing the name of the subreddit.
+        plot_data: A plot_data.PlotData of the subreddit.
+        show: A Boolean representing whether to display the plot.
+
+    Returns:
+        The matplotlib Figure of the plot.
+    """
+    centers = (plot_data.edges[:-1] + plot_data.edges[1:]) / 2
+    statistics = []
+    for row, histogram in zip(plot_data.distribution.itertuples(),
+                              plot_data.histograms):
+        # Smooth the counts a little, in place of a kernel density estimate.
+        histogram = np.convolve(histogram, [0.25, 0.5, 0.25], mode='same')
+        # Trim empty bins beyond the smallest and largest score.
+        inside = (centers >= row.min - (centers[1] - centers[0])) & \
+            (centers <= row.max + (centers[1] - centers[0]))
+        statistics.append({'coords': centers[inside],
+                           'vals': histogram[inside] / max(histogram.max(), 1),
+                           'mean': row.mean, 'median': row.median,
+                           'min': row.min, 'max': row.max})
+    ax = plt.gca()
+    if statistics:
+        ax.violin(statistics,
+                  positions=plot_data.distribution['depth'].tolist(),
+                  showmedians=True)
+    plt.xlabel('Comment depth')
+    plt.ylabel('Compound Sentiment Score')
+    plt.title(f'r/{subreddit} Comment Thread Sentiment Distribution by Depth')
+    if show:
+        plt.show()
+    return plt.gcf()
+
+
+# Plots saved by render_subreddits, mapped to the function drawing each one
+# and whether it takes the sentiment by depth ('by_depth') or the sentiment
+# distribution of the most replied thread ('distribution').
+PLOTS = {
+    'line': (sentiment_line, 'by_depth'),
+    'bubble': (sentiment_bubble, 'by_depth'),
+    'difference_line': (sentiment_difference_line, 'by_depth'),
+    'difference_bubble': (sentiment_difference_bubble, 'by_depth'),
+    'categorized_line': (sentiment_categorized_line, 'by_depth'),
+    'categorized_bubble': (sentiment_categorized_bubble, 'by_depth'),
+    'distribution_violin': (sentiment_distribution_violin, 'distribution')
+}
+
+# The same plots drawn from plot_data.PlotData summaries, so drawing them
+# takes a time that depends on the number of depths rather than comments.
+SUMMARY_PLOTS = {
+    'line': summary_line,
+    'bubble': summary_bubble,
+    'difference_line': partial(summary_line, change=True),
+    'difference_bubble': partial(summary_bubble, change=True),
+    'categorized_line': summary_categorized,
+    'categorized_bubble': partial(summary_categorized, bubble=True),
+    'distribution_violin': summary_violin
+}
+
+# Image formats render_subreddits can write.
+IMAGE_FORMATS = ['png', 'svg']
+
+
+def _init_render_worker():
+    """
+    Draw with the non-interactive Agg backend and load the sentiment
+    lexicon in a worker process.
+    """
+    plt.switch_backend('agg')
+    get_analyzer()
+
+
+def render_subreddit(subreddit, directory, plots=None, formats=('png',),
+                     dpi=100, summarized=False):
+    """
+    Save plots of a subreddit's sentiment to image files.
+
+    Every figure is closed once it is saved, so no window is opened even
+    with an interactive backend.
+
+    Args:
+        subreddit: A string representing the name of the subreddit.
+        directory: A string representing the directory to save images to.
+        It is created if it does not exist.
+        plots: A list of strings representing names in PLOTS to save, or None
+        to save all of them.
+        formats: A list of strings representing the image formats to save
+        each plot in, from IMAGE_FORMATS.
+        dpi: An integer representing the resolution of PNG images in dots per
+        inch.
+        summarized: A Boolean representing whether to draw the SUMMARY_PLOTS
+        versions from the subreddit's cached plot_data.PlotData, which is
+        much faster for large subreddits.
+
+    Returns:
+        A list of strings representing the paths of the saved images, named
+        after the subreddit and the plot.
+    """
+    plots = list(PLOTS) if plots is None else plots
+    unknown = sorted(set(plots) - set(PLOTS)) + \
+        sorted(set(formats) - set(IMAGE_FORMATS))
+    if unknown:
+        raise ValueError(f'Unknown plots or image formats: {unknown}')
+    os.makedirs(directory, exist_ok=True)
+    data = {}
+    paths = []
+    for plot in plots:
+        if summarized:
+            plot_function, data_name = SUMMARY_PLOTS[plot], 'plot_data'
+        else:
+            plot_function, data_name = PLOTS[plot]
+        if data_name not in data:
+            if data_name == 'plot_data':
+                data[data_name] = load_plot_data(subreddit)
+            elif data_name == 'by_depth':
+                data[data_name] = analyze_subreddit_by_depth(subreddit)
+            else:
+                data[data_name] = \
+                    (analyze_subreddit_distribution(subreddit) or [{}])[0]
+        plt.figure()
+        figure = plot_function(subreddit, data[data_name], show=False)
+        try:
+            for image_format in formats:
+                path = os.path.join(directory,
+                                    f'{subreddit}_{plot}.{image_format}')
+                figure.savefig(path, dpi=dpi, bbox_inches='tight')
+                paths.append(path)
+        finally:
+            plt.close('all')
+    return paths
+
+
+def render_subreddits(subreddit_list, directory, plots=None,
+                      formats=('png',), dpi=100, workers=1, summarized=False):
+    """
+    Save plots of many subreddits' sentiment to image files, optionally in
+    parallel.
+
+    Args:
+        subreddit_list: A list of strings representing subreddit names.
+        directory: A string representing the directory to save images to.
+        plots: A list of strings representing names in PLOTS to save, or None
+        to save all of them.
+        formats: A list of strings representing the image formats to save
+        each plot in, from IMAGE_FORMATS.
+        dpi: An integer representing the resolution of PNG images.
+        workers: An integer representing the number of worker processes to
+        render with, one subreddit at a time each. They draw with the Agg
+        backend. 1 renders in the current process with its current backend.
+        summarized: A Boolean representing whether to draw from cached plot
+        data, as in render_subreddit.
+
+    Returns:
+        A dictionary mapping each subreddit to the list of paths of its saved
+        images.
+    """
+    arguments = [(subreddit, directory, plots, formats, dpi, summarized)
+                 for subreddit in subreddit_list]
+    if workers <= 1:
+        return {subreddit: render_subreddit(*subreddit_arguments) for
+                subreddit, subreddit_arguments in zip(subreddit_list,
+                                                      arguments)}
+    with ProcessPoolExecutor(workers,
+                             initializer=_init_render_worker) as pool:
+        futures = [pool.submit(render_subreddit, *subreddit_arguments)
+                   for subreddit_arguments in arguments]
+        return {subreddit: future.result() for subreddit, future in
+                zip(subreddit_list, futures)}
+
+
+def main(argv=None):
+    """
+    Save plots of subreddits from the command line, without a display.
+
+    Args:
+        argv: Optional list of strings representing command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Save plots of the '
+                                     'sentiment of subreddits to images.')
+    parser.add_argument('subreddits', nargs='+')
+    parser.add_argument('--directory', default='plots')
+    parser.add_argument('--plots', nargs='+', choices=list(PLOTS))
+    parser.add_argument('--formats', nargs='+', choices=IMAGE_FORMATS,
+                        default=['png'])
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--summarized', action='store_true',
+                        help='draw from cached plot data summaries')
+    args = parser.parse_args(argv)
+    plt.switch_backend('agg')
+    rendered = render_subreddits(args.subreddits, args.directory, args.plots,
+                                 args.formats, args.dpi, args.workers,
+                                 args.summarized)
+    for subreddit, paths in rendered.items():
+        print(f'{subreddit}: saved {len(paths)} images')
+
+
+if __name__ == '__main__':
+    main()
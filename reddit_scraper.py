@@ -1,53 +1,777 @@
 """
 Scrapes Reddit threads for data.
 """
+import asyncio
+import base64
+from collections import defaultdict, deque
+import json
+import os
+import time
 import praw
 import pandas as pd
+from comment_forest import strip_fullname
+import storage
 
+USER_AGENT = 'Comment Scraper by u/sentiment-analyses'
 
-def scrape_reddit_comments(account_id, account_secret, subreddit_list):
+# Reddit API endpoints used by RedditAPI. Point them at a local server to
+# scrape offline.
+API_URL = 'https://oauth.reddit.com'
+TOKEN_URL = 'https://www.reddit.com/api/v1/access_token'
+
+# Requests per minute allowed for an OAuth client.
+REQUESTS_PER_MINUTE = 100
+
+# Largest number of comment ids Reddit expands per morechildren request, and
+# largest number of submissions per listing page.
+MORE_CHILDREN_LIMIT = 100
+LISTING_LIMIT = 100
+
+COMMENT_COLUMNS = ['comment_id', 'comment_parent_id', 'comment_body',
+                   'comment_link_id']
+
+
+def scrape_reddit_comments(account_id, account_secret, subreddit_list,
+                           fmt=None, batch_size=10000):
     """
     Accesses an instance of Reddit and scrapes the comments from the top post
     of each subreddit in subreddit_list.
 
+    Comments are written in batches through a CommentSink, so an interrupted
+    scrape skips the posts it already finished when run again.
+
     Args:
         account_id: String representing the client ID used to access the Reddit
                     app.
         account_secret: String representing the client secret to access the
                         Reddit app.
+        subreddit_list: List of strings representing subreddits to scrape.
+        fmt: Optional string representing the storage format to write, 'csv'
+            or 'parquet'. Defaults to storage.DEFAULT_FORMAT.
+        batch_size: Integer representing the most rows written at once.
 
     Returns:
-        Does not return anything. However, it writes the comments data to CSV
-        files.
+        Does not return anything. However, it writes the comments data to
+        files in the rawdata directory.
     """
     # Access API
     reddit = praw.Reddit(client_id=account_id,      # Enter client ID
                          client_secret=account_secret,  # Enter client secret
-                         user_agent='Comment Scraper by u/sentiment-analyses',
+                         user_agent=USER_AGENT,
                          username='',
                          password='')
 
     for sub in subreddit_list:
-        subreddit = reddit.subreddit(sub)
-
-        # Create dictionary for all comments
-        comments_dict = {
-            'comment_id': [],
-            'comment_parent_id': [],
-            'comment_body': [],
-            'comment_link_id': []
-        }
-
-        # Selects single top post of all time from subreddit
-        for submission in subreddit.top(limit=1):
-            submission.comments.replace_more()
-            for comment in submission.comments.list():
-                # Add comment information to dictionary
-                comments_dict['comment_id'].append(comment.id)
-                comments_dict['comment_parent_id'].append(comment.parent_id)
-                comments_dict['comment_body'].append(comment.body)
-                comments_dict['comment_link_id'].append(comment.link_id)
-
-        # Create DataFrame from comments dictionary and save it to a CSV file
-        post_comments = pd.DataFrame(comments_dict)
-        post_comments.to_csv('./rawdata/' + sub + '_comments.csv')
+        with CommentSink(sub, fmt, batch_size) as sink:
+            # Selects single top post of all time from subreddit
+            if sink.submission_ids is None:
+                sink.start([submission.id for submission in
+                            reddit.subreddit(sub).top(limit=1)])
+
+            for submission_id in sink.unfinished():
+                submission = reddit.submission(id=submission_id)
+                submission.comments.replace_more()
+                rows = []
+                for comment in submission.comments.list():
+                    # Add comment information to the next batch
+                    rows.append((comment.id, comment.parent_id, comment.body,
+                                 comment.link_id))
+                    if len(rows) == batch_size:
+                        sink.write(rows)
+                        rows = []
+                sink.write(rows)
+                sink.finish(submission_id)
+
+
+class RateLimiter:
+    """
+    Token bucket that spaces out requests to stay under an API rate limit.
+
+    Up to burst requests may be made at once, after which requests are let
+    through at requests_per_minute. The limiter also pauses entirely when
+    the server reports that the limit is used up.
+
+    Attributes:
+        rate: Float representing the number of requests allowed per second.
+        burst: Integer representing the number of requests that can be made
+            back to back.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, burst=10,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        """
+        Start with a full bucket.
+
+        Args:
+            requests_per_minute: Number representing the sustained request
+                rate.
+            burst: Integer representing the size of the bucket.
+            clock: Function returning the current time in seconds.
+            sleep: Coroutine function that waits a number of seconds.
+        """
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._resume_at = self._updated
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """
+        Add the tokens earned since the bucket was last updated.
+        """
+        now = self._clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Wait until a request can be made, then take a token for it.
+        """
+        async with self._lock:
+            while self._clock() < self._resume_at:
+                await self._sleep(self._resume_at - self._clock())
+            self._refill()
+            if self._tokens < 1:
+                await self._sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def pause(self, seconds):
+        """
+        Hold back every request for a number of seconds.
+
+        Args:
+            seconds: Number representing how long to pause for.
+        """
+        self._resume_at = max(self._resume_at, self._clock() + seconds)
+
+    def update(self, headers):
+        """
+        Pause until the rate limit resets if the server reports it used up.
+
+        Args:
+            headers: Mapping of response headers, including Reddit's
+                X-Ratelimit-Remaining and X-Ratelimit-Reset.
+        """
+        try:
+            remaining = float(headers['X-Ratelimit-Remaining'])
+            reset = float(headers['X-Ratelimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        if remaining < 1:
+            self.pause(reset)
+
+
+class RedditAPI:
+    """
+    Asynchronous client for the read-only parts of the Reddit API.
+
+    Use as an async context manager. Any object with an async get(path,
+    params) method returning decoded JSON can stand in for this class in
+    scrape_subreddits, so scraping can be tested without a network.
+
+    Attributes:
+        api_url: String representing the base URL of API requests.
+        token_url: String representing the URL used to get access tokens.
+        rate_limiter: RateLimiter shared by every request.
+        max_retries: Integer representing how many times a rate limited or
+            failed request is retried.
+    """
+
+    def __init__(self, client_id, client_secret, user_agent=USER_AGENT,
+                 api_url=API_URL, token_url=TOKEN_URL, max_requests=8,
+                 rate_limiter=None, max_retries=3, session=None):
+        """
+        Prepare a client. No requests are made until the first get.
+
+        Args:
+            client_id: String representing the client ID of the Reddit app.
+            client_secret: String representing the client secret of the
+                Reddit app.
+            user_agent: String sent as the User-Agent of every request.
+            api_url: String representing the base URL of API requests.
+            token_url: String representing the URL used to get access
+                tokens.
+            max_requests: Integer representing the most requests that can
+                be waiting on the server at once.
+            rate_limiter: Optional RateLimiter. Defaults to one allowing
+                REQUESTS_PER_MINUTE.
+            max_retries: Integer representing how many times a rate limited
+                or failed request is retried.
+            session: Optional aiohttp.ClientSession to make requests with.
+                By default a session is opened and closed with the client.
+        """
+        self.api_url = api_url.rstrip('/')
+        self.token_url = token_url
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self._credentials = (client_id, client_secret)
+        self._user_agent = user_agent
+        self._requests = asyncio.Semaphore(max_requests)
+        self._session = session
+        self._owns_session = session is None
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': self._user_agent})
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _authorization(self):
+        """
+        Get an application-only access token, reusing it until it expires.
+
+        Returns:
+            A string representing the Authorization header value.
+        """
+        async with self._token_lock:
+            if self._token is None or time.monotonic() >= self._token_expires:
+                credentials = base64.b64encode(
+                    ':'.join(self._credentials).encode()).decode()
+                async with self._session.post(
+                        self.token_url,
+                        data={'grant_type': 'client_credentials'},
+                        headers={'Authorization': 'Basic ' + credentials,
+                                 'User-Agent': self._user_agent}) as response:
+                    response.raise_for_status()
+                    token = await response.json()
+                self._token = token['access_token']
+                # Renew a minute early so no request carries a stale token.
+                self._token_expires = time.monotonic() + \
+                    token.get('expires_in', 3600) - 60
+            return 'bearer ' + self._token
+
+    async def get(self, path, params=None):
+        """
+        Make a GET request to the API, waiting for the rate limit.
+
+        Rate limited (429) and server error responses are retried after the
+        wait the server asks for, and an expired token is renewed.
+
+        Args:
+            path: String representing the path of the endpoint, such as
+                '/r/politics/top'.
+            params: Optional dictionary of string query parameters.
+
+        Returns:
+            The decoded JSON response.
+        """
+        params = dict(params or {}, raw_json='1')
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            async with self._requests:
+                headers = {'Authorization': await self._authorization(),
+                           'User-Agent': self._user_agent}
+                async with self._session.get(self.api_url + path,
+                                             params=params,
+                                             headers=headers) as response:
+                    self.rate_limiter.update(response.headers)
+                    if attempt < self.max_retries:
+                        if response.status == 401:
+                            self._token = None
+                            continue
+                        if response.status == 429 or response.status >= 500:
+                            self.rate_limiter.pause(float(
+                                response.headers.get('Retry-After',
+                                                     2 ** attempt)))
+                            continue
+                    response.raise_for_status()
+                    return await response.json()
+
+
+async def fetch_top_submissions(client, subreddit, limit):
+    """
+    Find the ids of a subreddit's top posts of all time.
+
+    Args:
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        subreddit: String representing the name of the subreddit.
+        limit: Integer representing the number of posts to find.
+
+    Returns:
+        List of strings containing the bare id of each post, best first.
+    """
+    submission_ids = []
+    after = None
+    while len(submission_ids) < limit:
+        params = {'t': 'all',
+                  'limit': str(min(LISTING_LIMIT,
+                                   limit - len(submission_ids)))}
+        if after is not None:
+            params['after'] = after
+        listing = await client.get(f'/r/{subreddit}/top', params)
+        submission_ids += [child['data']['id'] for child in
+                           listing['data']['children']]
+        after = listing['data'].get('after')
+        if after is None:
+            break
+    return submission_ids[:limit]
+
+
+def _collect_comments(things, comments):
+    """
+    Record the comments in a list of API things, including nested replies.
+
+    Args:
+        things: List of dictionaries representing t1 (comment) and more
+            things from a comment listing or morechildren response.
+        comments: Dictionary mapping comment ids to their COMMENT_COLUMNS
+            values, added to in place.
+
+    Returns:
+        A tuple of two lists of strings: the ids of unloaded comments that
+        can be expanded with morechildren, and the ids of comments whose
+        deeper replies must be loaded as a separate thread.
+    """
+    more_ids = []
+    continued = []
+    stack = list(reversed(things))
+    while stack:
+        thing = stack.pop()
+        data = thing['data']
+        if thing['kind'] == 'more':
+            if data['children']:
+                more_ids += data['children']
+            elif data.get('count', 0) or data.get('id') == '_':
+                continued.append(strip_fullname(data['parent_id']))
+            continue
+        if data['id'] not in comments:
+            comments[data['id']] = (data['id'], data['parent_id'],
+                                    data['body'], data['link_id'])
+        if data.get('replies'):
+            stack += reversed(data['replies']['data']['children'])
+    return more_ids, continued
+
+
+def _breadth_first(comments, submission_id):
+    """
+    Order comments by depth, the way PRAW lists a comment forest.
+
+    Args:
+        comments: Dictionary mapping comment ids to their COMMENT_COLUMNS
+            values.
+        submission_id: String representing the bare id of the post.
+
+    Returns:
+        List of COMMENT_COLUMNS tuples, top level comments first. Comments
+        whose parent was not loaded are placed at the end.
+    """
+    children = defaultdict(list)
+    for comment in comments.values():
+        children[strip_fullname(comment[1])].append(comment[0])
+    ordered = []
+    queue = deque(children.get(submission_id, []))
+    while queue:
+        comment_id = queue.popleft()
+        ordered.append(comments[comment_id])
+        queue.extend(children.get(comment_id, []))
+    if len(ordered) < len(comments):
+        placed = {comment[0] for comment in ordered}
+        ordered += [comment for comment_id, comment in comments.items()
+                    if comment_id not in placed]
+    return ordered
+
+
+async def iter_submission_comments(client, submission_id, pending=None):
+    """
+    Load the comments on a post a round of requests at a time.
+
+    The first round loads the post's comment page. Each later round sends
+    every request for the collapsed replies found so far at once, rather
+    than one after another.
+
+    Args:
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        submission_id: String representing the id of the post, with or
+            without a t3_ prefix.
+        pending: Optional dictionary of collapsed replies still to expand,
+            as yielded by an earlier, interrupted call. The comment page is
+            not loaded again when it is given.
+
+    Yields:
+        Tuples of a list of COMMENT_COLUMNS tuples for the comments loaded
+        in each round, and a dictionary of the collapsed replies still to
+        expand after it, with lists 'more', 'continued' and 'requested'.
+    """
+    submission_id = strip_fullname(submission_id)
+    path = f'/comments/{submission_id}'
+    loaded = set()
+    if pending is None:
+        comments = {}
+        _, listing = await client.get(path, {'limit': '500'})
+        more_ids, continued = _collect_comments(listing['data']['children'],
+                                                comments)
+        requested = set()
+        loaded.update(comments)
+        yield _breadth_first(comments, submission_id), \
+            _pending_replies(more_ids, continued, requested)
+    else:
+        more_ids = list(pending['more'])
+        continued = list(pending['continued'])
+        requested = set(pending['requested'])
+    while more_ids or continued:
+        more_ids = [comment_id for comment_id in dict.fromkeys(more_ids)
+                    if comment_id not in loaded]
+        continued = [comment_id for comment_id in dict.fromkeys(continued)
+                     if comment_id not in requested]
+        requested.update(continued)
+        batches = [more_ids[start:start + MORE_CHILDREN_LIMIT] for start in
+                   range(0, len(more_ids), MORE_CHILDREN_LIMIT)]
+        responses = await asyncio.gather(
+            *[client.get('/api/morechildren',
+                         {'api_type': 'json', 'link_id': 't3_' + submission_id,
+                          'children': ','.join(batch)}) for batch in batches],
+            *[client.get(path, {'comment': comment_id, 'limit': '500'})
+              for comment_id in continued])
+        comments = {}
+        more_ids, continued = [], []
+        for response in responses:
+            if isinstance(response, list):
+                things = response[1]['data']['children']
+            else:
+                things = response['json']['data']['things']
+            round_more_ids, round_continued = _collect_comments(things,
+                                                                comments)
+            more_ids += round_more_ids
+            continued += round_continued
+        comments = {comment_id: comment for comment_id, comment in
+                    comments.items() if comment_id not in loaded}
+        loaded.update(comments)
+        yield _breadth_first(comments, submission_id), \
+            _pending_replies(more_ids, continued, requested)
+
+
+def _pending_replies(more_ids, continued, requested):
+    """
+    Describe the collapsed replies still to expand, for a checkpoint.
+
+    Args:
+        more_ids: List of strings of comment ids to expand with
+            morechildren.
+        continued: List of strings of comment ids whose replies are loaded
+            as a separate thread.
+        requested: Set of strings of comment ids whose threads have already
+            been loaded.
+
+    Returns:
+        A JSON serializable dictionary of the three lists.
+    """
+    return {'more': list(more_ids), 'continued': list(continued),
+            'requested': sorted(requested)}
+
+
+async def fetch_submission_comments(client, submission_id):
+    """
+    Load every comment on a post, expanding all collapsed replies.
+
+    Args:
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        submission_id: String representing the id of the post, with or
+            without a t3_ prefix.
+
+    Returns:
+        List of COMMENT_COLUMNS tuples in breadth-first order.
+    """
+    comments = {}
+    async for rows, _ in iter_submission_comments(client, submission_id):
+        comments.update((row[0], row) for row in rows)
+    return _breadth_first(comments, strip_fullname(submission_id))
+
+
+class CommentSink:
+    """
+    Write a subreddit's scraped comments in batches, checkpointing progress.
+
+    Rows go to the storage layer as soon as they are scraped, so memory use
+    does not grow with the size of a thread. A checkpoint file next to the
+    raw data records the posts to scrape, the posts that are finished, and
+    the collapsed replies each unfinished post still has to expand. Opening
+    a sink for a subreddit with a checkpoint resumes that scrape: rows are
+    appended to the existing file, comments already in it are skipped, and
+    finished posts are not loaded again. The checkpoint is removed once
+    every post is finished.
+
+    Parquet files can only be read once they are closed, so a scrape that
+    must survive the process being killed should be written as CSV.
+
+    Attributes:
+        subreddit: String representing the name of the subreddit.
+        path: String representing the path of the raw data file.
+        checkpoint_path: String representing the path of the checkpoint.
+        batch_size: Integer representing the most rows written at once.
+        submission_ids: List of strings containing the id of every post to
+            scrape, or None until start is called.
+        seen: Set of strings containing the id of every comment written.
+        resumed: Boolean representing whether an earlier scrape was resumed.
+    """
+
+    def __init__(self, subreddit, fmt=None, batch_size=10000):
+        """
+        Open the raw data file, resuming from a checkpoint if one exists.
+
+        Args:
+            subreddit: String representing the name of the subreddit.
+            fmt: Optional string representing the storage format of a new
+                scrape. A resumed scrape keeps its format.
+            batch_size: Integer representing the most rows written at once.
+        """
+        self.subreddit = subreddit
+        self.batch_size = batch_size
+        self.checkpoint_path = storage.checkpoint_path(subreddit)
+        self.seen = set()
+        self.resumed = os.path.isfile(self.checkpoint_path)
+        if self.resumed:
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            self.path = checkpoint['path']
+            self.submission_ids = checkpoint['submission_ids']
+            self._finished = set(checkpoint['finished'])
+            self._pending = checkpoint['pending']
+            self._writer = self._reopen()
+        else:
+            self.path = storage.raw_path(subreddit,
+                                         fmt or storage.DEFAULT_FORMAT)
+            self.submission_ids = None
+            self._finished = set()
+            self._pending = {}
+            self._writer = storage.CommentWriter(self.path)
+
+    def _reopen(self):
+        """
+        Reopen the raw data file of an interrupted scrape.
+
+        Returns:
+            A storage.CommentWriter that adds to the existing rows.
+        """
+        if not os.path.isfile(self.path):
+            return storage.CommentWriter(self.path)
+        if self.path.endswith(storage.FORMATS['parquet']):
+            # Parquet files cannot be appended to, so the rows written so
+            # far are carried over into a new file.
+            existing = storage.read_comments(self.path)
+            writer = storage.CommentWriter(self.path)
+            writer.write(existing)
+        else:
+            existing = storage.read_comments(self.path, ['comment_id'])
+            writer = storage.CommentWriter(self.path, append=True)
+        self.seen.update(existing['comment_id'].dropna())
+        return writer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(finished=exc_type is None)
+
+    def save(self):
+        """
+        Write the checkpoint, replacing the previous one in a single step.
+        """
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump({'path': self.path,
+                       'submission_ids': self.submission_ids,
+                       'finished': sorted(self._finished),
+                       'pending': self._pending}, checkpoint_file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def start(self, submission_ids):
+        """
+        Record the posts to scrape.
+
+        Args:
+            submission_ids: List of strings representing post ids.
+        """
+        self.submission_ids = list(submission_ids)
+        self.save()
+
+    def unfinished(self):
+        """
+        Find the posts that still have to be scraped.
+
+        Returns:
+            List of strings containing post ids, in the order they were
+            recorded.
+        """
+        return [submission_id for submission_id in self.submission_ids
+                if submission_id not in self._finished]
+
+    def pending(self, submission_id):
+        """
+        Find the collapsed replies a post still has to expand.
+
+        Args:
+            submission_id: String representing the id of the post.
+
+        Returns:
+            A dictionary as yielded by iter_submission_comments, or None if
+            the post has not been started.
+        """
+        return self._pending.get(submission_id)
+
+    def write(self, rows):
+        """
+        Write comments that have not been written before.
+
+        Args:
+            rows: List of COMMENT_COLUMNS tuples.
+        """
+        new_rows = []
+        for row in rows:
+            if row[0] not in self.seen:
+                self.seen.add(row[0])
+                new_rows.append(row)
+        for start in range(0, len(new_rows), self.batch_size):
+            self._writer.write(pd.DataFrame(
+                new_rows[start:start + self.batch_size],
+                columns=COMMENT_COLUMNS))
+
+    def record_pending(self, submission_id, pending):
+        """
+        Checkpoint the collapsed replies a post still has to expand.
+
+        Call after writing the rows loaded before them.
+
+        Args:
+            submission_id: String representing the id of the post.
+            pending: Dictionary as yielded by iter_submission_comments.
+        """
+        self._pending[submission_id] = pending
+        self.save()
+
+    def finish(self, submission_id):
+        """
+        Checkpoint a post as completely scraped.
+
+        Args:
+            submission_id: String representing the id of the post.
+        """
+        self._finished.add(submission_id)
+        self._pending.pop(submission_id, None)
+        self.save()
+
+    def close(self, finished=True):
+        """
+        Close the raw data file, and remove the checkpoint if every post is
+        finished.
+
+        Args:
+            finished: Boolean representing whether the scrape ended without
+                an error.
+        """
+        if self._writer.rows_written == 0 and not os.path.isfile(self.path):
+            self._writer.write(pd.DataFrame(columns=COMMENT_COLUMNS))
+        self._writer.close()
+        if finished and self.submission_ids is not None and \
+                not self.unfinished() and \
+                os.path.isfile(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+async def scrape_subreddits(client, subreddit_list, posts_per_subreddit=1,
+                            max_submissions=8, fmt=None, batch_size=10000):
+    """
+    Scrape the comments from the top posts of many subreddits concurrently.
+
+    Every subreddit and post is scraped at the same time, up to
+    max_submissions posts at once, with the client keeping requests under
+    the rate limit. Comments are written as each round of requests returns,
+    through a CommentSink, so an interrupted scrape resumes where it
+    stopped when run again.
+
+    Args:
+        client: RedditAPI, or any object with an async get(path, params)
+            method.
+        subreddit_list: List of strings representing subreddits to scrape.
+        posts_per_subreddit: Integer representing the number of top posts
+            of all time to scrape from each subreddit.
+        max_submissions: Integer representing the most posts that can be
+            loading at once.
+        fmt: Optional string representing the storage format to write,
+            'csv' or 'parquet'. Defaults to storage.DEFAULT_FORMAT.
+        batch_size: Integer representing the most rows written at once.
+
+    Returns:
+        A dictionary mapping each subreddit to the number of comments in
+        its raw data file. The comments are written to files in the rawdata
+        directory.
+    """
+    submissions = asyncio.Semaphore(max_submissions)
+
+    async def scrape_submission(sink, submission_id):
+        async with submissions:
+            async for rows, pending in iter_submission_comments(
+                    client, submission_id, sink.pending(submission_id)):
+                sink.write(rows)
+                sink.record_pending(submission_id, pending)
+            sink.finish(submission_id)
+
+    async def scrape_subreddit(subreddit):
+        with CommentSink(subreddit, fmt, batch_size) as sink:
+            if sink.submission_ids is None:
+                sink.start(await fetch_top_submissions(client, subreddit,
+                                                       posts_per_subreddit))
+            await asyncio.gather(*[scrape_submission(sink, submission_id)
+                                   for submission_id in sink.unfinished()])
+        return len(sink.seen)
+
+    counts = await asyncio.gather(*[scrape_subreddit(subreddit)
+                                    for subreddit in subreddit_list])
+    return dict(zip(subreddit_list, counts))
+
+
+def scrape_reddit_comments_concurrently(account_id, account_secret,
+                                        subreddit_list, posts_per_subreddit=1,
+                                        max_submissions=8,
+                                        requests_per_minute=REQUESTS_PER_MINUTE,
+                                        fmt=None, batch_size=10000):
+    """
+    Scrape the comments from the top posts of many subreddits concurrently.
+
+    Writes the same files as scrape_reddit_comments, but overlaps the
+    requests for different subreddits and posts instead of waiting on each
+    one in turn. Requires aiohttp.
+
+    Args:
+        account_id: String representing the client ID used to access the
+            Reddit app.
+        account_secret: String representing the client secret to access the
+            Reddit app.
+        subreddit_list: List of strings representing subreddits to scrape.
+        posts_per_subreddit: Integer representing the number of top posts
+            of all time to scrape from each subreddit.
+        max_submissions: Integer representing the most posts that can be
+            loading at once.
+        requests_per_minute: Number representing the most requests to make
+            per minute.
+        fmt: Optional string representing the storage format to write.
+        batch_size: Integer representing the most rows written at once.
+
+    Returns:
+        A dictionary mapping each subreddit to the number of comments in
+        its raw data file.
+    """
+    async def scrape():
+        async with RedditAPI(account_id, account_secret,
+                             rate_limiter=RateLimiter(requests_per_minute)) \
+                as client:
+            return await scrape_subreddits(client, subreddit_list,
+                                           posts_per_subreddit,
+                                           max_submissions, fmt, batch_size)
+    return asyncio.run(scrape())
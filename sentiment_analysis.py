@@ -1,17 +1,55 @@
 """
 Analyze sentiment of a comment forest.
 """
-from collections import defaultdict
+import atexit
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import hashlib
+import heapq
+import math
+import os
+import re
+import threading
 from nltk.sentiment.vader import SentimentIntensityAnalyzer as SIA
+import numpy as np
 import pandas as pd
-import nltk
-nltk.download('vader_lexicon')
+from comment_forest import CommentForest
+import nltk_resources
+import storage
+from token_store import TokenizedCorpus, load_corpus
+
+# Shared VADER analyzer and FastVader scorer, created on first use by
+# get_analyzer() and get_fast_scorer()
+_ANALYZER = None
+_FAST_VADER = None
+_ANALYZER_LOCK = threading.Lock()
+
+# Shared PolarityCache, created on first use by get_polarity_cache(), and
+# digest of the lexicon its scores were calculated with
+_POLARITY_CACHE = None
+_LEXICON_FINGERPRINT = None
+_POLARITY_CACHE_LOCK = threading.Lock()
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# Largest difference between a FastVader compound score and NLTK's. Both
+# apply the same arithmetic in the same order, so scores are identical; the
+# tolerance only allows for rounding in other NLTK versions.
+FAST_VADER_TOLERANCE = 1e-9
+
+# Sentences of word characters and whitespace only, as cleaning produces.
+_PLAIN_SENTENCE = re.compile(r'[\w\s]*')
 
 
 def find_replies(comment_df, comment_id):
     """
     Find all child replies to a comment.
 
+    Parent ids are compared exactly once their t1_/t3_ prefixes are
+    stripped. To look up replies for many comments, build a CommentForest
+    once and use its replies method instead.
+
     Args:
         comment_df: DataFrame containing, at minimum, comment_id and
             comment_parent_id data.
@@ -20,8 +58,25 @@ def find_replies(comment_df, comment_id):
     Returns:
         List of strings containing comment_id values for child replies.
     """
-    return comment_df['comment_id'][comment_df['comment_parent_id'].str
-                                    .contains(comment_id)].tolist()
+    parent_ids = comment_df['comment_parent_id'].astype(str).str.replace(
+        r'^t[13]_', '', regex=True)
+    return comment_df['comment_id'][parent_ids == comment_id].tolist()
+
+
+def as_forest(comment_df):
+    """
+    Return the CommentForest for a thread, building it if necessary.
+
+    Args:
+        comment_df: DataFrame containing, at minimum, comment_id and
+            comment_parent_id data, or an existing CommentForest.
+
+    Returns:
+        A CommentForest for the thread.
+    """
+    if isinstance(comment_df, CommentForest):
+        return comment_df
+    return CommentForest.from_dataframe(comment_df)
 
 
 def create_reply_dict(comment_df, comment):
@@ -30,7 +85,7 @@ def create_reply_dict(comment_df, comment):
 
     Args:
         comment_df: DataFrame containing, at minimum, comment_id and
-            comment_parent_id data.
+            comment_parent_id data, or a CommentForest built from it.
         comment: A string representing the cleaned contents of the parent comment.
 
     Returns:
@@ -38,32 +93,11 @@ def create_reply_dict(comment_df, comment):
             values are lists of strings containing the comment texts at that
             depth.
     """
-    comments_by_depth = defaultdict(list)
-    comments_by_depth[0].append(comment)
-
-    def build_depth_dict(depth, comment_id_of_parent):
-        """
-        For a comment and all its child comments, map each comment to its depth.
-
-        Args:
-            depth: Integer representing the depth of the comment, with the
-                highest-level comment having depth = 1.
-            comment_id_of_parent: String representing comment_id for the parent
-                                comment.
-
-        Assumptions:
-            There exists a dictionary with integer keys and list values.
-            This function is called within the scope of that dictionary.
-        """
-        replies = find_replies(comment_df, comment_id_of_parent)
-        if len(replies) == 0:
-            return
-        comments_by_depth[depth] += replies
-        for reply_id in replies:
-            build_depth_dict(depth + 1, reply_id)
-
-    build_depth_dict(1, comment)
-    return dict(comments_by_depth)
+    forest = as_forest(comment_df)
+    comments_by_depth = {0: [comment]}
+    for depth, replies in enumerate(forest.levels(comment), start=1):
+        comments_by_depth[depth] = replies
+    return comments_by_depth
 
 
 def get_most_replied_comments(reply_dicts):
@@ -78,13 +112,62 @@ def get_most_replied_comments(reply_dicts):
         A list of comment_dict(s) for the comment(s) with the greatest number
             of replies.
     """
-    max_depth = 0
-    for comment_dict in reply_dicts:
-        if max(comment_dict.keys()) > max_depth:
-            max_depth = max(comment_dict.keys())
+    depths = [max(comment_dict.keys()) for comment_dict in reply_dicts]
+    max_depth = max(depths, default=0)
+
+    return [comment_dict for comment_dict, depth in zip(reply_dicts, depths)
+            if depth == max_depth]
+
+
+def get_analyzer():
+    """
+    Return the shared VADER analyzer, loading the lexicon on first use.
+
+    The analyzer only reads its lexicon after construction, so a single
+    instance can safely be shared between threads.
+
+    Returns:
+        A SentimentIntensityAnalyzer.
+    """
+    if _ANALYZER is None:
+        with _ANALYZER_LOCK:
+            _load_analyzer()
+    return _ANALYZER
+
+
+def _load_analyzer():
+    """
+    Create the shared VADER analyzer if it does not exist yet.
+
+    Call with _ANALYZER_LOCK held.
+
+    Returns:
+        A SentimentIntensityAnalyzer.
+    """
+    global _ANALYZER
+    if _ANALYZER is None:
+        nltk_resources.ensure('vader_lexicon')
+        _ANALYZER = SIA()
+    return _ANALYZER
 
-    return [comment_dict for comment_dict in reply_dicts if
-            max(comment_dict.keys()) == max_depth]
+
+def split_tokenized_comment(tokenized_comment):
+    """
+    Split a cleaned comment into its sentences.
+
+    Args:
+        tokenized_comment: A string with sentences separated by backslashes,
+            a list of sentence strings, or NaN for an empty comment.
+
+    Returns:
+        A list of strings representing the sentences of the comment.
+    """
+    if isinstance(tokenized_comment, str):
+        return tokenized_comment.split('\\')
+    if isinstance(tokenized_comment, (list, tuple)):
+        return list(tokenized_comment)
+    # Invalid comments (NaN) have no sentences
+    return []
 
 
 def analyze_sentiment(comment_body):
@@ -101,12 +184,11 @@ def analyze_sentiment(comment_body):
         A float representing the average compound polarity score for the
         comment.
     """
-    sia = SIA()
+    cache = get_polarity_cache()
     results = []
 
     for sentence in comment_body:
-        pol_score = sia.polarity_scores(sentence)
-        results.append(pol_score['compound'])
+        results.append(cache.get(sentence, _vader_compound))
 
     try:
         return sum(results) / len(results)
@@ -114,7 +196,557 @@ def analyze_sentiment(comment_body):
         return 0
 
 
-def avg_depth_sentiment(comment_df, depth, comments_by_depth):
+def _vader_compound(sentence):
+    """
+    Calculate the compound polarity score of a sentence with NLTK's VADER.
+
+    Args:
+        sentence: String representing a sentence.
+
+    Returns:
+        A float representing the compound score.
+    """
+    return get_analyzer().polarity_scores(sentence)['compound']
+
+
+def analyze_sentiments(tokenized_comments, scorer='fast'):
+    """
+    Calculate the average sentiment of many comments at once.
+
+    Args:
+        tokenized_comments: An iterable or Series of comments, each either a
+            string with sentences separated by backslashes or a list of
+            sentence strings, or a TokenizedCorpus. Invalid comments (NaN)
+            and comments without sentences score 0.
+        scorer: String representing the scoring engine, 'fast' for
+            FastVader or 'vader' for NLTK's analyzer. Both give the same
+            scores, to within FAST_VADER_TOLERANCE.
+
+    Returns:
+        A NumPy array of floats representing the average compound polarity
+        score of each comment, in input order.
+    """
+    if scorer == 'fast':
+        if isinstance(tokenized_comments, TokenizedCorpus):
+            return get_fast_scorer().score_corpus(tokenized_comments)
+        return get_fast_scorer().score_comments(tokenized_comments)
+    if scorer != 'vader':
+        raise ValueError(f'Unknown scorer: {scorer}')
+    return np.fromiter((analyze_sentiment(split_tokenized_comment(comment))
+                        for comment in tokenized_comments), dtype=float)
+
+
+class FastVader:
+    """
+    Compound scorer for cleaned sentences that gives the same scores as
+    VADER.
+
+    NLTK's polarity_scores rebuilds a punctuation lookup for every sentence
+    and applies capitalization and punctuation rules that cannot change the
+    score of cleaned text, which is lowercase words separated by spaces.
+    This scorer reads the lexicon, booster, negation and idiom tables from
+    the shared analyzer once, skips sentences with no lexicon words, and
+    applies VADER's word rules only around the words that carry sentiment.
+    Sentences with capitals or punctuation, such as URLs and prices kept by
+    cleaning, are passed to NLTK, so every sentence scores within
+    FAST_VADER_TOLERANCE of VADER's compound score.
+
+    Attributes:
+        analyzer: SentimentIntensityAnalyzer whose tables are used.
+        lexicon: Dictionary mapping lowercase words to their valence.
+        boosters: Dictionary mapping booster and dampener words to their
+            scalar.
+        negations: Set of strings containing negation words.
+        idioms: Dictionary mapping idioms to their valence.
+    """
+
+    def __init__(self, analyzer=None):
+        """
+        Read the lookup tables from an analyzer.
+
+        Args:
+            analyzer: Optional SentimentIntensityAnalyzer. Defaults to the
+                shared analyzer from get_analyzer().
+        """
+        self.analyzer = get_analyzer() if analyzer is None else analyzer
+        constants = self.analyzer.constants
+        self.lexicon = self.analyzer.lexicon
+        self.boosters = constants.BOOSTER_DICT
+        self.negations = frozenset(constants.NEGATE)
+        self.idioms = constants.SPECIAL_CASE_IDIOMS
+        self._negation_scalar = constants.N_SCALAR
+        self._dampener = constants.B_DECR
+        # Words of multiword idioms and boosters. The idiom rules can only
+        # change a valence when one of them is nearby.
+        self._phrase_words = frozenset(
+            word for phrase in list(self.idioms) + list(self.boosters)
+            if ' ' in phrase for word in phrase.split())
+
+    def _negated(self, word):
+        """
+        Check whether a lowercase word negates the words after it.
+        """
+        return word in self.negations or "n't" in word
+
+    def _never_check(self, valence, words, start_i, i):
+        """
+        Apply VADER's negation rules to the valence of words[i].
+        """
+        if start_i == 0:
+            if self._negated(words[i - 1]):
+                valence = valence * self._negation_scalar
+        elif start_i == 1:
+            if words[i - 2] == 'never' and words[i - 1] in ('so', 'this'):
+                valence = valence * 1.5
+            elif self._negated(words[i - 2]):
+                valence = valence * self._negation_scalar
+        else:
+            if words[i - 3] == 'never' and words[i - 2] in ('so', 'this') \
+                    or words[i - 1] in ('so', 'this'):
+                valence = valence * 1.25
+            elif self._negated(words[i - 3]):
+                valence = valence * self._negation_scalar
+        return valence
+
+    def _idioms_check(self, valence, words, i):
+        """
+        Apply VADER's idiom and booster bigram rules to words[i].
+        """
+        if self._phrase_words.isdisjoint(words[i - 3:i + 3]):
+            return valence
+        idioms = self.idioms
+        two_one = f'{words[i - 2]} {words[i - 1]}'
+        three_two = f'{words[i - 3]} {words[i - 2]}'
+        for sequence in (f'{words[i - 1]} {words[i]}',
+                         f'{two_one} {words[i]}', two_one,
+                         f'{words[i - 3]} {two_one}', three_two):
+            if sequence in idioms:
+                valence = idioms[sequence]
+                break
+        if len(words) - 1 > i:
+            sequence = f'{words[i]} {words[i + 1]}'
+            if sequence in idioms:
+                valence = idioms[sequence]
+        if len(words) - 1 > i + 1:
+            sequence = f'{words[i]} {words[i + 1]} {words[i + 2]}'
+            if sequence in idioms:
+                valence = idioms[sequence]
+        if three_two in self.boosters or two_one in self.boosters:
+            valence = valence + self._dampener
+        return valence
+
+    def _valence(self, words, i):
+        """
+        Find the valence of the lexicon word words[i] in its context.
+
+        Args:
+            words: List of strings representing the words of a sentence.
+            i: Integer representing the position of a lexicon word.
+
+        Returns:
+            A float representing the valence of the word.
+        """
+        lexicon = self.lexicon
+        valence = lexicon[words[i]]
+        for start_i in range(3):
+            if i > start_i and words[i - (start_i + 1)] not in lexicon:
+                scalar = self.boosters.get(words[i - (start_i + 1)], 0.0)
+                if scalar:
+                    if valence < 0:
+                        scalar *= -1
+                    if start_i == 1:
+                        scalar = scalar * 0.95
+                    elif start_i == 2:
+                        scalar = scalar * 0.9
+                valence = valence + scalar
+                valence = self._never_check(valence, words, start_i, i)
+                if start_i == 2:
+                    valence = self._idioms_check(valence, words, i)
+        if i > 1 and words[i - 1] not in lexicon and words[i - 1] == 'least':
+            if words[i - 2] != 'at' and words[i - 2] != 'very':
+                valence = valence * self._negation_scalar
+        elif i > 0 and words[i - 1] not in lexicon and \
+                words[i - 1] == 'least':
+            valence = valence * self._negation_scalar
+        return valence
+
+    def compound(self, sentence):
+        """
+        Calculate the compound polarity score of one sentence.
+
+        Args:
+            sentence: String representing a sentence.
+
+        Returns:
+            A float representing VADER's compound score, rounded to four
+            decimal places as NLTK rounds it.
+        """
+        if not _is_plain_sentence(sentence):
+            return self.analyzer.polarity_scores(sentence)['compound']
+        words = [word for word in sentence.split() if len(word) > 1]
+        lexicon = self.lexicon
+        if lexicon.keys().isdisjoint(words):
+            return 0.0
+        hits = [position for position, word in enumerate(words)
+                if word in lexicon]
+        try:
+            but = words.index('but')
+        except ValueError:
+            but = -1
+        valences = {}
+        total = 0.0
+        for position in hits:
+            word = words[position]
+            if word not in valences:
+                # VADER scores every repeat of a word in the context of its
+                # first occurrence.
+                i = words.index(word)
+                if word in self.boosters or word == 'kind' and \
+                        i < len(words) - 1 and words[i + 1] == 'of':
+                    valences[word] = 0.0
+                else:
+                    valences[word] = self._valence(words, i)
+            valence = valences[word]
+            if but >= 0:
+                if position < but:
+                    valence = valence * 0.5
+                elif position > but:
+                    valence = valence * 1.5
+            total += valence
+        return round(total / math.sqrt(total * total + 15), 4)
+
+    def score_sentences(self, sentences):
+        """
+        Calculate the compound score of many sentences.
+
+        Args:
+            sentences: Iterable of strings representing sentences.
+
+        Returns:
+            A NumPy array of floats with the compound score of each
+            sentence, in input order.
+        """
+        return np.fromiter((self.compound(sentence) for sentence in
+                            sentences), dtype=float)
+
+    def score_comments(self, tokenized_comments):
+        """
+        Calculate the average sentiment of many cleaned comments.
+
+        Args:
+            tokenized_comments: An iterable or Series of comments, as
+                accepted by analyze_sentiments.
+
+        Returns:
+            A NumPy array of floats representing the average compound score
+            of each comment, matching analyze_sentiment.
+        """
+        cache = get_polarity_cache()
+        scores = []
+        for comment in tokenized_comments:
+            sentence_scores = [cache.get(sentence, self.compound) for sentence
+                               in split_tokenized_comment(comment)]
+            scores.append(sum(sentence_scores) / len(sentence_scores)
+                          if sentence_scores else 0)
+        return np.array(scores, dtype=float)
+
+    def score_corpus(self, corpus):
+        """
+        Calculate the average sentiment of every comment in a corpus of
+        token ids.
+
+        Which words can change a score is decided once per vocabulary entry.
+        Sentences without any of them score 0 without their text being
+        rebuilt, and only the rest are joined and scored.
+
+        Args:
+            corpus: TokenizedCorpus of cleaned comments.
+
+        Returns:
+            A NumPy array of floats representing the average compound score
+            of each comment, matching score_comments.
+        """
+        lexicon = self.lexicon
+        # Words in the lexicon, and words that are not plain cleaned text
+        # and so are scored by NLTK, are the only ones that matter.
+        marked = np.fromiter(
+            (len(word) > 1 and word in lexicon or
+             not _is_plain_sentence(word) or len(word.split()) > 1
+             for word in corpus.vocabulary), dtype=bool,
+            count=len(corpus.vocabulary))
+        marked_counts = np.concatenate(
+            [[0], np.cumsum(marked[corpus.tokens], dtype=np.int64)])
+        offsets = corpus.sentence_offsets
+        scored = marked_counts[offsets[1:]] != marked_counts[offsets[:-1]]
+
+        cache = get_polarity_cache()
+        sentence_scores = [0.0] * corpus.sentence_count
+        for index in np.flatnonzero(scored).tolist():
+            sentence_scores[index] = cache.get(corpus.sentence(index),
+                                               self.compound)
+        comment_offsets = corpus.comment_offsets.tolist()
+        return np.array([sum(sentence_scores[start:end]) / (end - start)
+                         if end > start else 0 for start, end in
+                         zip(comment_offsets, comment_offsets[1:])],
+                        dtype=float)
+
+
+def _is_plain_sentence(sentence):
+    """
+    Check whether a sentence is cleaned text that FastVader can score.
+
+    Args:
+        sentence: String representing a sentence.
+
+    Returns:
+        A Boolean value that is True if the sentence has only lowercase
+        word characters and whitespace.
+    """
+    return isinstance(sentence, str) and \
+        _PLAIN_SENTENCE.fullmatch(sentence) is not None and \
+        sentence == sentence.lower()
+
+
+def get_fast_scorer():
+    """
+    Return the shared FastVader scorer, creating it on first use.
+
+    Returns:
+        A FastVader using the shared analyzer's tables.
+    """
+    global _FAST_VADER
+    if _FAST_VADER is None:
+        with _ANALYZER_LOCK:
+            if _FAST_VADER is None:
+                _FAST_VADER = FastVader(_load_analyzer())
+    return _FAST_VADER
+
+
+class PolarityCache:
+    """
+    Bounded memo of sentence compound scores, evicting the least recently
+    used.
+
+    Threads repeat a lot of text ("deleted", "lol", bot replies), so each
+    distinct sentence is scored once and looked up afterwards. Sentences are
+    keyed by a 16 byte BLAKE2 digest of their text, which keeps the memory
+    used per entry small however long the sentence is. The cache can be
+    saved to and loaded from a file so scores carry over between runs.
+
+    Attributes:
+        maxsize: Integer representing the most sentences kept.
+        path: Optional string representing the file the cache is loaded
+            from and saved to.
+        hits: Integer representing the number of lookups found in the cache.
+        misses: Integer representing the number of lookups that were scored.
+    """
+
+    def __init__(self, maxsize=2 ** 18, path=None):
+        """
+        Create an empty cache, loading it from path if that file exists.
+
+        Args:
+            maxsize: Integer representing the most sentences kept.
+            path: Optional string representing the file to load from and
+                save to.
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.isfile(path):
+            self.load(path)
+
+    @staticmethod
+    def key(sentence):
+        """
+        Find the cache key of a sentence.
+
+        Args:
+            sentence: String representing a sentence.
+
+        Returns:
+            A bytes digest of the sentence.
+        """
+        return hashlib.blake2b(sentence.encode('utf-8'),
+                               digest_size=16).digest()
+
+    def get(self, sentence, score):
+        """
+        Look up the score of a sentence, scoring and storing it if missing.
+
+        Args:
+            sentence: String representing a sentence.
+            score: Function returning the compound score of a sentence.
+
+        Returns:
+            A float representing the compound score of the sentence.
+        """
+        if not isinstance(sentence, str):
+            return score(sentence)
+        key = self.key(sentence)
+        with self._lock:
+            if key in self._scores:
+                self._scores.move_to_end(key)
+                self.hits += 1
+                return self._scores[key]
+            self.misses += 1
+        value = score(sentence)
+        with self._lock:
+            self._scores[key] = value
+            if len(self._scores) > self.maxsize:
+                self._scores.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._scores)
+
+    def cache_info(self):
+        """
+        Report how well the cache is working, like functools.lru_cache.
+
+        Returns:
+            A CacheInfo named tuple of hits, misses, maxsize and currsize.
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._scores))
+
+    def clear(self):
+        """
+        Remove every entry and reset the counters.
+        """
+        with self._lock:
+            self._scores.clear()
+            self.hits = self.misses = 0
+
+    def save(self, path=None):
+        """
+        Write the cache to a NumPy .npz file, replacing it in one step.
+
+        Args:
+            path: Optional string representing the file to write. Defaults
+                to the path the cache was created with.
+        """
+        path = self.path if path is None else path
+        with self._lock:
+            # Digests are stored as rows of bytes, since fixed-width byte
+            # strings would drop trailing zero bytes.
+            keys = np.frombuffer(b''.join(self._scores),
+                                 dtype=np.uint8).reshape(-1, 16)
+            scores = np.fromiter(self._scores.values(), dtype=float,
+                                 count=len(self._scores))
+        temporary_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(temporary_path, keys=keys, scores=scores,
+                 lexicon=np.array(_lexicon_fingerprint()))
+        os.replace(temporary_path, path)
+
+    def load(self, path=None):
+        """
+        Add the entries of a saved cache, keeping the most recently used.
+
+        Files saved with a different VADER lexicon are ignored.
+
+        Args:
+            path: Optional string representing the file to read. Defaults to
+                the path the cache was created with.
+
+        Returns:
+            An integer representing the number of entries loaded.
+        """
+        path = self.path if path is None else path
+        with np.load(path, allow_pickle=False) as saved:
+            if str(saved['lexicon']) != _lexicon_fingerprint() or \
+                    not self.maxsize:
+                return 0
+            keys = saved['keys'][-self.maxsize:]
+            scores = saved['scores'][-self.maxsize:]
+        with self._lock:
+            for row, value in zip(keys, scores.tolist()):
+                key = row.tobytes()
+                self._scores[key] = value
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.maxsize:
+                self._scores.popitem(last=False)
+        return len(keys)
+
+
+def _lexicon_fingerprint():
+    """
+    Identify the VADER lexicon that cached scores were calculated with.
+
+    Returns:
+        A string representing a digest of the lexicon.
+    """
+    global _LEXICON_FINGERPRINT
+    if _LEXICON_FINGERPRINT is None:
+        lexicon = get_analyzer().lexicon
+        _LEXICON_FINGERPRINT = hashlib.blake2b(
+            repr(sorted(lexicon.items())).encode('utf-8'),
+            digest_size=16).hexdigest()
+    return _LEXICON_FINGERPRINT
+
+
+def get_polarity_cache():
+    """
+    Return the shared PolarityCache, creating it on first use.
+
+    If the REDDIT_SENTIMENT_POLARITY_CACHE environment variable names a
+    file, the cache is loaded from it and saved back to it when the
+    interpreter exits.
+
+    Returns:
+        The PolarityCache used by analyze_sentiment and analyze_sentiments.
+    """
+    global _POLARITY_CACHE
+    if _POLARITY_CACHE is None:
+        with _POLARITY_CACHE_LOCK:
+            if _POLARITY_CACHE is None:
+                path = os.environ.get('REDDIT_SENTIMENT_POLARITY_CACHE')
+                cache = PolarityCache(path=path)
+                if path is not None:
+                    atexit.register(cache.save)
+                _POLARITY_CACHE = cache
+    return _POLARITY_CACHE
+
+
+def comment_scores(comment_df, comment_ids, forest=None):
+    """
+    Calculate the sentiment of a list of comments, looked up by id.
+
+    If comment_df has a 'sentiment' column of stored scores, those are read
+    directly. Otherwise comment text is gathered by row position through the
+    forest's id index and scored. Comments that are missing from comment_df
+    or whose cleaned text is invalid (NaN) are neutral and score 0.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        comment_ids: List of strings representing comment ids.
+        forest: Optional CommentForest built from comment_df. Pass it when
+            scoring several lists of comments from the same thread.
+
+    Returns:
+        A NumPy array of floats representing the average compound polarity
+        score of each comment, in the order of comment_ids.
+    """
+    forest = as_forest(comment_df) if forest is None else forest
+    positions = forest.positions(comment_ids)
+
+    scores = np.zeros(len(positions))
+    valid = positions >= 0
+    if 'sentiment' in comment_df.columns:
+        stored = comment_df['sentiment'].to_numpy(dtype=float)
+        scores[valid] = np.nan_to_num(stored[positions[valid]])
+        return scores
+
+    texts = comment_df['tokenized_comment'].to_numpy()
+    valid[valid] = pd.notna(texts[positions[valid]])
+    scores[valid] = analyze_sentiments(texts[positions[valid]])
+    return scores
+
+
+def avg_depth_sentiment(comment_df, depth, comments_by_depth, forest=None):
     """
     Return average sentiment of all comments of the same depth.
 
@@ -125,28 +757,64 @@ def avg_depth_sentiment(comment_df, depth, comments_by_depth):
         comments_by_depth: A dictionary representing the replies to a comment
         with the nesting depth as integer keys and lists of string comment ids
         as values.
+        forest: Optional CommentForest built from comment_df.
 
     Returns:
         A float representing the average compound sentiment score of
         the replies at the given depth level.
     """
-    if len(comments_by_depth[depth]) > 0:
-        comment_ids = comments_by_depth[depth]
+    return float(comment_scores(comment_df, comments_by_depth[depth],
+                                forest).mean())
 
-        sentiments = []
-        for comment_id in comment_ids:
-            try:
-                tokenized_comment = comment_df['tokenized_comment'][comment_df[
-                    'comment_id'] == comment_id].values[0].split('\\')
-            # Catches invalid comments (NaN)
-            except AttributeError:
-                pass
-            sentiments.append(analyze_sentiment(tokenized_comment))
 
-    return sum(sentiments) / len(sentiments)
+def score_reply_dicts(comment_df, reply_dicts, forest=None):
+    """
+    Score every comment in a list of reply dictionaries in one pass.
 
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        reply_dicts: A list of dictionaries, where the key represents depth and
+            the values represent the comment_id of each comment at that depth.
+        forest: Optional CommentForest built from comment_df.
 
-def get_sentiment_by_depth(comment_df, reply_dicts):
+    Returns:
+        A tuple of three NumPy arrays of equal length with one entry per
+        comment, in reply_dicts order: the index of the reply dictionary the
+        comment belongs to, the comment's depth, and its sentiment score.
+    """
+    comment_ids = [comment_id for comment_dict in reply_dicts
+                   for comment_ids in comment_dict.values()
+                   for comment_id in comment_ids]
+    sizes = [[len(comment_ids) for comment_ids in comment_dict.values()]
+             for comment_dict in reply_dicts]
+    threads = np.repeat(np.arange(len(reply_dicts)),
+                        [sum(thread_sizes) for thread_sizes in sizes])
+    depths = np.repeat(np.array([depth for comment_dict in reply_dicts
+                                 for depth in comment_dict], dtype=int),
+                       [size for thread_sizes in sizes
+                        for size in thread_sizes])
+    scores = comment_scores(comment_df, comment_ids, forest)
+    return threads, depths, scores
+
+
+def _thread_slices(threads, thread_count):
+    """
+    Find where each reply dictionary's comments start and end.
+
+    Args:
+        threads: NumPy array of reply dictionary indexes, as returned by
+            score_reply_dicts.
+        thread_count: Integer representing the number of reply dictionaries.
+
+    Returns:
+        A list of slices, one per reply dictionary.
+    """
+    sizes = np.bincount(threads, minlength=thread_count)
+    ends = np.cumsum(sizes)
+    return [slice(end - size, end) for end, size in zip(ends, sizes)]
+
+
+def get_sentiment_by_depth(comment_df, reply_dicts, forest=None):
     """
     Map each depth to the average sentiment of the comments at that depth.
 
@@ -154,6 +822,7 @@ def get_sentiment_by_depth(comment_df, reply_dicts):
         comment_df: DataFrame containing cleaned comment data.
         reply_dicts: A list of dictionaries, where the key represents depth and
             the values represent the text of each comment at that depth.
+        forest: Optional CommentForest built from comment_df.
 
     Returns:
         sentiment_dicts: A list of dictionaries where the keys are the
@@ -161,17 +830,21 @@ def get_sentiment_by_depth(comment_df, reply_dicts):
         the float average compound sentiment scores for that depth and the
         integer number of comments in that depth.
     """
+    threads, depths, scores = score_reply_dicts(comment_df, reply_dicts,
+                                                forest)
     sentiment_dicts = []
-    for comment_dict in reply_dicts:
-        sentiment_dict = defaultdict(float)
-        for depth in comment_dict.keys():
-            sentiment_dict[depth] = (avg_depth_sentiment(comment_df,
-                                depth, comment_dict), len(comment_dict[depth]))
-        sentiment_dicts.append(dict(sentiment_dict))
+    for comment_dict, thread in zip(reply_dicts, _thread_slices(
+            threads, len(reply_dicts))):
+        counts = np.bincount(depths[thread])
+        totals = np.bincount(depths[thread], weights=scores[thread])
+        sentiment_dicts.append({
+            depth: (float(totals[depth] / counts[depth]) if len(comment_ids)
+                    else float('nan'), len(comment_ids))
+            for depth, comment_ids in comment_dict.items()})
     return sentiment_dicts
 
 
-def get_sentiment_lists(comment_df, reply_dicts):
+def get_sentiment_lists(comment_df, reply_dicts, forest=None):
     """
     Get lists of dictionaries mapping depth to comment sentiment.
 
@@ -179,34 +852,346 @@ def get_sentiment_lists(comment_df, reply_dicts):
         comment_df: DataFrame containing cleaned comment data.
         reply_dicts: A list of dictionaries, where the key represents depth and
             the values represent the comment_id of each comment at that depth.
+        forest: Optional CommentForest built from comment_df.
 
     Returns:
         sentiment_dicts: A list of dictionaries where the keys are the
         nesting depths for the comment replies and the values are floats
         representing the sentiment of comments at that depth.
     """
+    scores = score_reply_dicts(comment_df, reply_dicts, forest)[2]
     sentiment_dicts = []
+    start = 0
     for comment_dict in reply_dicts:
-        sentiment_dict = defaultdict(list)
-        for depth in comment_dict.keys():
-            for comment_id in comment_dict[depth]:
-                try:
-                    comment = comment_df['tokenized_comment'][comment_df[
-                        'comment_id'] == comment_id].values[0].split('\\')
-                # Catches invalid comments (NaN)
-                except AttributeError:
-                    pass
-                sentiment_dict[depth].append(analyze_sentiment(comment))
-        sentiment_dicts.append(dict(sentiment_dict))
+        sentiment_dict = {}
+        for depth, comment_ids in comment_dict.items():
+            sentiment_dict[depth] = \
+                scores[start:start + len(comment_ids)].tolist()
+            start += len(comment_ids)
+        sentiment_dicts.append(sentiment_dict)
     return sentiment_dicts
 
 
-def analyze_subreddit_by_depth(subreddit):
+def get_depth_statistics(comment_df, reply_dicts, forest=None):
+    """
+    Summarize the sentiment of the comments at each depth of each thread.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        reply_dicts: A list of dictionaries, where the key represents depth and
+            the values represent the comment_id of each comment at that depth.
+        forest: Optional CommentForest built from comment_df.
+
+    Returns:
+        A DataFrame with one row per thread and depth, with columns thread
+        (the index of the reply dictionary), depth, count, mean, std
+        (population standard deviation), min, q25, median, q75 and max of
+        the compound sentiment scores.
+    """
+    threads, depths, scores = score_reply_dicts(comment_df, reply_dicts,
+                                                forest)
+    return summarize_scores(pd.DataFrame({'thread': threads, 'depth': depths,
+                                          'sentiment': scores}),
+                            ['thread', 'depth'])
+
+
+def summarize_scores(score_df, keys):
+    """
+    Compute sentiment statistics for each group of comments.
+
+    Args:
+        score_df: DataFrame with a 'sentiment' column and the key columns.
+        keys: List of strings representing the columns to group by.
+
+    Returns:
+        A DataFrame with the key columns followed by count, mean, std
+        (population standard deviation), min, q25, median, q75 and max of
+        the sentiment scores in each group.
+    """
+    grouped = score_df.groupby(keys, sort=True)['sentiment']
+    statistics = grouped.agg(['count', 'mean', 'min', 'max'])
+    statistics['std'] = grouped.std(ddof=0)
+    quantiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    statistics['q25'] = quantiles[0.25]
+    statistics['median'] = quantiles[0.5]
+    statistics['q75'] = quantiles[0.75]
+    return statistics[['count', 'mean', 'std', 'min', 'q25', 'median', 'q75',
+                       'max']].reset_index()
+
+
+def label_thread_scores(comment_df, forest=None):
+    """
+    Label every comment with its thread, depth and sentiment.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        forest: Optional CommentForest built from comment_df.
+
+    Returns:
+        A DataFrame with one row per comment with columns comment_id, root
+        (the comment_id of its top level comment), depth (with top level
+        comments at depth 0) and sentiment.
+    """
+    forest = as_forest(comment_df) if forest is None else forest
+    labels = forest.thread_labels()
+    labels['sentiment'] = comment_scores(comment_df, labels['comment_id'],
+                                         forest)
+    return labels
+
+
+def get_thread_statistics(comment_df, forest=None):
+    """
+    Summarize the sentiment at each depth of every top level thread.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        forest: Optional CommentForest built from comment_df.
+
+    Returns:
+        A DataFrame with one row per top level comment (root) and depth,
+        with the columns described in summarize_scores.
+    """
+    return summarize_scores(label_thread_scores(comment_df, forest),
+                            ['root', 'depth'])
+
+
+def top_threads(comment_df, count, by='depth', forest=None):
+    """
+    Find the top level comments with the deepest or largest threads.
+
+    Args:
+        comment_df: DataFrame containing, at minimum, comment_id and
+            comment_parent_id data.
+        count: Integer representing the number of threads to return.
+        by: String representing how to rank threads, either 'depth' (the
+            deepest reply) or 'replies' (the total number of replies).
+        forest: Optional CommentForest built from comment_df.
+
+    Returns:
+        A list of strings containing the comment_id of the top count top
+        level comments, best first. Ties keep the order of the comments.
+    """
+    forest = as_forest(comment_df) if forest is None else forest
+    grouped = forest.thread_labels().groupby('root', sort=False)['depth']
+    if by == 'depth':
+        sizes = grouped.max()
+    elif by == 'replies':
+        sizes = grouped.count() - 1
+    else:
+        raise ValueError(f"by must be 'depth' or 'replies', not {by!r}")
+    ranked = heapq.nlargest(count, enumerate(sizes.items()),
+                            key=lambda item: (item[1][1], -item[0]))
+    return [root for _, (root, _) in ranked]
+
+
+class AnalyzedThread:
+    """
+    A subreddit's cleaned comments with their forest and sentiment scores.
+
+    The comments are read, indexed and scored once. Every view of the
+    thread (the averaged and distribution views by depth, statistics tables,
+    and any added later) is computed from the same forest and score vector
+    and cached, so repeated views cost only a cache lookup.
+
+    Attributes:
+        comment_df: DataFrame containing the cleaned comment data, with a
+            'sentiment' column holding the score of every comment.
+        forest: CommentForest built from comment_df.
+    """
+
+    def __init__(self, comment_df):
+        """
+        Index and score a thread's comments.
+
+        Args:
+            comment_df: DataFrame containing cleaned comment data. Comments
+                are scored unless it already has a 'sentiment' column.
+        """
+        self.forest = CommentForest.from_dataframe(comment_df)
+        if 'sentiment' not in comment_df.columns:
+            comment_df = comment_df.assign(sentiment=comment_scores(
+                comment_df, self.forest.comment_ids, self.forest))
+        self.comment_df = comment_df
+        self._views = {}
+
+    @classmethod
+    def load(cls, subreddit):
+        """
+        Read a subreddit's cleaned comments and analyze them.
+
+        If the cleaned data file has neither stored scores nor text, as after
+        token_store.store_token_ids(drop_text=True), the comments are scored
+        from the token ids stored next to it.
+
+        Args:
+            subreddit: A string representing the subreddit name.
+
+        Returns:
+            An AnalyzedThread for the subreddit.
+        """
+        path = storage.cleaned_path(subreddit)
+        comment_df = storage.read_comments(path, storage.ANALYSIS_COLUMNS)
+        if 'sentiment' not in comment_df.columns and \
+                'tokenized_comment' not in comment_df.columns:
+            corpus = load_corpus(path)
+            if corpus is None:
+                raise ValueError(f'{path} has no cleaned text or sentiment '
+                                 'scores, and no current token ids.')
+            comment_df['sentiment'] = analyze_sentiments(corpus)
+        return cls(comment_df)
+
+    def view(self, name, compute):
+        """
+        Return a cached view of the thread, computing it the first time.
+
+        Args:
+            name: Hashable key identifying the view.
+            compute: Function that takes no arguments and returns the view.
+
+        Returns:
+            The result of compute, shared by every call with the same name.
+        """
+        if name not in self._views:
+            self._views[name] = compute()
+        return self._views[name]
+
+    def reply_dicts(self, all_threads=False):
+        """
+        Organize each top level comment's replies by depth.
+
+        Args:
+            all_threads: Boolean representing whether to keep every thread
+                in the forest, rooted as in thread_statistics, instead of
+                only the most deeply nested top level comments.
+
+        Returns:
+            A list of dictionaries, where the key represents depth and the
+            values represent the comment_id of each comment at that depth.
+        """
+        def compute():
+            # Every root, including replies to comments that were not
+            # scraped, so the view covers the threads the statistics do
+            if all_threads:
+                return [create_reply_dict(self.forest, comment) for
+                        comment in self.forest.root_comments()]
+            # Only use the top level comments with the deepest nesting of
+            # replies
+            return get_most_replied_comments(
+                [create_reply_dict(self.forest, comment) for
+                 comment in self.forest.top_level_comments()])
+        return self.view(('reply_dicts', all_threads), compute)
+
+    def by_depth(self, all_threads=False):
+        """
+        Average the sentiment at each depth of each thread.
+
+        Args:
+            all_threads: Boolean, as in reply_dicts.
+
+        Returns:
+            The list of dictionaries returned by get_sentiment_by_depth.
+        """
+        return self.view(('by_depth', all_threads), lambda:
+                         get_sentiment_by_depth(self.comment_df,
+                                                self.reply_dicts(all_threads),
+                                                self.forest))
+
+    def distribution(self, all_threads=False):
+        """
+        List the sentiment of every comment at each depth of each thread.
+
+        Args:
+            all_threads: Boolean, as in reply_dicts.
+
+        Returns:
+            The list of dictionaries returned by get_sentiment_lists.
+        """
+        return self.view(('distribution', all_threads), lambda:
+                         get_sentiment_lists(self.comment_df,
+                                             self.reply_dicts(all_threads),
+                                             self.forest))
+
+    def depth_statistics(self, all_threads=False):
+        """
+        Summarize the sentiment at each depth of each thread.
+
+        Args:
+            all_threads: Boolean, as in reply_dicts.
+
+        Returns:
+            The DataFrame returned by get_depth_statistics.
+        """
+        return self.view(('depth_statistics', all_threads), lambda:
+                         get_depth_statistics(self.comment_df,
+                                              self.reply_dicts(all_threads),
+                                              self.forest))
+
+    def thread_statistics(self):
+        """
+        Summarize the sentiment at each depth of every top level thread.
+
+        Returns:
+            The DataFrame returned by get_thread_statistics.
+        """
+        return self.view('thread_statistics', lambda: get_thread_statistics(
+            self.comment_df, self.forest))
+
+
+# Most AnalyzedThreads kept by load_thread. Each holds a subreddit's comments
+# and forest, so only the most recently used are kept.
+THREAD_CACHE_SIZE = 8
+
+# AnalyzedThreads loaded by load_thread, keyed by subreddit, least recently
+# used first
+_THREADS = OrderedDict()
+_THREADS_LOCK = threading.Lock()
+
+
+def load_thread(subreddit):
+    """
+    Return the AnalyzedThread for a subreddit, loading it at most once.
+
+    The thread is loaded again if its cleaned data file has changed since it
+    was last loaded. At most THREAD_CACHE_SIZE threads are kept, evicting
+    the least recently used.
+
+    Args:
+        subreddit: A string representing the subreddit name.
+
+    Returns:
+        An AnalyzedThread for the subreddit.
+    """
+    path = storage.cleaned_path(subreddit)
+    version = (path, *storage.file_version(path))
+    with _THREADS_LOCK:
+        if subreddit in _THREADS and _THREADS[subreddit][0] == version:
+            _THREADS.move_to_end(subreddit)
+            return _THREADS[subreddit][1]
+    thread = AnalyzedThread.load(subreddit)
+    with _THREADS_LOCK:
+        _THREADS[subreddit] = (version, thread)
+        _THREADS.move_to_end(subreddit)
+        while len(_THREADS) > THREAD_CACHE_SIZE:
+            _THREADS.popitem(last=False)
+    return thread
+
+
+def clear_thread_cache():
+    """
+    Forget every AnalyzedThread kept by load_thread.
+    """
+    with _THREADS_LOCK:
+        _THREADS.clear()
+
+
+def analyze_subreddit_by_depth(subreddit, all_threads=False):
     """
     Analyze the sentiment of a subreddit.
 
     Args:
         subreddit: String representing name of subreddit
+        all_threads: Boolean representing whether to analyze every top level
+            comment's thread instead of only the most deeply nested ones.
 
     Returns:
         sentiment_dicts: A list of dictionaries where the keys are the
@@ -214,55 +1199,84 @@ def analyze_subreddit_by_depth(subreddit):
         the average compound sentiment scores for that depth and the number
         of comments in that depth.
     """
-    # Read in cleaned subreddit DataFrame
-    sub_df = pd.read_csv('./cleaneddata/' + subreddit +
-                         '_comments_cleaned.csv')
-
-    # Find top level comments (comments are already in order by depth, so
-    # the parent of the first comment is the original post)
-    top_level_comments = \
-        sub_df['comment_id'][sub_df['comment_parent_id'].str.contains(sub_df[
-            'comment_parent_id'][0])].tolist()
-
-    # Create dictionaries for each top level comment with all of their
-    # replies organized by depth.
-    reply_dicts = [create_reply_dict(sub_df, comment) for comment in
-                   top_level_comments]
-
-    # Only use the comments with the deepest nesting of replies
-    reply_dicts = get_most_replied_comments(reply_dicts)
-
-    return get_sentiment_by_depth(sub_df, reply_dicts)
+    return copy.deepcopy(load_thread(subreddit).by_depth(all_threads))
 
 
-def analyze_subreddit_distribution(subreddit):
+def analyze_subreddit_distribution(subreddit, all_threads=False):
     """
     Analyze the distribution of sentiment scores.
 
     Args:
         subreddit: A string representing the subreddit name.
+        all_threads: Boolean representing whether to analyze every top level
+            comment's thread instead of only the most deeply nested ones.
 
     Returns:
         sentiment_dicts: A list of dictionaries where the keys are the
         nesting depths for the comment replies and the values are floats
         representing the sentiment of comments at that depth.
     """
-    # Read in cleaned subreddit DataFrame
-    sub_df = pd.read_csv('./cleaneddata/' + subreddit +
-                         '_comments_cleaned.csv')
+    return copy.deepcopy(load_thread(subreddit).distribution(all_threads))
 
-    # Find top level comments (comments are already in order by depth, so
-    # the parent of the first comment is the original post)
-    top_level_comments = \
-        sub_df['comment_id'][sub_df['comment_parent_id'].str.contains(sub_df[
-            'comment_parent_id'][0])].tolist()
 
-    # Create dictionaries for each top level comment with all of their
-    # replies organized by depth.
-    reply_dicts = [create_reply_dict(sub_df, comment) for comment in
-                   top_level_comments]
+def analyze_subreddit_threads(subreddit):
+    """
+    Summarize the sentiment at each depth of every thread in a subreddit.
+
+    Args:
+        subreddit: A string representing the subreddit name.
+
+    Returns:
+        A DataFrame with one row per top level comment (root) and depth,
+        with the columns described in summarize_scores.
+    """
+    return load_thread(subreddit).thread_statistics().copy()
+
+
+def _subreddit_thread_statistics(subreddit):
+    """
+    Summarize every thread of a subreddit, labelled with the subreddit.
+
+    Args:
+        subreddit: A string representing the subreddit name.
+
+    Returns:
+        The DataFrame from analyze_subreddit_threads with a leading
+        subreddit column.
+    """
+    statistics = analyze_subreddit_threads(subreddit)
+    statistics.insert(0, 'subreddit', subreddit)
+    return statistics
 
-    # Only use the comments with the deepest nesting of replies
-    reply_dicts = get_most_replied_comments(reply_dicts)
 
-    return get_sentiment_lists(sub_df, reply_dicts)
+def analyze_subreddits(subreddit_list, workers=1):
+    """
+    Summarize the sentiment at each depth of every thread in many
+    subreddits, optionally in parallel.
+
+    Args:
+        subreddit_list: List of strings representing subreddit names.
+        workers: Integer representing the number of worker processes to
+            analyze with, one subreddit at a time each. 1 analyzes in the
+            current process.
+
+    Returns:
+        A DataFrame with one row per subreddit, top level comment (root) and
+        depth, with a subreddit column followed by the columns described in
+        summarize_scores.
+    """
+    # Load the lexicon before starting workers so forked workers share it;
+    # the initializer loads it in workers that are not forked.
+    get_analyzer()
+    if workers <= 1:
+        frames = [_subreddit_thread_statistics(subreddit) for subreddit in
+                  subreddit_list]
+    else:
+        with ProcessPoolExecutor(workers, initializer=get_analyzer) as pool:
+            frames = list(pool.map(_subreddit_thread_statistics,
+                                   subreddit_list))
+    if not frames:
+        return pd.DataFrame(columns=['subreddit', 'root', 'depth', 'count',
+                                     'mean', 'std', 'min', 'q25', 'median',
+                                     'q75', 'max'])
+    return pd.concat(frames, ignore_index=True)
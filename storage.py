@@ -0,0 +1,446 @@
+"""
+Read and write comment data files as CSV or Parquet.
+"""
+import os.path
+import pandas as pd
+
+RAW_DIRECTORY = './rawdata/'
+CLEANED_DIRECTORY = './cleaneddata/'
+
+# File extension for each supported storage format. Parquet requires pyarrow.
+FORMATS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# Format used when writing new files. Reading picks whichever format exists.
+DEFAULT_FORMAT = 'csv'
+
+# Data types of the comment columns. Parent and link ids repeat across many
+# comments, so they are stored as categories.
+DTYPES = {
+    'comment_id': 'string',
+    'comment_parent_id': 'category',
+    'comment_body': 'string',
+    'comment_link_id': 'category',
+    'body_hash': 'string',
+    'tokenized_comment': 'string',
+    'sentiment': 'float64'
+}
+
+# Columns needed to build a comment forest and score it.
+ANALYSIS_COLUMNS = ['comment_id', 'comment_parent_id', 'tokenized_comment',
+                    'sentiment']
+
+
+def _format_of(path):
+    """
+    Find the storage format of a file from its extension.
+
+    Args:
+        path: String or path representing a comment data file.
+
+    Returns:
+        A string representing the storage format, 'csv' or 'parquet'.
+    """
+    extension = os.path.splitext(str(path))[1]
+    for fmt, fmt_extension in FORMATS.items():
+        if extension == fmt_extension:
+            return fmt
+    raise ValueError(f'Unknown comment data format: {path}')
+
+
+def _file_path(directory, stem, fmt):
+    """
+    Find the path of a comment data file.
+
+    Args:
+        directory: String representing the directory of the file.
+        stem: String representing the file name without its extension.
+        fmt: String representing the storage format, or None to use the
+            format of an existing file, falling back to DEFAULT_FORMAT.
+
+    Returns:
+        A string representing the path of the file.
+    """
+    if fmt is None:
+        for existing_fmt in [DEFAULT_FORMAT] + list(FORMATS):
+            path = directory + stem + FORMATS[existing_fmt]
+            if os.path.isfile(path):
+                return path
+        fmt = DEFAULT_FORMAT
+    return directory + stem + FORMATS[fmt]
+
+
+def temporary_path(path):
+    """
+    Find where to write a file before it replaces the one at path.
+
+    Args:
+        path: String or path representing a comment data file.
+
+    Returns:
+        A string representing a path in the same directory with the same
+        extension, so it is written in the same format.
+    """
+    stem, extension = os.path.splitext(str(path))
+    return f'{stem}.{os.getpid()}.tmp{extension}'
+
+
+def remove_other_formats(path):
+    """
+    Delete the copies of a comment data file saved in other formats.
+
+    Paths without a format pick whichever format exists, so a file left in
+    another format would otherwise be read instead of the one just written.
+
+    Args:
+        path: String representing the path of the comment data file to keep.
+    """
+    stem, extension = os.path.splitext(str(path))
+    for fmt_extension in FORMATS.values():
+        if fmt_extension != extension and \
+                os.path.isfile(stem + fmt_extension):
+            os.remove(stem + fmt_extension)
+
+
+def raw_path(subreddit, fmt=None):
+    """
+    Find the path of a subreddit's raw comment data.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        fmt: Optional string representing the storage format. By default,
+            the format of the existing file is used.
+
+    Returns:
+        A string representing the path of the raw data file.
+    """
+    return _file_path(RAW_DIRECTORY, subreddit + '_comments', fmt)
+
+
+def cleaned_path(subreddit, fmt=None):
+    """
+    Find the path of a subreddit's cleaned comment data.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        fmt: Optional string representing the storage format. By default,
+            the format of the existing file is used.
+
+    Returns:
+        A string representing the path of the cleaned data file.
+    """
+    return _file_path(CLEANED_DIRECTORY, subreddit + '_comments_cleaned',
+                      fmt)
+
+
+def checkpoint_path(subreddit):
+    """
+    Find the path of the checkpoint of a subreddit's unfinished scrape.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+
+    Returns:
+        A string representing the path of the checkpoint file.
+    """
+    return RAW_DIRECTORY + subreddit + '_scrape_checkpoint.json'
+
+
+def plot_data_path(subreddit, all_threads=False):
+    """
+    Find the path of the plot data cached for a subreddit's analysis.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        all_threads: Boolean representing whether the plot data covers every
+            thread instead of only the most deeply nested ones.
+
+    Returns:
+        A string representing the path of the plot data file.
+    """
+    return CLEANED_DIRECTORY + subreddit + \
+        ('_plot_data_all.npz' if all_threads else '_plot_data.npz')
+
+
+def file_version(path):
+    """
+    Identify the current contents of a file by its size and modification
+    time.
+
+    Args:
+        path: String representing the path of a file.
+
+    Returns:
+        A list of two integers, the size in bytes and the modification time
+        in nanoseconds.
+    """
+    file_stat = os.stat(path)
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def _apply_dtypes(comment_df):
+    """
+    Convert known comment columns to their data types.
+
+    Args:
+        comment_df: DataFrame of comment data.
+
+    Returns:
+        The DataFrame with each column in DTYPES converted.
+    """
+    return comment_df.astype({column: dtype for column, dtype in
+                              DTYPES.items() if column in comment_df.columns})
+
+
+def _csv_columns(columns):
+    """
+    Choose which CSV columns to read.
+
+    Unnamed columns are saved DataFrame indexes and are always skipped.
+
+    Args:
+        columns: List of strings representing the columns to read, or None
+            to read them all.
+
+    Returns:
+        A function to pass as usecols to pandas.read_csv.
+    """
+    def use_column(column):
+        if column.startswith('Unnamed:'):
+            return False
+        return columns is None or column in columns
+    return use_column
+
+
+def _parquet_columns(path, columns):
+    """
+    Choose which Parquet columns to read, skipping any that are missing.
+
+    Args:
+        path: String representing the path of a Parquet file.
+        columns: List of strings representing the columns to read, or None
+            to read them all.
+
+    Returns:
+        A list of strings representing the columns to read, or None.
+    """
+    if columns is None:
+        return None
+    import pyarrow.parquet as pq
+    names = set(pq.read_schema(path).names)
+    return [column for column in columns if column in names]
+
+
+def read_comments(path, columns=None):
+    """
+    Read a comment data file.
+
+    Args:
+        path: String representing the path of a CSV or Parquet file.
+        columns: Optional list of strings representing the columns to read.
+            Columns that are not in the file are skipped.
+
+    Returns:
+        A DataFrame of comment data with the data types in DTYPES.
+    """
+    if _format_of(path) == 'parquet':
+        import pyarrow.parquet as pq
+        comment_df = pq.read_table(
+            path, columns=_parquet_columns(path, columns),
+            read_dictionary=[column for column, dtype in DTYPES.items()
+                             if dtype == 'category']).to_pandas()
+    else:
+        comment_df = pd.read_csv(path, usecols=_csv_columns(columns),
+                                 dtype={column: dtype for column, dtype in
+                                        DTYPES.items() if dtype != 'category'})
+    return _apply_dtypes(comment_df)
+
+
+def iter_comments(path, rows_per_chunk, columns=None):
+    """
+    Read a comment data file a fixed number of rows at a time.
+
+    Args:
+        path: String representing the path of a CSV or Parquet file.
+        rows_per_chunk: Integer representing the number of rows per chunk.
+        columns: Optional list of strings representing the columns to read.
+
+    Yields:
+        DataFrames of at most rows_per_chunk rows of comment data.
+    """
+    if _format_of(path) == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(
+                rows_per_chunk, columns=_parquet_columns(path, columns)):
+            yield _apply_dtypes(batch.to_pandas())
+    else:
+        yield from (_apply_dtypes(chunk) for chunk in pd.read_csv(
+            path, usecols=_csv_columns(columns), chunksize=rows_per_chunk,
+            dtype={column: dtype for column, dtype in DTYPES.items()
+                   if dtype != 'category'}))
+
+
+def _plain_columns(comment_df):
+    """
+    Convert categorical columns back to strings before writing.
+
+    Categories are rebuilt on read, so every batch of a file is written with
+    the same column types.
+
+    Args:
+        comment_df: DataFrame of comment data.
+
+    Returns:
+        A DataFrame with categorical columns stored as strings.
+    """
+    categorical = [column for column in comment_df.columns
+                   if isinstance(comment_df[column].dtype, pd.CategoricalDtype)]
+    return comment_df.astype({column: 'string' for column in categorical})
+
+
+def write_comments(comment_df, path):
+    """
+    Write a comment data file, replacing any existing file.
+
+    Args:
+        comment_df: DataFrame of comment data.
+        path: String representing the path of a CSV or Parquet file.
+    """
+    with CommentWriter(path) as writer:
+        writer.write(comment_df)
+
+
+class CommentWriter:
+    """
+    Write comment data to a file in batches.
+
+    Use as a context manager. The file is replaced when the first batch is
+    written, and each later batch is appended to it. Once a replaced file is
+    closed, copies of it in other formats are deleted, unless the with block
+    raised an exception.
+
+    Attributes:
+        path: String representing the path of the CSV or Parquet file.
+        rows_written: Integer representing the number of rows written.
+    """
+
+    def __init__(self, path, append=False):
+        """
+        Prepare to write a comment data file.
+
+        Args:
+            path: String representing the path of a CSV or Parquet file.
+            append: Boolean representing whether to add to an existing CSV
+                file instead of replacing it. Parquet files cannot be
+                appended to.
+        """
+        self.path = path
+        self.rows_written = 0
+        self._format = _format_of(path)
+        self._append = append and os.path.isfile(path)
+        if self._append and self._format == 'parquet':
+            raise ValueError('Parquet files cannot be appended to: ' +
+                             str(path))
+        self._parquet_writer = None
+        self._started = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(succeeded=exc_type is None)
+
+    def write(self, comment_df):
+        """
+        Write a batch of rows.
+
+        Args:
+            comment_df: DataFrame of comment data with the same columns as
+                every other batch.
+        """
+        comment_df = _plain_columns(comment_df)
+        if self._format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(comment_df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path,
+                                                        table.schema)
+            self._parquet_writer.write_table(table.cast(
+                self._parquet_writer.schema))
+        else:
+            first = self.rows_written == 0 and not self._append
+            comment_df.to_csv(self.path, index=False,
+                              mode='w' if first else 'a', header=first)
+        self.rows_written += len(comment_df)
+        self._started = True
+
+    def close(self, succeeded=True):
+        """
+        Finish writing the file.
+
+        Args:
+            succeeded: Boolean representing whether every batch was written.
+                Copies of the file in other formats are only deleted once it
+                has been replaced successfully, so a failed write keeps them.
+        """
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if succeeded and self._started and not self._append:
+            remove_other_formats(self.path)
+
+
+def load_raw(subreddit, columns=None):
+    """
+    Read a subreddit's raw comment data.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        columns: Optional list of strings representing the columns to read.
+
+    Returns:
+        A DataFrame of raw comment data.
+    """
+    return read_comments(raw_path(subreddit), columns)
+
+
+def load_cleaned(subreddit, columns=None):
+    """
+    Read a subreddit's cleaned comment data.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        columns: Optional list of strings representing the columns to read.
+
+    Returns:
+        A DataFrame of cleaned comment data.
+    """
+    return read_comments(cleaned_path(subreddit), columns)
+
+
+def save_raw(comment_df, subreddit, fmt=None):
+    """
+    Write a subreddit's raw comment data.
+
+    Args:
+        comment_df: DataFrame of raw comment data.
+        subreddit: String representing the name of the subreddit.
+        fmt: Optional string representing the storage format. Defaults to
+            DEFAULT_FORMAT.
+    """
+    write_comments(comment_df, raw_path(subreddit, fmt or DEFAULT_FORMAT))
+
+
+def save_cleaned(comment_df, subreddit, fmt=None):
+    """
+    Write a subreddit's cleaned comment data.
+
+    Args:
+        comment_df: DataFrame of cleaned comment data.
+        subreddit: String representing the name of the subreddit.
+        fmt: Optional string representing the storage format. Defaults to
+            DEFAULT_FORMAT.
+    """
+    write_comments(comment_df, cleaned_path(subreddit,
+                                            fmt or DEFAULT_FORMAT))
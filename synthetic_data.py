@@ -0,0 +1,282 @@
+"""
+Generate synthetic comment forests for load testing.
+
+Synthetic subreddits have the same columns as scraped and cleaned data, so
+every stage can be run at any size without a Reddit account. For example,
+to write ten million raw and cleaned comments for a subreddit called
+'synthetic':
+
+    $ python synthetic_data.py synthetic 10000000 --cleaned
+"""
+import argparse
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from data_cleaning import hash_comment_bodies
+import storage
+
+RAW_COLUMNS = ['comment_id', 'comment_parent_id', 'comment_body',
+               'comment_link_id']
+CLEANED_COLUMNS = RAW_COLUMNS + ['body_hash', 'tokenized_comment',
+                                 'sentiment']
+
+# Words used to write comments. None of them are changed by cleaning, so the
+# tokenized text matches what data_cleaning.clean_comment makes of the body,
+# and some of them are scored by VADER.
+WORDS = ['the', 'this', 'that', 'it', 'not', 'very', 'really', 'good',
+         'bad', 'great', 'terrible', 'love', 'hate', 'happy', 'sad', 'people',
+         'post', 'comment', 'vote', 'think', 'agree', 'wrong', 'right',
+         'funny', 'lol', 'why', 'what', 'never', 'always', 'thanks', 'nice',
+         'awful', 'best', 'worst', 'pretty', 'no', 'yes', 'friend', 'time',
+         'day', 'work', 'thing', 'way', 'cat', 'dog', 'story', 'sorry', 'cool',
+         'stupid', 'amazing', 'boring', 'sure', 'maybe', 'okay', 'wow',
+         'problem', 'idea']
+
+# Number of words in each full sentence of a comment.
+SENTENCE_WORDS = 8
+
+
+def _iter_parents(size, max_depth, branching, depth_decay, fanout_skew, rng):
+    """
+    Grow threads one level at a time until there are size comments.
+
+    Each thread starts from a single top level comment. Every comment at
+    depth d gets a Poisson distributed number of replies with mean
+    branching * depth_decay ** d. With fanout_skew above 0 the mean of each
+    comment is first drawn from a gamma distribution, so a few comments get
+    most of the replies while the overall mean stays the same.
+
+    Args:
+        size: Integer representing the number of comments.
+        max_depth: Integer representing the deepest reply depth.
+        branching: Float representing the mean number of replies to a top
+            level comment.
+        depth_decay: Float multiplying the mean number of replies at each
+            level.
+        fanout_skew: Float representing the variance of the gamma
+            distribution of reply means, relative to the mean. 0 gives
+            every comment the same mean.
+        rng: NumPy random Generator.
+
+    Yields:
+        NumPy arrays of integers containing the position of the parent of
+        each successive comment, or -1 for top level comments.
+    """
+    made = 0
+    while made < size:
+        frontier = np.array([made])
+        made += 1
+        yield np.array([-1])
+        for depth in range(max_depth):
+            mean = branching * depth_decay ** depth
+            if fanout_skew > 0:
+                mean = rng.gamma(1 / fanout_skew, fanout_skew * mean,
+                                 len(frontier))
+            replies = np.repeat(frontier, rng.poisson(mean, len(frontier)))
+            replies = replies[:size - made]
+            if len(replies) == 0:
+                break
+            frontier = np.arange(made, made + len(replies))
+            made += len(replies)
+            yield replies
+
+
+def _iter_parent_chunks(parents, rows_per_chunk):
+    """
+    Regroup arrays of parent positions into chunks of a fixed size.
+
+    Args:
+        parents: Iterable of NumPy arrays from _iter_parents.
+        rows_per_chunk: Integer representing the number of rows per chunk.
+
+    Yields:
+        NumPy arrays of rows_per_chunk parent positions, except for the last
+        which may be shorter.
+    """
+    pending = []
+    pending_rows = 0
+    for level in parents:
+        pending.append(level)
+        pending_rows += len(level)
+        if pending_rows >= rows_per_chunk:
+            joined = np.concatenate(pending)
+            for start in range(0, len(joined) - rows_per_chunk + 1,
+                               rows_per_chunk):
+                yield joined[start:start + rows_per_chunk]
+            pending = [joined[len(joined) - len(joined) % rows_per_chunk:]]
+            pending_rows = len(pending[0])
+    if pending_rows:
+        yield np.concatenate(pending)
+
+
+def _synthetic_text(count, words, length_rng, word_rng):
+    """
+    Write the bodies of synthetic comments and their cleaned text.
+
+    Args:
+        count: Integer representing the number of comments.
+        words: Float representing the mean number of words per comment.
+        length_rng: NumPy random Generator drawing the comment lengths.
+        word_rng: NumPy random Generator drawing the words.
+
+    Returns:
+        A tuple of two lists of strings: each comment body, written as
+        capitalized sentences, and its tokenized text, with sentences
+        separated by backslashes.
+    """
+    lengths = length_rng.poisson(max(words - 1, 0), count) + 1
+    tokens = np.array(WORDS)[(word_rng.random(lengths.sum()) *
+                              len(WORDS)).astype(int)].tolist()
+    bodies = []
+    tokenized = []
+    start = 0
+    for length in lengths.tolist():
+        sentences = [' '.join(tokens[sentence_start:min(
+            sentence_start + SENTENCE_WORDS, start + length)])
+            for sentence_start in range(start, start + length,
+                                        SENTENCE_WORDS)]
+        start += length
+        bodies.append(' '.join(sentence.capitalize() + '.'
+                               for sentence in sentences))
+        tokenized.append('\\'.join(sentences))
+    return bodies, tokenized
+
+
+def iter_synthetic_comments(size, rows_per_chunk=100000, max_depth=10,
+                            branching=2.0, depth_decay=1.0, fanout_skew=0.0,
+                            words=12, cleaned=False, link_id='t3_synthetic',
+                            seed=0):
+    """
+    Generate a synthetic comment forest a fixed number of rows at a time.
+
+    Comments are listed thread by thread, breadth first within each thread,
+    so the first comment replies to the submission. Only one chunk of rows
+    is held in memory at once. The same arguments always generate the same
+    comments.
+
+    Args:
+        size: Integer representing the number of comments.
+        rows_per_chunk: Integer representing the number of rows per chunk.
+        max_depth: Integer representing the deepest reply depth.
+        branching: Float representing the mean number of replies to a top
+            level comment.
+        depth_decay: Float multiplying the mean number of replies at each
+            level, so values below 1 make deep replies rarer.
+        fanout_skew: Float representing how unevenly replies are shared
+            between comments at the same depth. 0 shares them evenly.
+        words: Float representing the mean number of words per comment.
+        cleaned: Boolean representing whether to add the columns of a
+            cleaned data file, with random sentiment scores.
+        link_id: String representing the fullname of the submission.
+        seed: Integer seeding the random number generator.
+
+    Yields:
+        DataFrames of at most rows_per_chunk comments with RAW_COLUMNS, or
+        CLEANED_COLUMNS if cleaned is True.
+    """
+    # Each part of the data is drawn from its own stream, one value at a
+    # time, so the comments do not depend on rows_per_chunk.
+    tree_rng, length_rng, word_rng, sentiment_rng = [
+        np.random.default_rng(stream) for stream in
+        np.random.SeedSequence(seed).spawn(4)]
+    offset = 0
+    for parents in _iter_parent_chunks(
+            _iter_parents(size, max_depth, branching, depth_decay,
+                          fanout_skew, tree_rng), rows_per_chunk):
+        bodies, tokenized = _synthetic_text(len(parents), words, length_rng,
+                                            word_rng)
+        comment_df = pd.DataFrame({
+            'comment_id': [format(position, 'x') for position in
+                           range(offset, offset + len(parents))],
+            'comment_parent_id': [link_id if parent < 0 else
+                                  't1_' + format(parent, 'x')
+                                  for parent in parents.tolist()],
+            'comment_body': bodies,
+            'comment_link_id': link_id})
+        if cleaned:
+            comment_df['body_hash'] = hash_comment_bodies(bodies)
+            comment_df['tokenized_comment'] = tokenized
+            comment_df['sentiment'] = sentiment_rng.uniform(-1, 1, len(parents))
+        offset += len(parents)
+        yield comment_df
+
+
+def synthetic_comments(size, **options):
+    """
+    Generate a synthetic comment forest all at once.
+
+    Args:
+        size: Integer representing the number of comments.
+        **options: Keyword arguments of iter_synthetic_comments.
+
+    Returns:
+        A DataFrame of the generated comments.
+    """
+    chunks = list(iter_synthetic_comments(size, **options))
+    if not chunks:
+        return pd.DataFrame(columns=CLEANED_COLUMNS if options.get('cleaned')
+                            else RAW_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def write_synthetic_subreddit(subreddit, size, cleaned=False, fmt=None,
+                              **options):
+    """
+    Stream a synthetic subreddit to its raw, and optionally cleaned, data
+    files.
+
+    Args:
+        subreddit: String representing the name to write the files under.
+        size: Integer representing the number of comments.
+        cleaned: Boolean representing whether to also write a cleaned data
+            file, as data_cleaning.store_tokenized_data would.
+        fmt: Optional string representing the storage format to write,
+            'csv' or 'parquet'. Defaults to storage.DEFAULT_FORMAT.
+        **options: Keyword arguments of iter_synthetic_comments.
+
+    Returns:
+        An integer representing the number of comments written.
+    """
+    fmt = fmt or storage.DEFAULT_FORMAT
+    with storage.CommentWriter(storage.raw_path(subreddit, fmt)) as raw, \
+            (storage.CommentWriter(storage.cleaned_path(subreddit, fmt))
+             if cleaned else nullcontext()) as cleaned_writer:
+        for comment_df in iter_synthetic_comments(size, cleaned=cleaned,
+                                                  **options):
+            raw.write(comment_df[RAW_COLUMNS])
+            if cleaned:
+                cleaned_writer.write(comment_df)
+    return raw.rows_written
+
+
+def main(argv=None):
+    """
+    Write a synthetic subreddit from the command line.
+
+    Args:
+        argv: Optional list of strings representing command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('subreddit')
+    parser.add_argument('size', type=int)
+    parser.add_argument('--cleaned', action='store_true',
+                        help='also write a cleaned data file')
+    parser.add_argument('--format', choices=sorted(storage.FORMATS))
+    parser.add_argument('--rows-per-chunk', type=int, default=100000)
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--branching', type=float, default=2.0)
+    parser.add_argument('--depth-decay', type=float, default=1.0)
+    parser.add_argument('--fanout-skew', type=float, default=0.0)
+    parser.add_argument('--words', type=float, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    written = write_synthetic_subreddit(
+        args.subreddit, args.size, args.cleaned, args.format,
+        rows_per_chunk=args.rows_per_chunk, max_depth=args.depth,
+        branching=args.branching, depth_decay=args.depth_decay,
+        fanout_skew=args.fanout_skew, words=args.words, seed=args.seed)
+    print(f'Wrote {written} comments for {args.subreddit}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Unit tests for benchmark.py
+"""
+import pytest
+
+import storage
+from benchmark import (
+    BENCHMARKS,
+    compare,
+    run_benchmarks,
+    scaling_exponent
+)
+
+# Define sets of test cases.
+
+get_scaling_exponent_cases = [
+    # Check that linear growth has an exponent of 1.
+    ([1000, 10000, 100000], [0.01, 0.1, 1.0], 1.0),
+    # Check that quadratic growth has an exponent of 2.
+    ([1000, 10000, 100000], [0.01, 1.0, 100.0], 2.0),
+    # Check that a single size has no exponent.
+    ([1000], [0.01], None)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("sizes, seconds, exponent",
+                         get_scaling_exponent_cases)
+def test_scaling_exponent(sizes, seconds, exponent):
+    """
+    Test that the growth of run time with size is estimated.
+
+    Args:
+        sizes: List of integers representing dataset sizes.
+        seconds: List of floats representing run times.
+        exponent: Float representing the expected exponent, or None.
+    """
+    assert scaling_exponent(sizes, seconds) == pytest.approx(exponent)
+
+
+def test_run_benchmarks():
+    """
+    Test that every benchmark is run at every size, the report can be
+    compared against itself, and the data directories are restored.
+    """
+    report = run_benchmarks([100, 400], subreddits=[], repeat=1)
+    ratios, regressions = compare(report, report)
+    assert sorted((result['benchmark'], result['comments']) for result in
+                  report['results']) == \
+        sorted((benchmark, size) for benchmark in BENCHMARKS
+               for size in [100, 400]) and \
+        set(report['scaling']) == set(BENCHMARKS) and \
+        len(ratios) == 2 * len(BENCHMARKS) and regressions == [] and \
+        storage.RAW_DIRECTORY == './rawdata/' and \
+        storage.CLEANED_DIRECTORY == './cleaneddata/'
@@ -0,0 +1,166 @@
+"""
+Unit tests for comment_forest.py
+"""
+import pytest
+import pandas as pd
+
+from comment_forest import (
+    strip_fullname,
+    CommentForest
+)
+
+# Create testing DataFrame. Comment "11" contains the id "1" as a substring
+# but replies to the submission, not to comment "1".
+test_data = {
+    'comment_id': ["1", "11", "2a", "2b", "3a", "3b", "3c", "4a"],
+    'comment_parent_id': ["t3_post", "t3_post", "t1_1", "t1_1", "t1_2a",
+                          "t1_2a", "t1_2b", "t1_3a"]
+}
+test_comment_df = pd.DataFrame.from_dict(test_data)
+test_forest = CommentForest.from_dataframe(test_comment_df)
+
+# Define sets of test cases.
+
+get_strip_fullname_cases = [
+    # Check that a comment prefix is removed.
+    ("t1_f0wi2tm", "f0wi2tm"),
+    # Check that a submission prefix is removed.
+    ("t3_d6xoro", "d6xoro"),
+    # Check that a bare id is unchanged.
+    ("f0wi2tm", "f0wi2tm"),
+    # Check that an id containing a prefix later on is unchanged.
+    ("abt1_cd", "abt1_cd")
+]
+
+get_replies_cases = [
+    # Check that only exact matches are returned as replies.
+    ("1", ["2a", "2b"]),
+    # Check that prefixed ids are accepted.
+    ("t1_2a", ["3a", "3b"]),
+    # Check that replies to the submission are the top level comments.
+    ("t3_post", ["1", "11"]),
+    # Check that a comment with no replies has none.
+    ("4a", []),
+    # Check that an unknown id has no replies.
+    ("not a comment", [])
+]
+
+get_depths_cases = [
+    # Check that top level comments have depth 0.
+    ("1", 0),
+    ("11", 0),
+    # Check that nested replies have the correct depth.
+    ("2b", 1),
+    ("3c", 2),
+    ("4a", 3)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("reddit_id, bare_id", get_strip_fullname_cases)
+def test_strip_fullname(reddit_id, bare_id):
+    """
+    Test that fullname prefixes are removed.
+
+    Args:
+        reddit_id: String representing a Reddit id.
+        bare_id: String representing the id without its prefix.
+    """
+    assert strip_fullname(reddit_id) == bare_id
+
+
+@pytest.mark.parametrize("comment_id, reply_ids", get_replies_cases)
+def test_replies(comment_id, reply_ids):
+    """
+    Test that direct replies are found by exact id match.
+
+    Args:
+        comment_id: String representing the id of the parent.
+        reply_ids: List of strings of comment ids for the replies.
+    """
+    assert test_forest.replies(comment_id) == reply_ids
+
+
+@pytest.mark.parametrize("comment_id, depth", get_depths_cases)
+def test_depths(comment_id, depth):
+    """
+    Test that every comment is assigned the correct depth.
+
+    Args:
+        comment_id: String representing the id of a comment.
+        depth: Integer representing the expected depth of the comment.
+    """
+    assert test_forest.depths[comment_id] == depth
+
+
+def test_top_level_comments():
+    """
+    Test that the top level comments are the replies to the submission.
+    """
+    assert test_forest.top_level_comments() == ["1", "11"]
+
+
+def test_top_level_comments_posts():
+    """
+    Test that the top level comments of every post are found, whichever
+    post's comments come first.
+    """
+    forest = CommentForest(["b1", "a1", "a2", "b2"],
+                           ["t1_b2", "t3_a", "t1_a1", "t3_b"])
+    assert forest.top_level_comments() == ["a1", "b2"]
+
+
+def test_root_comments():
+    """
+    Test that the roots are the top level comments of every post and the
+    replies to comments that were not scraped.
+    """
+    forest = CommentForest(["a1", "o1", "b1", "a2", "o2"],
+                           ["t3_a", "t1_missing", "t3_b", "t1_a1", "t1_o1"])
+    assert forest.root_comments() == ["a1", "o1", "b1"] and \
+        forest.root_comments() == \
+        forest.thread_labels()['root'].unique().tolist()
+
+
+def test_positions():
+    """
+    Test that comment ids are mapped to their row positions, with -1 for
+    unknown ids.
+    """
+    assert test_forest.positions(["4a", "1", "missing", "2b"]).tolist() == \
+        [7, 0, -1, 3]
+
+
+def test_levels():
+    """
+    Test that replies are swept one depth at a time.
+    """
+    assert list(test_forest.levels("1")) == [["2a", "2b"], ["3a", "3b", "3c"],
+                                            ["4a"]]
+
+
+def test_levels_deep_chain():
+    """
+    Test that a reply chain deeper than the recursion limit can be walked.
+    """
+    chain_length = 5000
+    chain_forest = CommentForest([str(i) for i in range(chain_length)],
+                                 ["post"] + [str(i) for i in
+                                             range(chain_length - 1)])
+    levels = list(chain_forest.levels("0"))
+    assert len(levels) == chain_length - 1 and \
+        levels[-1] == [str(chain_length - 1)] and \
+        chain_forest.depths[str(chain_length - 1)] == chain_length - 1
+
+
+def test_thread_labels():
+    """
+    Test that every comment is labelled with its top level ancestor and
+    depth.
+    """
+    labels = test_forest.thread_labels()
+    assert labels['root'].tolist() == ["1", "11", "1", "1", "1", "1", "1",
+                                       "1"] and \
+        labels['depth'].tolist() == [0, 0, 1, 1, 2, 2, 2, 3]
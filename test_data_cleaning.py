@@ -4,11 +4,19 @@ Make sure data_cleaning.py has processed files before running.
 """
 import os.path
 import pytest
+import pandas as pd
 
 from data_cleaning import (
+    CommentCleaner,
     clean_comment,
-    lemmatize_sentence
+    clean_comments,
+    clean_in_chunks,
+    hash_comment_bodies,
+    reuse_cleaned_comments,
+    lemmatize_sentence,
+    add_sentiment_column
 )
+from sentiment_analysis import analyze_sentiment
 
 # Define sets of test cases.
 
@@ -39,6 +47,46 @@ get_lemmatized_sentence_cases = [
     ("the laws of physics", "the law of physic")
 ]
 
+get_clean_comments_cases = [
+    # Check that cleaning in the current process matches clean_comment.
+    (1, 2),
+    # Check that cleaning in parallel preserves order across chunks.
+    (2, 2),
+    # Check that a chunk larger than the input is handled.
+    (2, 100)
+]
+
+get_clean_in_chunks_cases = [
+    # Check that a file smaller than one chunk is written whole.
+    (10, 1, 1),
+    # Check that chunks are appended in order without repeating the header.
+    (2, 1, 2),
+    # Check that chunks can be cleaned in parallel.
+    (3, 2, 2)
+]
+
+get_hash_comment_bodies_cases = [
+    # Check that identical bodies have identical hashes.
+    (["same text", "same text"], True),
+    # Check that an edited body has a different hash.
+    (["same text", "same text, edited"], False)
+]
+
+get_reuse_cleaned_comments_cases = [
+    # Check that nothing is reused without an existing cleaned file.
+    (None, [True, True, True]),
+    # Check that only unchanged comments with known ids are reused.
+    ("cleaned.csv", [False, True, True])
+]
+
+get_add_sentiment_column_cases = [
+    # Check that each comment is scored from its sentences.
+    (["awesome\\terrible", "today"], [analyze_sentiment(["awesome",
+                                      "terrible"]), analyze_sentiment(["today"])]),
+    # Check that an empty cleaned comment is neutral.
+    ([""], [0])
+]
+
 get_store_tokenized_data_cases = [
     # Check that an empty string does not exist as a file.
     ("cleaneddata", "", False),
@@ -79,6 +127,144 @@ def test_lemmatize_sentnece(comment, lemmatized_comment):
     assert lemmatize_sentence(comment) == lemmatized_comment
 
 
+def test_comment_cleaner_cache():
+    """
+    Test that repeated words are lemmatized from the cache.
+    """
+    cleaner = CommentCleaner(cache_size=8)
+    assert cleaner.clean_comment("Notebooks. NOTEBOOKS notebooks") == \
+        "notebook\\notebook notebook"
+    assert cleaner.lemmatize_word.cache_info().misses == 1 and \
+        cleaner.lemmatize_word.cache_info().hits == 2
+
+
+@pytest.mark.parametrize("workers, chunksize", get_clean_comments_cases)
+def test_clean_comments(workers, chunksize):
+    """
+    Test that comments cleaned in batches match those cleaned one at a time.
+
+    Args:
+        workers: Integer representing the number of worker processes.
+        chunksize: Integer representing the number of comments per chunk.
+    """
+    raw_comments = [raw_comment for raw_comment, _ in get_clean_comment_cases]
+    assert clean_comments(raw_comments, workers, chunksize) == \
+        [clean_comment(raw_comment) for raw_comment in raw_comments]
+
+
+@pytest.mark.parametrize("rows_per_chunk, workers, expected_calls",
+                         get_clean_in_chunks_cases)
+def test_clean_in_chunks(tmp_path, rows_per_chunk, workers,
+                             expected_calls):
+    """
+    Test that a raw CSV streamed in chunks is cleaned in full and in order.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        rows_per_chunk: Integer representing the number of rows per chunk.
+        workers: Integer representing the number of worker processes.
+        expected_calls: Integer representing the expected number of progress
+            reports.
+    """
+    raw_comments = [raw_comment for raw_comment, _ in get_clean_comment_cases
+                    if raw_comment]
+    raw_df = pd.DataFrame({'comment_id': [str(i) for i in
+                                          range(len(raw_comments))],
+                           'comment_body': raw_comments})
+    raw_df.to_csv(tmp_path / 'raw.csv')
+    calls = []
+    clean_in_chunks(tmp_path / 'raw.csv', tmp_path / 'cleaned.csv',
+                        rows_per_chunk, workers, progress=lambda rows, rate:
+                        calls.append(rows))
+    cleaned_df = pd.read_csv(tmp_path / 'cleaned.csv')
+    assert list(cleaned_df.columns) == ['comment_id', 'comment_body',
+                                        'body_hash', 'tokenized_comment',
+                                        'sentiment'] and \
+        cleaned_df['tokenized_comment'].tolist() == \
+        [clean_comment(raw_comment) for raw_comment in raw_comments] and \
+        len(calls) == expected_calls and calls[-1] == len(raw_comments)
+
+
+def test_clean_in_chunks_failure(tmp_path):
+    """
+    Test that a failure part way through leaves the existing cleaned file
+    unchanged and no partial file behind.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    pd.DataFrame({'comment_id': ["1", "2", "3", "4"],
+                  'comment_body': ["first", "second", None, "fourth"]}
+                 ).to_csv(tmp_path / 'raw.csv', index=False)
+    (tmp_path / 'cleaned.csv').write_text('comment_id\n0\n')
+    with pytest.raises(TypeError):
+        clean_in_chunks(tmp_path / 'raw.csv', tmp_path / 'cleaned.csv', 2)
+    assert (tmp_path / 'cleaned.csv').read_text() == 'comment_id\n0\n' \
+        and sorted(os.listdir(tmp_path)) == ['cleaned.csv', 'raw.csv']
+
+
+@pytest.mark.parametrize("comment_bodies, expected_equal",
+                         get_hash_comment_bodies_cases)
+def test_hash_comment_bodies(comment_bodies, expected_equal):
+    """
+    Test that comment bodies are hashed by content.
+
+    Args:
+        comment_bodies: A list of two strings containing comment text.
+        expected_equal: A Boolean value representing whether the two hashes
+            should be equal.
+    """
+    first, second = hash_comment_bodies(comment_bodies)
+    assert (first == second) == expected_equal
+
+
+@pytest.mark.parametrize("cleaned_name, expected_stale",
+                         get_reuse_cleaned_comments_cases)
+def test_reuse_cleaned_comments(tmp_path, cleaned_name, expected_stale):
+    """
+    Test that only new or edited comments are marked for cleaning, and that
+    the cleaned text and score of the others are copied over.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        cleaned_name: String representing the name of the existing cleaned
+            file, or None if there is none.
+        expected_stale: A list of Boolean values representing whether each
+            comment should need cleaning.
+    """
+    pd.DataFrame({
+        'comment_id': ["a", "b"],
+        'body_hash': hash_comment_bodies(["Old comment", "Before edit"]),
+        'tokenized_comment': ["old comment", "before edit"],
+        'sentiment': [0.5, -0.5]
+    }).to_csv(tmp_path / 'cleaned.csv', index=False)
+    subreddit_df = pd.DataFrame({
+        'comment_id': ["a", "b", "c"],
+        'comment_body': ["Old comment", "After edit", "New comment"]
+    })
+    cleaned_path = None if cleaned_name is None else tmp_path / cleaned_name
+    stale = reuse_cleaned_comments(subreddit_df, cleaned_path)
+    assert stale.tolist() == expected_stale and \
+        subreddit_df['tokenized_comment'][~stale].tolist() == \
+        ["old comment"] * (not stale[0]) and \
+        subreddit_df['sentiment'][~stale].tolist() == [0.5] * (not stale[0])
+
+
+@pytest.mark.parametrize("tokenized_comments, sentiments",
+                         get_add_sentiment_column_cases)
+def test_add_sentiment_column(tokenized_comments, sentiments):
+    """
+    Test that a sentiment score is stored for each cleaned comment.
+
+    Args:
+        tokenized_comments: A list of strings representing cleaned comments.
+        sentiments: A list of floats representing the expected scores.
+    """
+    subreddit_df = pd.DataFrame({'tokenized_comment': tokenized_comments})
+    assert add_sentiment_column(subreddit_df)['sentiment'].tolist() == \
+        sentiments
+
+
 @pytest.mark.parametrize("directory, subreddit, expected_boolean",
                          get_store_tokenized_data_cases)
 def test_store_tokenized_data(directory, subreddit, expected_boolean):
@@ -0,0 +1,54 @@
+"""
+Unit tests for nltk_resources.py
+"""
+import nltk
+import pytest
+
+import nltk_resources
+
+# Define sets of test cases.
+
+get_is_available_cases = [
+    # Check that the resources used for cleaning and analysis are found.
+    ("wordnet", True),
+    (nltk_resources.SENTENCE_TOKENIZER, True),
+    ("vader_lexicon", True)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+def test_configure():
+    """
+    Test that the vendored data directory is searched last.
+    """
+    nltk_resources.configure()
+    assert nltk.data.path[-1] == nltk_resources.VENDORED_DIRECTORY
+
+
+@pytest.mark.parametrize("name, expected_boolean", get_is_available_cases)
+def test_is_available(name, expected_boolean):
+    """
+    Test that installed resources are found without downloading them.
+
+    Args:
+        name: String representing a resource name.
+        expected_boolean: A Boolean value representing whether the resource
+            should be found.
+    """
+    assert nltk_resources.is_available(name) == expected_boolean
+
+
+def test_ensure(monkeypatch):
+    """
+    Test that resources that are already available are not downloaded.
+
+    Args:
+        monkeypatch: Fixture provided by pytest to replace nltk.download.
+    """
+    def fail_download(*args, **kwargs):
+        raise AssertionError('nltk.download should not be called')
+    monkeypatch.setattr(nltk, 'download', fail_download)
+    nltk_resources.prefetch()
+    assert set(nltk_resources.REQUIRED) <= nltk_resources._FOUND
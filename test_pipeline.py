@@ -0,0 +1,96 @@
+"""
+Unit tests for pipeline.py
+"""
+import asyncio
+import os.path
+import pytest
+
+from data_cleaning import clean_comment
+from pipeline import (
+    CLEANED_COLUMNS,
+    scrape_clean_score
+)
+from sentiment_analysis import analyze_sentiment
+import storage
+from test_reddit_scraper import FakeRedditClient, test_written_ids
+
+# Define sets of test cases.
+
+get_scrape_clean_score_cases = [
+    # Check that comments are cleaned and scored in a background thread.
+    (1, 8),
+    # Check that comments are cleaned and scored in worker processes, with
+    # scraping paused while a single batch waits.
+    (2, 1)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("workers, buffer_size", get_scrape_clean_score_cases)
+def test_scrape_clean_score(tmp_path, monkeypatch, workers, buffer_size):
+    """
+    Test that scraped comments are written cleaned and scored, in the order
+    they were scraped, without writing raw data.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+        workers: Integer representing the number of worker processes.
+        buffer_size: Integer representing the most batches waiting to be
+            cleaned.
+    """
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/raw_')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    counts = asyncio.run(scrape_clean_score(
+        FakeRedditClient(), ['first', 'second'], workers=workers,
+        buffer_size=buffer_size))
+    comment_df = storage.load_cleaned('second')
+    expected_tokens = [clean_comment(body) for body in
+                       comment_df['comment_body']]
+    assert counts == {'first': 6, 'second': 6} and \
+        list(comment_df.columns) == CLEANED_COLUMNS and \
+        comment_df['comment_id'].tolist() == test_written_ids and \
+        comment_df['tokenized_comment'].tolist() == expected_tokens and \
+        comment_df['sentiment'].tolist() == \
+        [analyze_sentiment(tokens) for tokens in expected_tokens] and \
+        not os.path.isfile(storage.raw_path('second'))
+
+
+class FailingRedditClient:
+    """
+    Stand-in for RedditAPI whose every request fails.
+    """
+
+    async def get(self, path, params=None):
+        """
+        Fail a request after yielding to the event loop.
+        """
+        await asyncio.sleep(0)
+        raise ConnectionError('Connection lost')
+
+
+def test_scrape_clean_score_failure(tmp_path, monkeypatch):
+    """
+    Test that a failed scrape leaves existing cleaned data files unchanged
+    and writes no new ones.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    comment_df = storage.load_cleaned('TalesFromRetail')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    storage.save_cleaned(comment_df, 'first')
+    with open(storage.cleaned_path('first'), 'rb') as cleaned_file:
+        saved = cleaned_file.read()
+    with pytest.raises(ConnectionError):
+        asyncio.run(scrape_clean_score(FailingRedditClient(),
+                                       ['first', 'second']))
+    with open(storage.cleaned_path('first'), 'rb') as cleaned_file:
+        assert cleaned_file.read() == saved and \
+            os.listdir(tmp_path) == [os.path.basename(
+                storage.cleaned_path('first'))]
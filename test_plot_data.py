@@ -0,0 +1,157 @@
+"""
+Unit tests for plot_data.py
+"""
+import os
+import numpy as np
+import pytest
+
+from plot_data import (
+    PlotData,
+    get_trace_frame,
+    downsample_traces,
+    get_bubble_frame,
+    get_histograms,
+    load_plot_data
+)
+import plot_data as plot_data_module
+import sentiment_analysis
+import storage
+
+# Create testing sentiment dictionaries: one thread starting negative, one
+# neutral and two positive.
+test_sentiment_dicts = [
+    {0: (-0.5, 1), 1: (0.25, 2)},
+    {0: (0.0, 1), 1: (0.1, 3), 2: (-0.2, 1)},
+    {0: (0.5, 1), 1: (0.5, 4)},
+    {0: (0.4, 1)}
+]
+
+# Define sets of test cases.
+
+get_downsample_traces_cases = [
+    # Check that every thread is kept when there are few enough.
+    (2, [0, 1, 2, 3]),
+    # Check that the first and last thread of each category are kept.
+    (1, [0, 1, 2])
+]
+
+get_histograms_cases = [
+    # Check scores spread across the range, including both ends.
+    (np.array([0, 0, 1, 1, 1, 3]),
+     np.array([-1.0, 0.0, 1.0, -0.95, 0.5, 0.99])),
+    # Check that no comments give no rows.
+    (np.array([], dtype=int), np.array([]))
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+def test_get_trace_frame():
+    """
+    Test that each thread's depths become rows labelled with the thread's
+    starting polarity and change from its top level comment.
+    """
+    trace_df = get_trace_frame(test_sentiment_dicts)
+    assert trace_df['trace'].tolist() == [0, 0, 1, 1, 1, 2, 2, 3] and \
+        trace_df['category'].tolist() == [-1, -1, 0, 0, 0, 1, 1, 1] and \
+        trace_df['change'].tolist() == [0.0, 0.75, 0.0, 0.1, -0.2, 0.0,
+                                        0.0, 0.0] and \
+        trace_df['count'].sum() == 14
+
+
+@pytest.mark.parametrize("max_traces, expected_traces",
+                         get_downsample_traces_cases)
+def test_downsample_traces(max_traces, expected_traces):
+    """
+    Test that at most max_traces threads of each starting polarity are kept.
+
+    Args:
+        max_traces: Integer representing the most threads per category.
+        expected_traces: List of integers representing the threads kept.
+    """
+    trace_df = downsample_traces(get_trace_frame(test_sentiment_dicts),
+                                 max_traces)
+    assert sorted(trace_df['trace'].unique().tolist()) == expected_traces
+
+
+def test_get_bubble_frame():
+    """
+    Test that bubbles at the same depth and rounded score are merged,
+    adding up their comments.
+    """
+    bubble_df = get_bubble_frame(get_trace_frame(test_sentiment_dicts), 4)
+    sentiment = bubble_df[bubble_df['kind'] == 'sentiment']
+    merged = sentiment[(sentiment['depth'] == 0) &
+                       (sentiment['category'] == 1)]
+    assert merged['value'].tolist() == [0.5] and \
+        merged['count'].tolist() == [2] and \
+        bubble_df.groupby('kind')['count'].sum().tolist() == [14, 14]
+
+
+@pytest.mark.parametrize("depths, scores", get_histograms_cases)
+def test_get_histograms(depths, scores):
+    """
+    Test that the scores at each depth are counted as numpy.histogram
+    would.
+
+    Args:
+        depths: NumPy array of integers representing comment depths.
+        scores: NumPy array of floats representing comment scores.
+    """
+    depth_values = np.unique(depths)
+    edges, histograms = get_histograms(depths, scores, depth_values, 8)
+    assert histograms.shape == (len(depth_values), 8) and \
+        all(np.array_equal(histogram, np.histogram(
+            scores[depths == depth], edges)[0])
+            for depth, histogram in zip(depth_values, histograms))
+
+
+def test_plot_data(tmp_path):
+    """
+    Test that plot data summarizes every comment of a subreddit and is
+    saved and loaded unchanged.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    thread = sentiment_analysis.load_thread('AskReddit')
+    plot_data = PlotData.from_thread(thread, all_threads=True, max_traces=5)
+    plot_data.save(str(tmp_path / 'plot_data.npz'), [1, 2])
+    loaded, source = PlotData.load(str(tmp_path / 'plot_data.npz'))
+    comment_count = len(thread.comment_df)
+    assert plot_data.distribution['count'].sum() == comment_count and \
+        plot_data.histograms.sum() == comment_count and \
+        plot_data.traces['trace'].nunique() <= 15 and source == [1, 2] and \
+        all(getattr(loaded, name).equals(getattr(plot_data, name))
+            for name in PlotData.FRAMES) and \
+        np.array_equal(loaded.histograms, plot_data.histograms) and \
+        loaded.settings == plot_data.settings
+
+
+def test_load_plot_data(tmp_path, monkeypatch):
+    """
+    Test that plot data is cached next to the cleaned data, read back while
+    current, and rebuilt once the cleaned data changes.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    comment_df = storage.load_cleaned('TalesFromRetail')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    storage.save_cleaned(comment_df, 'cached')
+    first = load_plot_data('cached')
+    path = storage.plot_data_path('cached')
+    built = os.stat(path).st_mtime_ns
+    with monkeypatch.context() as patch:
+        # A current cache is read without loading the comments.
+        patch.setattr(plot_data_module, 'load_thread', None)
+        cached = load_plot_data('cached')
+    storage.save_cleaned(comment_df.head(20), 'cached')
+    rebuilt = load_plot_data('cached')
+    assert os.stat(path).st_mtime_ns != built and \
+        cached.distribution.equals(first.distribution) and \
+        rebuilt.distribution['count'].sum() < \
+        first.distribution['count'].sum()
@@ -0,0 +1,111 @@
+"""
+Unit tests for plotting_functions.py
+"""
+import os.path
+import matplotlib.pyplot as plt
+import pytest
+
+from plotting_functions import (
+    PLOTS,
+    get_sentiment_distribution,
+    render_subreddits,
+    sentiment_distribution_violin
+)
+import storage
+
+plt.switch_backend('agg')
+
+# Define sets of test cases.
+
+get_sentiment_distribution_cases = [
+    # Check that each score gets a row labelled with its depth.
+    ({0: [0.5], 1: [-0.25, 0.0], 2: [0.75]},
+     [0, 1, 1, 2], [0.5, -0.25, 0.0, 0.75]),
+    # Check that depths without comments add no rows.
+    ({0: [0.1], 1: []}, [0], [0.1]),
+    # Check that an empty thread gives an empty frame.
+    ({}, [], [])
+]
+
+get_render_subreddits_cases = [
+    # Check that every plot is rendered in the current process.
+    (None, ['png'], 1, False),
+    # Check that plots are rendered in both formats by worker processes.
+    (['line', 'distribution_violin'], ['png', 'svg'], 2, False),
+    # Check that every plot is rendered from summarized plot data.
+    (None, ['png'], 1, True)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("sentiment_dict, depths, sentiments",
+                         get_sentiment_distribution_cases)
+def test_get_sentiment_distribution(sentiment_dict, depths, sentiments):
+    """
+    Test that sentiment lists are converted to one row per comment.
+
+    Args:
+        sentiment_dict: A dictionary mapping depths to lists of scores.
+        depths: A list of integers representing the expected depth column.
+        sentiments: A list of floats representing the expected sentiment
+            column.
+    """
+    comment_df = get_sentiment_distribution(sentiment_dict)
+    assert list(comment_df.columns) == ['depth', 'sentiment'] and \
+        comment_df['depth'].tolist() == depths and \
+        comment_df['sentiment'].tolist() == sentiments
+
+
+def test_sentiment_distribution_violin():
+    """
+    Test that the violin plot is drawn without being shown and returns its
+    figure.
+    """
+    figure = sentiment_distribution_violin(
+        'test', {0: [0.5], 1: [-0.25, 0.0, 0.25]}, show=False)
+    assert figure.axes[0].get_xlabel() == 'Comment depth'
+    plt.close(figure)
+
+
+@pytest.mark.parametrize("plots, formats, workers, summarized",
+                         get_render_subreddits_cases)
+def test_render_subreddits(tmp_path, monkeypatch, plots, formats, workers,
+                           summarized):
+    """
+    Test that every requested plot of every subreddit is saved in every
+    format.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to keep cached plot data out
+            of the data directory.
+        plots: A list of strings representing plot names, or None for all.
+        formats: A list of strings representing image formats.
+        workers: An integer representing the number of worker processes.
+        summarized: A Boolean representing whether to draw from plot data.
+    """
+    monkeypatch.setattr(storage, 'plot_data_path',
+                        lambda subreddit, all_threads=False:
+                        str(tmp_path / f'{subreddit}_plot_data.npz'))
+    rendered = render_subreddits(['test', 'TalesFromRetail'], str(tmp_path),
+                                 plots, formats, workers=workers,
+                                 summarized=summarized)
+    expected = [str(tmp_path / f'{subreddit}_{plot}.{image_format}')
+                for subreddit in ['test', 'TalesFromRetail']
+                for plot in (plots or PLOTS) for image_format in formats]
+    assert sum(rendered.values(), []) == expected and \
+        all(os.path.getsize(path) > 0 for path in expected) and \
+        not plt.get_fignums()
+
+
+def test_render_subreddits_unknown_plot(tmp_path):
+    """
+    Test that unknown plot names are rejected.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    with pytest.raises(ValueError):
+        render_subreddits(['test'], str(tmp_path), ['pie'])
@@ -2,9 +2,19 @@
 Unit tests for reddit_scraper.py
 Make sure reddit_scraper.py has processed files before running.
 """
+import asyncio
 import os.path
 import pytest
 
+import storage
+from reddit_scraper import (
+    COMMENT_COLUMNS,
+    RateLimiter,
+    RedditAPI,
+    fetch_submission_comments,
+    scrape_subreddits
+)
+
 # Define sets of test cases.
 
 test_subreddit_list = ['AmItheAsshole', 'politics', 'MadeMeSmile', 'AskReddit',
@@ -18,6 +28,154 @@ get_scrape_reddit_comments_cases = [
 ]
 
 
+# Create a fake Reddit post. Comment c4 is collapsed under c2 and c5 under
+# the post, and c6 is only loaded by continuing the thread below c4.
+
+
+def _comment(comment_id, parent_id, replies=()):
+    """
+    Build a t1 thing as returned by the Reddit API.
+
+    Args:
+        comment_id: String representing the id of the comment.
+        parent_id: String representing the fullname of its parent.
+        replies: List of things replying to the comment.
+
+    Returns:
+        A dictionary representing the comment.
+    """
+    return {'kind': 't1', 'data': {
+        'id': comment_id, 'parent_id': parent_id, 'link_id': 't3_post1',
+        'body': 'Comment ' + comment_id,
+        'replies': {'kind': 'Listing', 'data': {'children': list(replies)}}
+        if replies else ''}}
+
+
+def _more(parent_id, children):
+    """
+    Build a more thing as returned by the Reddit API.
+
+    Args:
+        parent_id: String representing the fullname of the parent.
+        children: List of strings of collapsed comment ids, or an empty
+            list for a thread that continues on another page.
+
+    Returns:
+        A dictionary representing the collapsed comments.
+    """
+    return {'kind': 'more', 'data': {
+        'id': children[0] if children else '_', 'parent_id': parent_id,
+        'count': len(children), 'children': children}}
+
+
+def _listing(children):
+    """
+    Wrap things in a Listing.
+    """
+    return {'kind': 'Listing', 'data': {'children': children, 'after': None}}
+
+
+test_post_comments = _listing([
+    _comment('c1', 't3_post1', [_comment('c2', 't1_c1',
+                                         [_more('t1_c2', ['c4'])])]),
+    _comment('c3', 't3_post1'),
+    _more('t3_post1', ['c5'])
+])
+test_more_children = {
+    'c4': [_comment('c4', 't1_c2'), _more('t1_c4', [])],
+    'c5': [_comment('c5', 't3_post1')]
+}
+test_continued_thread = _listing([
+    _comment('c4', 't1_c2', [_comment('c6', 't1_c4')])
+])
+test_expected_ids = ['c1', 'c3', 'c5', 'c2', 'c4', 'c6']
+# Comments are written as each round of requests returns.
+test_written_ids = ['c1', 'c3', 'c2', 'c5', 'c4', 'c6']
+
+
+def fake_reddit_response(path, params):
+    """
+    Answer an API request for the fake post.
+
+    Args:
+        path: String representing the path of the endpoint.
+        params: Dictionary of query parameters.
+
+    Returns:
+        The JSON data Reddit would return.
+    """
+    if path.endswith('/top'):
+        return {'kind': 'Listing', 'data': {'after': None, 'children': [
+            {'kind': 't3', 'data': {'id': 'post1'}}]}}
+    if path == '/api/morechildren':
+        return {'json': {'data': {'things': [
+            thing for comment_id in params['children'].split(',')
+            for thing in test_more_children[comment_id]]}}}
+    if 'comment' in params:
+        return [_listing([]), test_continued_thread]
+    return [_listing([]), test_post_comments]
+
+
+class FakeRedditClient:
+    """
+    Stand-in for RedditAPI that answers from memory.
+
+    Attributes:
+        paths: List of strings containing the path of every request made.
+        fail_continued: Boolean representing whether loading a continued
+            thread raises a ConnectionError, interrupting the scrape.
+    """
+
+    def __init__(self, fail_continued=False):
+        self.paths = []
+        self.fail_continued = fail_continued
+
+    async def get(self, path, params=None):
+        """
+        Answer a request after yielding to the event loop.
+        """
+        params = params or {}
+        self.paths.append(path)
+        await asyncio.sleep(0)
+        if self.fail_continued and 'comment' in params:
+            raise ConnectionError('Connection lost')
+        return fake_reddit_response(path, params)
+
+
+def _fake_reddit_server():
+    """
+    Build a local web server that imitates the Reddit API.
+
+    The first listing request is rate limited, and every API request must
+    carry the token handed out by the token endpoint.
+
+    Returns:
+        An aiohttp TestServer for the fake API.
+    """
+    web = pytest.importorskip('aiohttp.web')
+    from aiohttp.test_utils import TestServer
+    rate_limited = []
+
+    async def access_token(request):
+        return web.json_response({'access_token': 'token',
+                                  'expires_in': 3600})
+
+    async def api(request):
+        if request.headers.get('Authorization') != 'bearer token':
+            return web.json_response({}, status=401)
+        if request.path.endswith('/top') and not rate_limited:
+            rate_limited.append(request.path)
+            return web.json_response({}, status=429,
+                                     headers={'Retry-After': '0'})
+        return web.json_response(fake_reddit_response(
+            request.path, dict(request.query)))
+
+    app = web.Application()
+    app.router.add_post('/api/v1/access_token', access_token)
+    app.router.add_get('/{path:.*}', api)
+    return TestServer(app)
+
+
 # Define standard testing functions to check functions' outputs given certain
 # inputs defined above.
 
@@ -40,3 +198,114 @@ def test_store_tokenized_data(directory, subreddit_list, expected_boolean):
         if os.path.isfile(path) != expected_boolean:
             assert os.path.isfile(path) != expected_boolean
     assert os.path.isfile(path) == expected_boolean
+
+
+def test_fetch_submission_comments():
+    """
+    Test that collapsed and continued replies are loaded, and comments are
+    listed breadth first.
+    """
+    comments = asyncio.run(fetch_submission_comments(FakeRedditClient(),
+                                                     't3_post1'))
+    assert [comment[0] for comment in comments] == test_expected_ids and \
+        comments[-1] == ('c6', 't1_c4', 'Comment c6', 't3_post1')
+
+
+def test_scrape_subreddits(tmp_path, monkeypatch):
+    """
+    Test that every subreddit is scraped and written in the raw format.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the rawdata
+            directory.
+    """
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/')
+    client = FakeRedditClient()
+    counts = asyncio.run(scrape_subreddits(client, ['first', 'second'],
+                                           max_submissions=1))
+    comment_df = storage.load_raw('second')
+    assert counts == {'first': 6, 'second': 6} and \
+        list(comment_df.columns) == COMMENT_COLUMNS and \
+        comment_df['comment_id'].tolist() == test_written_ids and \
+        client.paths.count('/api/morechildren') == 2 and \
+        not os.path.isfile(storage.checkpoint_path('second'))
+
+
+def test_reddit_api_fake_server(tmp_path, monkeypatch):
+    """
+    Test that RedditAPI authenticates, retries rate limited requests, and
+    scrapes a local fake Reddit server.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the rawdata
+            directory.
+    """
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/')
+    server = _fake_reddit_server()
+
+    async def scrape():
+        await server.start_server()
+        try:
+            async with RedditAPI('id', 'secret',
+                                 api_url=str(server.make_url('')),
+                                 token_url=str(server.make_url(
+                                     '/api/v1/access_token'))) as client:
+                return await scrape_subreddits(client, ['local'])
+        finally:
+            await server.close()
+    assert asyncio.run(scrape()) == {'local': 6} and \
+        storage.load_raw('local')['comment_id'].tolist() == test_written_ids
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_scrape_subreddits_resume(tmp_path, monkeypatch, fmt):
+    """
+    Test that an interrupted scrape keeps the comments it wrote and resumes
+    from its checkpoint without loading them again.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the rawdata
+            directory.
+        fmt: String representing the storage format.
+    """
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/')
+    with pytest.raises(ConnectionError):
+        asyncio.run(scrape_subreddits(FakeRedditClient(fail_continued=True),
+                                      ['resumed'], fmt=fmt, batch_size=2))
+    interrupted_ids = storage.load_raw('resumed')['comment_id'].tolist()
+    client = FakeRedditClient()
+    counts = asyncio.run(scrape_subreddits(client, ['resumed']))
+    assert interrupted_ids == test_written_ids[:5] and \
+        os.path.isfile(storage.raw_path('resumed', fmt)) and \
+        storage.load_raw('resumed')['comment_id'].tolist() == \
+        test_written_ids and counts == {'resumed': 6} and \
+        client.paths == ['/comments/post1'] and \
+        not os.path.isfile(storage.checkpoint_path('resumed'))
+
+
+def test_rate_limiter():
+    """
+    Test that requests beyond the burst are spaced out at the sustained rate,
+    and that a used up limit pauses requests until it resets.
+    """
+    now = [0.0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    limiter = RateLimiter(requests_per_minute=60, burst=2,
+                          clock=lambda: now[0], sleep=sleep)
+
+    async def make_requests(count):
+        for _ in range(count):
+            await limiter.acquire()
+    asyncio.run(make_requests(4))
+    burst_time = now[0]
+    limiter.update({'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '30'})
+    asyncio.run(make_requests(1))
+    assert burst_time == pytest.approx(2) and now[0] == pytest.approx(32)
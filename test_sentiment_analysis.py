@@ -1,17 +1,36 @@
 """
 Unit tests for sentiment_analysis.py
 """
+import glob
 import pytest
+import numpy as np
 import pandas as pd
 
+import sentiment_analysis
 from sentiment_analysis import (
     find_replies,
     create_reply_dict,
     get_most_replied_comments,
+    get_analyzer,
     analyze_sentiment,
+    analyze_sentiments,
+    split_tokenized_comment,
+    get_fast_scorer,
+    FAST_VADER_TOLERANCE,
+    PolarityCache,
+    get_polarity_cache,
+    comment_scores,
     avg_depth_sentiment,
     get_sentiment_by_depth,
     get_sentiment_lists,
+    get_depth_statistics,
+    label_thread_scores,
+    get_thread_statistics,
+    top_threads,
+    analyze_subreddits,
+    AnalyzedThread,
+    load_thread,
+    clear_thread_cache,
     analyze_subreddit_by_depth,
     analyze_subreddit_distribution
 )
@@ -118,6 +137,60 @@ get_analyze_sentiment_cases = [
     (["beans"], "neutral")
 ]
 
+get_analyze_sentiments_cases = [
+    # Check that an empty batch returns an empty array.
+    ([], []),
+    # Check that backslash-separated comments are scored per sentence.
+    (["bad\\today"], [analyze_sentiment(["bad", "today"])]),
+    # Check that lists of sentences are accepted and order is preserved.
+    ([["acceptance"], ["bad"]], [analyze_sentiment(["acceptance"]),
+                                 analyze_sentiment(["bad"])]),
+    # Check that invalid comments (NaN) are neutral.
+    ([float('nan'), "acceptance"], [0, analyze_sentiment(["acceptance"])])
+]
+
+get_fast_vader_cases = [
+    # Check that a sentence with no lexicon words is neutral.
+    "the cow jumped on the pitchfork",
+    # Check booster and dampener words at each distance.
+    "very good", "extremely very good", "somewhat kinda barely good",
+    # Check negation, including never so and least.
+    "not good", "not really very good", "never so good", "at least good",
+    "least good", "very least good",
+    # Check idioms and booster bigrams.
+    "this is the shit", "cut the mustard", "kind of good", "kind of",
+    "sort of bad thing",
+    # Check that words before and after but are weighted.
+    "good but bad", "bad but good but great",
+    # Check that repeats are scored in the context of the first occurrence.
+    "good not good good",
+    # Check that single characters are ignored.
+    "a good x",
+    # Check that capitals and punctuation fall back to NLTK.
+    "GOOD job", "great!!", "is it bad??", "$5.00 is a bad price", ""
+]
+
+# Create a DataFrame where one comment was cleaned to nothing (NaN).
+nan_comment_df = pd.DataFrame.from_dict({
+    'comment_id': ["1", "2"],
+    'comment_parent_id': ["0", "1"],
+    'tokenized_comment': ["awesome", float('nan')]
+})
+
+get_comment_scores_cases = [
+    # Check that an invalid comment after a valid one is neutral rather than
+    # reusing the previous comment's text.
+    (nan_comment_df, ["1", "2"], [analyze_sentiment(["awesome"]), 0]),
+    # Check that comments are scored in the requested order.
+    (test_comment_df, ["2b", "1"], [analyze_sentiment(["comment 2b TERRIBLE"]),
+                                    analyze_sentiment(["comment 1a AWESOME"])]),
+    # Check that unknown comment ids are neutral.
+    (test_comment_df, ["not a comment"], [0]),
+    # Check that stored sentiment scores are read instead of rescoring.
+    (test_comment_df.assign(sentiment=[0.5, 0.25, -1, 0, 0, 0, 0.125]),
+     ["4a", "2b", "1"], [0.125, -1, 0.5])
+]
+
 get_avg_depth_sentiment_cases = [
     # Test a depth with one comment.
     (test_comment_df, 0, test_reply_dicts[0], "positive"),
@@ -135,6 +208,39 @@ get_get_sentiment_lists_cases = [
     (test_comment_df, test_reply_dicts)
 ]
 
+get_get_depth_statistics_cases = [
+    # Check that statistics are computed for each depth of each thread.
+    (test_comment_df.assign(sentiment=[0.5, 0.25, -0.25, 1, 0, -1, 0.125]),
+     test_reply_dicts + [{0: ["2b"], 1: ["3c"]}],
+     [(0, 0, 1, 0.5, 0.5), (0, 1, 2, 0.0, 0.25), (0, 2, 3, 0.0, 1),
+      (0, 3, 1, 0.125, 0.125), (1, 0, 1, -0.25, -0.25), (1, 1, 1, -1, -1)])
+]
+
+# Create a DataFrame with two top level threads of different shapes: "a" is
+# deep and narrow and "b" is shallow and wide.
+threads_comment_df = pd.DataFrame.from_dict({
+    'comment_id': ["a", "b", "a1", "b1", "b2", "b3", "b4", "a2", "a3"],
+    'comment_parent_id': ["t3_post", "t3_post", "t1_a", "t1_b", "t1_b", "t1_b",
+                          "t1_b", "t1_a1", "t1_a2"],
+    'sentiment': [0.5, -0.5, 0.25, 0, 1, -1, 0, 0.75, 0.125]
+})
+
+get_top_threads_cases = [
+    # Check that threads are ranked by their deepest reply.
+    (1, "depth", ["a"]),
+    # Check that threads are ranked by their number of replies.
+    (1, "replies", ["b"]),
+    # Check that asking for more threads than exist returns them all.
+    (5, "depth", ["a", "b"])
+]
+
+get_analyze_subreddits_cases = [
+    # Check that subreddits are analyzed in the current process.
+    (["test"], 1),
+    # Check that subreddits are analyzed in worker processes, in order.
+    (["test", "test"], 2)
+]
+
 get_analyze_subreddit_by_depth_cases = [
     # Check retrieval of data, that depths correspond correctly, and that
     # sentiment scores are floats. Uses test data
@@ -218,6 +324,180 @@ def test_analyze_sentiment(comment_body, expected_sentiment):
         assert analyze_sentiment(comment_body) == 0
 
 
+def test_get_analyzer():
+    """
+    Test that the VADER analyzer is created once and shared.
+    """
+    assert get_analyzer() is get_analyzer()
+
+
+@pytest.mark.parametrize("tokenized_comments, expected_scores",
+                         get_analyze_sentiments_cases)
+def test_analyze_sentiments(tokenized_comments, expected_scores):
+    """
+    Test that batched sentiment analysis matches per-comment analysis.
+
+    Args:
+        tokenized_comments: A list of comments to score.
+        expected_scores: A list of floats representing the expected score of
+            each comment.
+    """
+    scores = analyze_sentiments(tokenized_comments)
+    assert isinstance(scores, np.ndarray) and \
+        scores.tolist() == expected_scores
+
+
+def test_analyze_sentiments_scorers():
+    """
+    Test that both scoring engines give the same scores, and unknown
+    engines are rejected.
+    """
+    comments = ["good but bad\\not very good", "today", float('nan')]
+    fast_scores = analyze_sentiments(comments).tolist()
+    # Clear the shared cache so the VADER scores are not read from it.
+    get_polarity_cache().clear()
+    assert fast_scores == \
+        analyze_sentiments(comments, scorer='vader').tolist()
+    with pytest.raises(ValueError):
+        analyze_sentiments(comments, scorer='unknown')
+
+
+@pytest.mark.parametrize("sentence", get_fast_vader_cases)
+def test_fast_vader(sentence):
+    """
+    Test that each of VADER's rules gives the same compound score as NLTK.
+
+    Args:
+        sentence: A string representing a sentence to score.
+    """
+    assert get_fast_scorer().compound(sentence) == \
+        get_analyzer().polarity_scores(sentence)['compound']
+
+
+def test_fast_vader_conformance():
+    """
+    Test that every sentence in the bundled cleaned data scores within
+    FAST_VADER_TOLERANCE of NLTK's VADER.
+    """
+    sentences = [sentence for path in
+                 sorted(glob.glob('./cleaneddata/*_comments_cleaned.csv'))
+                 for comment in pd.read_csv(path)['tokenized_comment']
+                 for sentence in split_tokenized_comment(comment)]
+    expected = np.array([get_analyzer().polarity_scores(sentence)['compound']
+                         for sentence in sentences])
+    scores = get_fast_scorer().score_sentences(sentences)
+    assert len(sentences) > 1000 and \
+        np.abs(scores - expected).max() <= FAST_VADER_TOLERANCE
+
+
+def test_polarity_cache():
+    """
+    Test that repeated sentences are scored once, and the least recently
+    used sentence is evicted when the cache is full.
+    """
+    scored = []
+
+    def score(sentence):
+        scored.append(sentence)
+        return get_analyzer().polarity_scores(sentence)['compound']
+
+    cache = PolarityCache(maxsize=2)
+    scores = [cache.get(sentence, score) for sentence in
+              ['lol', 'deleted', 'lol', 'good', 'deleted', 'lol']]
+    assert scores == [score(sentence) for sentence in
+                      ['lol', 'deleted', 'lol', 'good', 'deleted', 'lol']] \
+        and scored[:5] == ['lol', 'deleted', 'good', 'deleted', 'lol'] and \
+        tuple(cache.cache_info()) == (1, 5, 2, 2)
+
+
+def test_polarity_cache_persistence(tmp_path):
+    """
+    Test that a saved cache is loaded back, newest entries first, and that
+    files saved with another lexicon are ignored.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    path = str(tmp_path / 'polarity.npz')
+    cache = PolarityCache(path=path)
+    for sentence in ['good', 'bad', 'lol']:
+        cache.get(sentence, lambda sentence: len(sentence))
+    cache.save()
+    loaded = PolarityCache(maxsize=2, path=path)
+    assert len(loaded) == 2 and \
+        loaded.get('lol', lambda sentence: 0) == 3 and \
+        loaded.get('bad', lambda sentence: 0) == 3 and \
+        loaded.get('good', lambda sentence: 0) == 0
+    with np.load(path) as saved:
+        np.savez(path, keys=saved['keys'], scores=saved['scores'],
+                 lexicon=np.array('another lexicon'))
+    assert len(PolarityCache(path=path)) == 0
+
+
+def test_polarity_cache_keys(tmp_path):
+    """
+    Test that every saved digest is loaded back unchanged, including
+    digests ending in zero bytes.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    path = str(tmp_path / 'polarity.npz')
+    sentences = [f'sentence {index}' for index in range(2000)]
+    cache = PolarityCache(path=path)
+    for sentence in sentences:
+        cache.get(sentence, lambda sentence: len(sentence))
+    cache.save()
+    loaded = PolarityCache(path=path)
+    assert any(PolarityCache.key(sentence).endswith(b'\x00')
+               for sentence in sentences) and \
+        [loaded.get(sentence, lambda sentence: -1) for sentence in
+         sentences] == [len(sentence) for sentence in sentences] and \
+        loaded.cache_info().hits == len(sentences)
+
+
+def test_polarity_cache_disabled(tmp_path):
+    """
+    Test that a cache that keeps no sentences loads nothing from an
+    existing file.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    path = str(tmp_path / 'polarity.npz')
+    cache = PolarityCache(path=path)
+    cache.get('good', lambda sentence: 1.0)
+    cache.save()
+    assert len(PolarityCache(maxsize=0, path=path)) == 0
+
+
+def test_shared_polarity_cache():
+    """
+    Test that analyze_sentiment and analyze_sentiments look sentences up in
+    the shared cache.
+    """
+    cache = get_polarity_cache()
+    cache.clear()
+    analyze_sentiment(['good day', 'good day'])
+    analyze_sentiments(['good day\\good day'])
+    assert tuple(cache.cache_info())[:2] == (3, 1)
+
+
+@pytest.mark.parametrize("comment_df, comment_ids, expected_scores",
+                         get_comment_scores_cases)
+def test_comment_scores(comment_df, comment_ids, expected_scores):
+    """
+    Test that comments are scored by id, with invalid comments neutral.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        comment_ids: List of strings representing comment ids.
+        expected_scores: A list of floats representing the expected score of
+            each comment.
+    """
+    assert comment_scores(comment_df, comment_ids).tolist() == expected_scores
+
+
 @pytest.mark.parametrize("comment_df, depth, comments_by_depth, \
     expected_sentiment", get_avg_depth_sentiment_cases)
 def test_avg_depth_sentiment(comment_df, depth, comments_by_depth,
@@ -277,6 +557,59 @@ def test_get_sentiment_lists(comment_df, reply_dicts):
     assert list(get_sentiment_lists(comment_df, reply_dicts)[0].keys()) == \
     sorted(get_sentiment_lists(comment_df, reply_dicts)[0].keys()) and is_float
 
+@pytest.mark.parametrize("comment_df, reply_dicts, expected_rows",
+                         get_get_depth_statistics_cases)
+def test_get_depth_statistics(comment_df, reply_dicts, expected_rows):
+    """
+    Test that the per-depth statistics table has one row per thread and
+    depth with the correct count, mean and maximum.
+
+    Args:
+        comment_df: DataFrame containing cleaned comment data.
+        reply_dicts: A list of dictionaries, where the key represents depth and
+            the values represent the comment_id of each comment at that depth.
+        expected_rows: A list of (thread, depth, count, mean, max) tuples.
+    """
+    statistics = get_depth_statistics(comment_df, reply_dicts)
+    assert list(statistics[['thread', 'depth', 'count', 'mean', 'max']]
+                .itertuples(index=False, name=None)) == expected_rows
+
+
+def test_label_thread_scores():
+    """
+    Test that every comment is labelled with its thread, depth and score.
+    """
+    labels = label_thread_scores(threads_comment_df)
+    assert labels['root'].tolist() == ["a", "b", "a", "b", "b", "b", "b",
+                                       "a", "a"] and \
+        labels['sentiment'].tolist() == \
+        threads_comment_df['sentiment'].tolist()
+
+
+def test_get_thread_statistics():
+    """
+    Test that all threads are summarized in one table by root and depth.
+    """
+    statistics = get_thread_statistics(threads_comment_df)
+    assert list(statistics[['root', 'depth', 'count', 'mean']].itertuples(
+        index=False, name=None)) == [("a", 0, 1, 0.5), ("a", 1, 1, 0.25),
+                                     ("a", 2, 1, 0.75), ("a", 3, 1, 0.125),
+                                     ("b", 0, 1, -0.5), ("b", 1, 4, 0.0)]
+
+
+@pytest.mark.parametrize("count, by, expected_roots", get_top_threads_cases)
+def test_top_threads(count, by, expected_roots):
+    """
+    Test that the top threads are selected by depth or by reply count.
+
+    Args:
+        count: Integer representing the number of threads to return.
+        by: String representing how to rank threads.
+        expected_roots: List of strings of the expected top level comment ids.
+    """
+    assert top_threads(threads_comment_df, count, by) == expected_roots
+
+
 @pytest.mark.parametrize("subreddit", get_analyze_subreddit_by_depth_cases)
 def test_analyze_subreddit_by_depth(subreddit):
     """
@@ -314,3 +647,100 @@ def test_analyze_subreddit_distribution(subreddit):
 
     assert test_depths == sorted(test_depths) and all(isinstance(score, float
                                                 ) for score in flat_sentiments)
+
+
+@pytest.mark.parametrize("subreddit_list, workers",
+                         get_analyze_subreddits_cases)
+def test_analyze_subreddits(subreddit_list, workers):
+    """
+    Test that statistics for several subreddits are combined into one table
+    keyed by subreddit, root and depth.
+
+    Args:
+        subreddit_list: List of strings representing subreddit names.
+        workers: Integer representing the number of worker processes.
+    """
+    statistics = analyze_subreddits(subreddit_list, workers)
+    assert list(statistics.columns[:3]) == ['subreddit', 'root', 'depth'] \
+        and statistics['subreddit'].tolist() == \
+        [subreddit for subreddit in subreddit_list for _ in range(4)] and \
+        statistics['count'].tolist() == [1, 2, 3, 1] * len(subreddit_list)
+
+
+def test_analyzed_thread():
+    """
+    Test that an AnalyzedThread serves the same results as the standalone
+    functions and computes each view only once.
+    """
+    thread = AnalyzedThread(test_comment_df)
+    reply_dicts = thread.reply_dicts()
+    assert reply_dicts == test_reply_dicts and \
+        thread.by_depth() == get_sentiment_by_depth(test_comment_df,
+                                                    test_reply_dicts) and \
+        thread.distribution() == get_sentiment_lists(test_comment_df,
+                                                     test_reply_dicts) and \
+        thread.reply_dicts() is reply_dicts
+
+
+def test_analyzed_thread_posts():
+    """
+    Test that the threads of every post in a file are analyzed, not only
+    those of the post whose comments were written first.
+    """
+    comment_df = pd.DataFrame({
+        'comment_id': ["a1", "b1", "a2", "b2"],
+        'comment_parent_id': ["t3_a", "t3_b", "t1_a1", "t1_b1"],
+        'tokenized_comment': ["good", "bad", "great", "awful"]})
+    thread = AnalyzedThread(comment_df)
+    assert [reply_dict[0] for reply_dict in thread.reply_dicts()] == \
+        [["a1"], ["b1"]] and len(thread.by_depth(all_threads=True)) == 2 \
+        and thread.thread_statistics()['root'].unique().tolist() == \
+        ["a1", "b1"]
+
+
+def test_analyzed_thread_roots():
+    """
+    Test that the all threads views cover the same threads as the thread
+    statistics, across posts and including an orphaned reply.
+    """
+    comment_df = pd.DataFrame({
+        'comment_id': ["a1", "b1", "a2", "o1", "o2"],
+        'comment_parent_id': ["t3_a", "t3_b", "t1_a1", "t1_missing",
+                              "t1_o1"],
+        'tokenized_comment': ["good", "bad", "great", "awful", "fine"]})
+    thread = AnalyzedThread(comment_df)
+    roots = [reply_dict[0][0] for reply_dict in
+             thread.reply_dicts(all_threads=True)]
+    assert roots == ["a1", "b1", "o1"] and \
+        set(roots) == set(thread.thread_statistics()['root']) and \
+        set(roots) == set(top_threads(comment_df, 5)) and \
+        len(thread.by_depth(all_threads=True)) == 3 and \
+        len(thread.distribution(all_threads=True)) == 3 and \
+        [reply_dict[0] for reply_dict in thread.reply_dicts()] == [["a1"]]
+
+
+def test_load_thread():
+    """
+    Test that a subreddit's thread is loaded once and reused.
+    """
+    assert load_thread("test") is load_thread("test")
+
+
+def test_load_thread_cache_size(monkeypatch):
+    """
+    Test that only the most recently used threads are kept, and that
+    clearing the cache forgets every thread.
+
+    Args:
+        monkeypatch: Fixture provided by pytest to shrink the cache.
+    """
+    monkeypatch.setattr(sentiment_analysis, 'THREAD_CACHE_SIZE', 2)
+    clear_thread_cache()
+    first = load_thread("test")
+    retail = load_thread("TalesFromRetail")
+    assert load_thread("test") is first
+    load_thread("AskReddit")
+    assert load_thread("test") is first and \
+        load_thread("TalesFromRetail") is not retail
+    clear_thread_cache()
+    assert load_thread("test") is not first
@@ -0,0 +1,159 @@
+"""
+Unit tests for storage.py
+"""
+import os.path
+import pytest
+import pandas as pd
+
+import storage
+from storage import (
+    ANALYSIS_COLUMNS,
+    read_comments,
+    iter_comments,
+    write_comments,
+    CommentWriter,
+    cleaned_path,
+    load_cleaned,
+    save_cleaned
+)
+
+# Create testing DataFrame.
+test_comment_df = pd.DataFrame.from_dict({
+    'comment_id': ["1", "2a", "2b", "3a"],
+    'comment_parent_id': ["t3_post", "t1_1", "t1_1", "t1_2a"],
+    'comment_body': ["First,\nwith a new line", "Second", "", "Fourth"],
+    'comment_link_id': ["t3_post"] * 4,
+    'tokenized_comment': ["first\\with a new line", "second", None,
+                          "fourth"],
+    'sentiment': [0.5, 0.0, 0.0, -0.25]
+})
+
+# Define sets of test cases.
+
+get_formats = [
+    # Check that comments round trip through CSV.
+    "csv",
+    # Check that comments round trip through Parquet.
+    "parquet"
+]
+
+get_read_comments_cases = [
+    # Check that every column is read by default.
+    (None, list(test_comment_df.columns)),
+    # Check that only the requested columns are read, skipping missing ones.
+    (ANALYSIS_COLUMNS + ['not a column'], ANALYSIS_COLUMNS)
+]
+
+
+def _path(tmp_path, fmt):
+    """
+    Find the path of a test data file and skip formats that can't be written.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        fmt: String representing the storage format.
+
+    Returns:
+        A string representing the path of the test file.
+    """
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    return str(tmp_path / ('comments.' + fmt))
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("fmt", get_formats)
+@pytest.mark.parametrize("columns, expected_columns", get_read_comments_cases)
+def test_read_comments(tmp_path, fmt, columns, expected_columns):
+    """
+    Test that comments are read back with the requested columns, the same
+    values, and categorical ids.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        fmt: String representing the storage format.
+        columns: List of strings representing the columns to read.
+        expected_columns: List of strings representing the columns expected
+            in the result.
+    """
+    path = _path(tmp_path, fmt)
+    write_comments(test_comment_df, path)
+    comment_df = read_comments(path, columns)
+    assert list(comment_df.columns) == expected_columns and \
+        comment_df['comment_id'].tolist() == \
+        test_comment_df['comment_id'].tolist() and \
+        comment_df['sentiment'].tolist() == \
+        test_comment_df['sentiment'].tolist() and \
+        isinstance(comment_df['comment_parent_id'].dtype, pd.CategoricalDtype)
+
+
+@pytest.mark.parametrize("fmt", get_formats)
+def test_comment_writer(tmp_path, fmt):
+    """
+    Test that batches are written in order and read back in chunks.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        fmt: String representing the storage format.
+    """
+    path = _path(tmp_path, fmt)
+    with CommentWriter(path) as writer:
+        writer.write(test_comment_df[:3])
+        writer.write(test_comment_df[3:])
+    chunks = list(iter_comments(path, 3, ['comment_id', 'comment_body']))
+    assert writer.rows_written == 4 and [len(chunk) for chunk in chunks] == \
+        [3, 1] and pd.concat(chunks)['comment_body'].fillna('').tolist() == \
+        test_comment_df['comment_body'].tolist()
+
+
+def test_read_legacy_csv(tmp_path):
+    """
+    Test that saved indexes in older CSV files are not read as columns.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+    """
+    path = str(tmp_path / 'comments.csv')
+    test_comment_df.to_csv(path)
+    assert list(read_comments(path).columns) == list(test_comment_df.columns)
+
+
+def test_switch_format(tmp_path, monkeypatch):
+    """
+    Test that saving in another format removes the file in the old format,
+    so the new file is the one found and read.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    save_cleaned(test_comment_df, 'test', 'csv')
+    csv_path = cleaned_path('test')
+    save_cleaned(test_comment_df[:2], 'test', 'parquet')
+    assert cleaned_path('test') == cleaned_path('test', 'parquet') and \
+        not os.path.isfile(csv_path) and len(load_cleaned('test')) == 2
+
+
+def test_failed_write_keeps_other_format(tmp_path, monkeypatch):
+    """
+    Test that a write that fails part way through does not delete the file
+    saved in another format.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    save_cleaned(test_comment_df, 'test', 'parquet')
+    with pytest.raises(RuntimeError):
+        with CommentWriter(cleaned_path('test', 'csv')) as writer:
+            writer.write(test_comment_df[:2])
+            raise RuntimeError('Cleaning failed')
+    assert os.path.isfile(cleaned_path('test', 'parquet'))
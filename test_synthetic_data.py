@@ -0,0 +1,128 @@
+"""
+Unit tests for synthetic_data.py
+"""
+import pytest
+import pandas as pd
+
+from comment_forest import CommentForest
+from data_cleaning import clean_comment
+from synthetic_data import (
+    CLEANED_COLUMNS,
+    RAW_COLUMNS,
+    iter_synthetic_comments,
+    synthetic_comments,
+    write_synthetic_subreddit
+)
+import storage
+
+# Define sets of test cases.
+
+get_synthetic_comments_cases = [
+    # Check a small forest with the default shape.
+    (1000, {}),
+    # Check a shallow, bushy forest.
+    (5000, {'max_depth': 2, 'branching': 8.0}),
+    # Check a deep chain-like forest with uneven fan-out.
+    (3000, {'max_depth': 50, 'branching': 1.2, 'fanout_skew': 4.0}),
+    # Check a forest whose replies thin out with depth.
+    (2000, {'depth_decay': 0.5, 'branching': 6.0}),
+    # Check that an empty forest can be generated.
+    (0, {})
+]
+
+
+def _max_fanout(comment_df):
+    """
+    Find the largest number of replies to any comment.
+
+    Args:
+        comment_df: DataFrame of comments.
+
+    Returns:
+        An integer representing the most replies to a single comment.
+    """
+    replies = comment_df['comment_parent_id']
+    return int(replies[replies.str.startswith('t1_')].value_counts().max())
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("size, options", get_synthetic_comments_cases)
+def test_synthetic_comments(size, options):
+    """
+    Test that a forest of the requested size and depth is generated, with
+    unique ids and every reply's parent in the forest.
+
+    Args:
+        size: Integer representing the number of comments.
+        options: Dictionary of keyword arguments for the generator.
+    """
+    comment_df = synthetic_comments(size, **options)
+    forest = CommentForest.from_dataframe(comment_df)
+    assert len(comment_df) == size and \
+        list(comment_df.columns) == RAW_COLUMNS and \
+        comment_df['comment_id'].is_unique and \
+        len(forest.depths) == size and \
+        max(forest.depths.values(), default=0) <= \
+        options.get('max_depth', 10)
+
+
+def test_synthetic_comments_seed():
+    """
+    Test that the same seed generates the same comments in any chunk size,
+    and a different seed generates different comments.
+    """
+    whole = synthetic_comments(2000, seed=1)
+    chunks = list(iter_synthetic_comments(2000, rows_per_chunk=300, seed=1))
+    assert whole.equals(pd.concat(chunks, ignore_index=True)) and \
+        [len(chunk) for chunk in chunks] == [300] * 6 + [200] and \
+        not whole.equals(synthetic_comments(2000, seed=2))
+
+
+def test_synthetic_comments_shape():
+    """
+    Test that fan-out skew concentrates replies and depth decay makes deep
+    replies rarer.
+    """
+    even = synthetic_comments(5000, branching=3.0)
+    skewed = synthetic_comments(5000, branching=3.0, fanout_skew=5.0)
+    decayed = synthetic_comments(5000, branching=3.0, depth_decay=0.5)
+
+    def mean_depth(comment_df):
+        depths = CommentForest.from_dataframe(comment_df).depths
+        return sum(depths.values()) / len(depths)
+    assert _max_fanout(skewed) > _max_fanout(even) and \
+        mean_depth(decayed) < mean_depth(even)
+
+
+def test_synthetic_comments_cleaned():
+    """
+    Test that the cleaned text matches cleaning the generated bodies.
+    """
+    comment_df = synthetic_comments(50, cleaned=True, words=20)
+    assert list(comment_df.columns) == CLEANED_COLUMNS and \
+        comment_df['tokenized_comment'].tolist() == \
+        [clean_comment(body) for body in comment_df['comment_body']] and \
+        comment_df['sentiment'].between(-1, 1).all()
+
+
+def test_write_synthetic_subreddit(tmp_path, monkeypatch):
+    """
+    Test that raw and cleaned files are streamed to the data directories.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/raw_')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    written = write_synthetic_subreddit('synthetic', 2500, cleaned=True,
+                                        rows_per_chunk=1000)
+    raw_df = storage.load_raw('synthetic')
+    cleaned_df = storage.load_cleaned('synthetic')
+    assert written == 2500 and list(raw_df.columns) == RAW_COLUMNS and \
+        list(cleaned_df.columns) == CLEANED_COLUMNS and \
+        raw_df['comment_id'].tolist() == cleaned_df['comment_id'].tolist() \
+        == synthetic_comments(2500)['comment_id'].tolist()
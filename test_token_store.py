@@ -0,0 +1,150 @@
+"""
+Unit tests for token_store.py
+"""
+import os.path
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_cleaning
+from sentiment_analysis import analyze_sentiments, \
+    analyze_subreddit_by_depth
+import storage
+from token_store import (
+    TokenizedCorpus,
+    index_dtype,
+    corpus_directory,
+    load_corpus,
+    load_tokens,
+    store_token_ids
+)
+
+# Create testing comments.
+test_tokenized_comments = ["first\\with a new line", "", np.nan,
+                           "good  day\\\\bad day", "first"]
+
+# Define sets of test cases.
+
+get_index_dtype_cases = [
+    # Check that small vocabularies use two bytes per token.
+    (65535, np.uint16),
+    # Check that larger vocabularies use four bytes per token.
+    (65536, np.int32),
+    # Check that the largest offsets use eight bytes.
+    (2 ** 31, np.int64)
+]
+
+
+# Define standard testing functions to check functions' outputs given certain
+# inputs defined above.
+
+@pytest.mark.parametrize("largest, expected_dtype", get_index_dtype_cases)
+def test_index_dtype(largest, expected_dtype):
+    """
+    Test that the smallest integer type holding a value is chosen.
+
+    Args:
+        largest: Integer representing the largest value to store.
+        expected_dtype: NumPy data type expected.
+    """
+    assert index_dtype(largest) == expected_dtype
+
+
+def test_tokenized_corpus():
+    """
+    Test that cleaned comments are stored as token ids and rebuilt exactly,
+    keeping empty comments apart from invalid ones.
+    """
+    corpus = TokenizedCorpus.from_comments(test_tokenized_comments)
+    rebuilt = corpus.to_comments()
+    assert len(corpus) == 5 and corpus.sentence_count == 7 and \
+        corpus.vocabulary[:5] == ['first', 'with', 'a', 'new', 'line'] and \
+        corpus.tokens.dtype == np.uint16 and \
+        corpus.comment_offsets.tolist() == [0, 2, 3, 3, 6, 7] and \
+        rebuilt[:2] + rebuilt[3:] == test_tokenized_comments[:2] + \
+        test_tokenized_comments[3:] and pd.isna(rebuilt[2])
+
+
+def test_tokenized_corpus_scores():
+    """
+    Test that a corpus of the bundled cleaned data scores the same as its
+    text.
+    """
+    tokenized = storage.load_cleaned('AskReddit')['tokenized_comment']
+    corpus = TokenizedCorpus.from_comments(tokenized)
+    expected = analyze_sentiments(tokenized)
+    assert analyze_sentiments(corpus).tolist() == expected.tolist() and \
+        analyze_sentiments(corpus, scorer='vader').tolist() == \
+        expected.tolist()
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load(tmp_path, mmap):
+    """
+    Test that a saved corpus is loaded back, memory mapped or not.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        mmap: Boolean representing whether to memory map the arrays.
+    """
+    corpus = TokenizedCorpus.from_comments(test_tokenized_comments)
+    corpus.save(str(tmp_path / 'tokens'))
+    loaded = TokenizedCorpus.load(str(tmp_path / 'tokens'), mmap)
+    assert isinstance(loaded.tokens, np.memmap) == mmap and \
+        loaded.vocabulary == corpus.vocabulary and \
+        loaded.tokens.tolist() == corpus.tokens.tolist() and \
+        loaded.sentences() == corpus.sentences()
+
+
+def test_store_token_ids(tmp_path, monkeypatch):
+    """
+    Test that token ids are stored next to a cleaned data file, replace its
+    text when asked, are reused when cleaning again, and are ignored once
+    the file changes.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    raw_df = storage.load_raw('AskReddit').head(50)
+    monkeypatch.setattr(storage, 'RAW_DIRECTORY', str(tmp_path) + '/raw_')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    storage.save_raw(raw_df, 'test')
+    data_cleaning.store_tokenized_data(['test'])
+    cleaned_df = storage.load_cleaned('test')
+
+    corpus = store_token_ids(['test'], drop_text=True)['test']
+    path = storage.cleaned_path('test')
+    compact_df = storage.load_cleaned('test')
+    assert 'tokenized_comment' not in compact_df.columns and \
+        os.path.isdir(corpus_directory(path)) and \
+        load_tokens('test').to_comments() == corpus.to_comments() and \
+        pd.Series(corpus.to_comments(), dtype='string',
+                  name='tokenized_comment').equals(
+            cleaned_df['tokenized_comment'])
+
+    stale = data_cleaning.reuse_cleaned_comments(raw_df.copy(), path)
+    data_cleaning.store_tokenized_data(['test'])
+    assert not stale.any() and load_corpus(path) is None and \
+        storage.load_cleaned('test').equals(cleaned_df)
+
+
+def test_analyze_dropped_text(tmp_path, monkeypatch):
+    """
+    Test that a subreddit whose text was dropped is analyzed from its token
+    ids, the same as from its text.
+
+    Args:
+        tmp_path: Temporary directory provided by pytest.
+        monkeypatch: Fixture provided by pytest to redirect the data
+            directories.
+    """
+    cleaned_df = storage.load_cleaned('TalesFromRetail')
+    monkeypatch.setattr(storage, 'CLEANED_DIRECTORY', str(tmp_path) + '/')
+    storage.save_cleaned(cleaned_df, 'test')
+    expected = analyze_subreddit_by_depth('test')
+    store_token_ids(['test'], drop_text=True)
+    assert not {'tokenized_comment', 'sentiment'} & \
+        set(storage.load_cleaned('test').columns) and \
+        analyze_subreddit_by_depth('test') == expected
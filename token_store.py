@@ -0,0 +1,371 @@
+"""
+Store cleaned comments as arrays of token ids.
+
+A corpus keeps each distinct word once, in its vocabulary, and every comment
+as integer ids into it. Sentences are slices of the token array and comments
+are slices of the sentence array, so the whole corpus is four arrays. They
+are saved as .npy files next to a subreddit's cleaned data file and can be
+memory mapped, so loading a corpus does not parse any text. For example, to
+write the token ids of two subreddits and drop the text from their cleaned
+files:
+
+    $ python token_store.py AmItheAsshole aww --drop-text
+"""
+import argparse
+import json
+import os
+import numpy as np
+import storage
+
+# Version of the files written by TokenizedCorpus.save.
+STORE_VERSION = 1
+
+# Files of a saved corpus. The source file is written last, so a corpus whose
+# source file is missing was not saved completely.
+VOCABULARY_FILE = 'vocabulary.json'
+ARRAY_FILES = ['tokens', 'sentence_offsets', 'comment_offsets']
+SOURCE_FILE = 'source.json'
+
+
+def index_dtype(largest):
+    """
+    Choose the smallest integer type for token ids or offsets.
+
+    Args:
+        largest: Integer representing the largest value to store.
+
+    Returns:
+        A NumPy data type, uint16 for values up to 65535, then int32 and
+        int64.
+    """
+    for dtype in [np.uint16, np.int32]:
+        if largest <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class TokenizedCorpus:
+    """
+    Cleaned comments stored as token ids into a shared vocabulary.
+
+    Tokens are the space separated words of each sentence, so every cleaned
+    comment is rebuilt exactly, and comments without any sentences (NaN)
+    are told apart from empty ones.
+
+    Attributes:
+        vocabulary: List of strings representing each distinct word, indexed
+            by token id.
+        tokens: NumPy integer array of the token ids of every sentence, one
+            after another. Ids are stored as uint16 while the vocabulary
+            fits, and in wider types above that.
+        sentence_offsets: NumPy integer array of one more than the number of
+            sentences. Sentence i is tokens[sentence_offsets[i]:
+            sentence_offsets[i + 1]].
+        comment_offsets: NumPy integer array of one more than the number of
+            comments. Comment i is made of the sentences from
+            comment_offsets[i] up to comment_offsets[i + 1].
+    """
+
+    def __init__(self, vocabulary, tokens, sentence_offsets, comment_offsets):
+        """
+        Create a corpus from its arrays.
+
+        Args:
+            vocabulary: List of strings representing each distinct word.
+            tokens: Array of integers representing every token id.
+            sentence_offsets: Array of integers representing where each
+                sentence starts in tokens, followed by the number of tokens.
+            comment_offsets: Array of integers representing where each
+                comment starts in the sentences, followed by the number of
+                sentences.
+        """
+        self.vocabulary = list(vocabulary)
+        self.tokens = tokens
+        self.sentence_offsets = sentence_offsets
+        self.comment_offsets = comment_offsets
+
+    @classmethod
+    def from_comments(cls, tokenized_comments):
+        """
+        Build a corpus from cleaned comments.
+
+        Args:
+            tokenized_comments: An iterable or Series of comments, each either
+                a string with sentences separated by backslashes or a list
+                of sentence strings. Invalid comments (NaN) have no
+                sentences.
+
+        Returns:
+            A TokenizedCorpus of the comments, in input order.
+        """
+        token_ids = {}
+        tokens = []
+        sentence_offsets = [0]
+        comment_offsets = [0]
+        for comment in tokenized_comments:
+            if isinstance(comment, str):
+                sentences = comment.split('\\')
+            elif isinstance(comment, (list, tuple)):
+                sentences = comment
+            else:
+                sentences = []
+            for sentence in sentences:
+                tokens.extend([token_ids.setdefault(word, len(token_ids))
+                               for word in sentence.split(' ')])
+                sentence_offsets.append(len(tokens))
+            comment_offsets.append(len(sentence_offsets) - 1)
+        return cls(list(token_ids),
+                   np.array(tokens, dtype=index_dtype(len(token_ids))),
+                   np.array(sentence_offsets,
+                            dtype=index_dtype(sentence_offsets[-1])),
+                   np.array(comment_offsets,
+                            dtype=index_dtype(comment_offsets[-1])))
+
+    def __len__(self):
+        return len(self.comment_offsets) - 1
+
+    def __iter__(self):
+        """
+        Yield the sentences of each comment, as analyze_sentiments accepts.
+        """
+        sentences = self.sentences()
+        offsets = self.comment_offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield sentences[start:end]
+
+    @property
+    def sentence_count(self):
+        """
+        Integer representing the number of sentences in the corpus.
+        """
+        return len(self.sentence_offsets) - 1
+
+    @property
+    def nbytes(self):
+        """
+        Integer representing the number of bytes used by the token and
+        offset arrays.
+        """
+        return self.tokens.nbytes + self.sentence_offsets.nbytes + \
+            self.comment_offsets.nbytes
+
+    def sentence(self, index):
+        """
+        Rebuild the text of one sentence.
+
+        Args:
+            index: Integer representing the position of the sentence in the
+                corpus.
+
+        Returns:
+            A string of the sentence's words separated by spaces.
+        """
+        start, end = self.sentence_offsets[index:index + 2].tolist()
+        return ' '.join([self.vocabulary[token] for token in
+                         self.tokens[start:end].tolist()])
+
+    def sentences(self):
+        """
+        Rebuild the text of every sentence.
+
+        Returns:
+            A list of strings representing each sentence in the corpus.
+        """
+        vocabulary = self.vocabulary
+        tokens = self.tokens.tolist()
+        offsets = self.sentence_offsets.tolist()
+        return [' '.join([vocabulary[token] for token in tokens[start:end]])
+                for start, end in zip(offsets, offsets[1:])]
+
+    def to_comments(self):
+        """
+        Rebuild the cleaned text of every comment.
+
+        Returns:
+            A list with a string of backslash separated sentences for each
+            comment, or NaN for comments without sentences.
+        """
+        return ['\\'.join(sentences) if sentences else np.nan
+                for sentences in self]
+
+    def save(self, directory, source=None):
+        """
+        Write the corpus as .npy files in a directory.
+
+        Args:
+            directory: String representing the directory to write to. It is
+                created if it does not exist.
+            source: Optional string representing the path of the cleaned
+                data file the corpus was built from. Its size and
+                modification time are recorded, so load_corpus can tell
+                when the file has changed since.
+        """
+        os.makedirs(directory, exist_ok=True)
+        source_path = os.path.join(directory, SOURCE_FILE)
+        if os.path.exists(source_path):
+            os.remove(source_path)
+        with open(os.path.join(directory, VOCABULARY_FILE), 'w',
+                  encoding='utf-8') as vocabulary_file:
+            json.dump(self.vocabulary, vocabulary_file, ensure_ascii=False)
+        for name, array in zip(ARRAY_FILES, [self.tokens,
+                                             self.sentence_offsets,
+                                             self.comment_offsets]):
+            np.save(os.path.join(directory, name + '.npy'), array)
+        temporary_path = source_path + '.tmp'
+        with open(temporary_path, 'w') as source_file:
+            json.dump({'version': STORE_VERSION,
+                       'source': storage.file_version(source) if source
+                       else None,
+                       'comments': len(self)}, source_file)
+        os.replace(temporary_path, source_path)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Read a corpus written by save.
+
+        Args:
+            directory: String representing the directory of the corpus.
+            mmap: Boolean representing whether to memory map the token
+                arrays instead of reading them into memory.
+
+        Returns:
+            A TokenizedCorpus.
+        """
+        with open(os.path.join(directory, VOCABULARY_FILE),
+                  encoding='utf-8') as vocabulary_file:
+            vocabulary = json.load(vocabulary_file)
+        return cls(vocabulary, *[
+            np.load(os.path.join(directory, name + '.npy'),
+                    mmap_mode='r' if mmap else None, allow_pickle=False)
+            for name in ARRAY_FILES])
+
+
+def corpus_directory(cleaned_path):
+    """
+    Find the directory of the token ids stored for a cleaned data file.
+
+    Args:
+        cleaned_path: String representing the path of a cleaned data file.
+
+    Returns:
+        A string representing the path of the corpus directory.
+    """
+    return os.path.splitext(str(cleaned_path))[0] + '_tokens'
+
+
+def load_corpus(cleaned_path, mmap=True):
+    """
+    Read the token ids stored for a cleaned data file, if they are current.
+
+    Args:
+        cleaned_path: String representing the path of a cleaned data file.
+        mmap: Boolean representing whether to memory map the token arrays.
+
+    Returns:
+        A TokenizedCorpus with a comment for each row of the cleaned data
+        file, or None if no corpus was stored or the file has changed since.
+    """
+    directory = corpus_directory(cleaned_path)
+    try:
+        with open(os.path.join(directory, SOURCE_FILE)) as source_file:
+            source = json.load(source_file)
+    except FileNotFoundError:
+        return None
+    if source['version'] != STORE_VERSION or \
+            not os.path.isfile(cleaned_path) or \
+            source['source'] != storage.file_version(cleaned_path):
+        return None
+    return TokenizedCorpus.load(directory, mmap)
+
+
+def load_tokens(subreddit, mmap=True):
+    """
+    Read the token ids stored for a subreddit's cleaned data.
+
+    Args:
+        subreddit: String representing the name of the subreddit.
+        mmap: Boolean representing whether to memory map the token arrays.
+
+    Returns:
+        A TokenizedCorpus, or None if the subreddit's token ids are missing
+        or out of date.
+    """
+    return load_corpus(storage.cleaned_path(subreddit), mmap)
+
+
+def read_tokenized_comments(cleaned_path):
+    """
+    Read the cleaned text of a data file, from its own column or its token
+    ids.
+
+    Args:
+        cleaned_path: String representing the path of a cleaned data file.
+
+    Returns:
+        A NumPy object array of the cleaned text of each row, with NaN for
+        comments without sentences, or None if the file has no text column
+        and no current token ids.
+    """
+    comment_df = storage.read_comments(cleaned_path, ['tokenized_comment'])
+    if 'tokenized_comment' in comment_df.columns:
+        return comment_df['tokenized_comment'].to_numpy(dtype=object,
+                                                        na_value=np.nan)
+    corpus = load_corpus(cleaned_path)
+    if corpus is None:
+        return None
+    return np.array(corpus.to_comments(), dtype=object)
+
+
+def store_token_ids(subreddit_list, drop_text=False):
+    """
+    Write the token ids of each subreddit's cleaned comments.
+
+    Args:
+        subreddit_list: List of strings representing subreddits whose cleaned
+            data files to convert.
+        drop_text: Boolean representing whether to remove the
+            tokenized_comment column from each cleaned data file once its
+            token ids are written. The text can be rebuilt with
+            TokenizedCorpus.to_comments.
+
+    Returns:
+        A dictionary mapping each subreddit to its TokenizedCorpus.
+    """
+    corpora = {}
+    for subreddit in subreddit_list:
+        path = storage.cleaned_path(subreddit)
+        tokenized = read_tokenized_comments(path)
+        if tokenized is None:
+            raise ValueError(f'{path} has no cleaned text to convert.')
+        corpus = TokenizedCorpus.from_comments(tokenized)
+        if drop_text:
+            comment_df = storage.read_comments(path)
+            if 'tokenized_comment' in comment_df.columns:
+                storage.write_comments(
+                    comment_df.drop(columns='tokenized_comment'), path)
+        corpus.save(corpus_directory(path), path)
+        corpora[subreddit] = corpus
+    return corpora
+
+
+def main(argv=None):
+    """
+    Write the token ids of subreddits from the command line.
+
+    Args:
+        argv: Optional list of strings representing command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('subreddits', nargs='+')
+    parser.add_argument('--drop-text', action='store_true',
+                        help='remove the text column from the cleaned files')
+    args = parser.parse_args(argv)
+    for subreddit, corpus in store_token_ids(args.subreddits,
+                                             args.drop_text).items():
+        print(f'{subreddit}: {len(corpus)} comments, '
+              f'{len(corpus.vocabulary)} distinct words')
+
+
+if __name__ == '__main__':
+    main()